@@ -0,0 +1,298 @@
+# Local stand-in for the TCGdex and JustTCG APIs, serving fixtures with configurable
+# latency, jitter and error injection. TCGdex is served under /tcgdex/v2/<language>/...,
+# JustTCG under /justtcg/v1/..., call counts under /_stats (POST /_reset clears them).
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Union
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+import fixtures as fixture_files
+
+# TCGdex reference list endpoints served from the "lists" fixtures
+TCGDEX_LISTS = ("types", "rarities", "trainer-types", "energy-types", "stages",
+                "regulation-marks", "categories", "illustrators")
+
+
+class Upstream:
+    """ The fixtures and the fault injection settings shared by the request handlers. """
+
+    def __init__(self, fixtures: dict, latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, throttle_rate: float = 0.0, retry_after: float = 0.5, seed: int = 0):
+        """
+        Args:
+            fixtures (dict): The fixtures, see fixtures.py.
+            latency (float, optional): Seconds added to every response. Default is 0.
+            jitter (float, optional): Maximum random seconds added on top of the latency. Default is 0.
+            error_rate (float, optional): Share of the calls answered with a 503. Default is 0.
+            throttle_rate (float, optional): Share of the calls answered with a 429. Default is 0.
+            retry_after (float, optional): Retry-After of the 429 responses in seconds. Default is 0.5.
+            seed (int, optional): Seed of the injected faults. Default is 0.
+        """
+        self.fixtures = fixtures
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.calls: Counter = Counter()
+        self.lock = threading.Lock()
+        cards = fixtures["justtcg"]["cards"]
+        self.justtcg_index = {
+            "cardId": {card["id"]: card for card in cards},
+            "tcgplayerId": {str(card.get("tcgplayerId")): card for card in cards},
+            "variantId": {variant["id"]: card for card in cards for variant in card.get("variants") or []},
+        }
+
+    def fault(self) -> Union[int, None]:
+        """ Draws the injected fault of a call: 503, 429 or None. """
+        with self.lock:
+            draw = self.random.random()
+        if draw < self.error_rate:
+            return 503
+        if draw < self.error_rate + self.throttle_rate:
+            return 429
+        return None
+
+    def count(self, key: str) -> None:
+        with self.lock:
+            self.calls[key] += 1
+
+    def stats(self) -> dict:
+        """ Returns the number of calls per provider and per route. """
+        with self.lock:
+            calls = dict(self.calls)
+        totals = Counter()
+        for key, count in calls.items():
+            totals[key.split(" ")[0]] += count
+        return {"total": dict(totals), "routes": calls}
+
+
+def _field(card: dict, field: str) -> list:
+    """ Returns the values of a dotted field of a card. """
+    value: Any = card
+    for part in field.split("."):
+        value = value.get(part) if isinstance(value, dict) else None
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _matches(card: dict, field: str, expression: str) -> bool:
+    """ Evaluates a TCGdex filter (eq:, neq:, gte:, ..., or a plain substring) on a card. """
+    op, _, value = expression.partition(":") if ":" in expression else ("like", "", expression)
+    values = _field(card, field)
+    if op == "null":
+        return not values
+    if op == "notnull":
+        return bool(values)
+    if op in ("gte", "lte", "gt", "lt"):
+        try:
+            numbers = [float(v) for v in values]
+            limit = float(value)
+        except ValueError:
+            return False
+        check = {"gte": float.__ge__, "lte": float.__le__, "gt": float.__gt__, "lt": float.__lt__}[op]
+        return any(check(v, limit) for v in numbers)
+    text = [str(v).casefold() for v in values]
+    value = value.casefold()
+    if op == "eq":
+        return value in text
+    if op == "neq":
+        return value not in text
+    if op == "not":
+        return not any(value in v for v in text)
+    return any(value in v for v in text)
+
+
+class Handler(BaseHTTPRequestHandler):
+    """ Routes the calls to the TCGdex or JustTCG fixtures. """
+
+    upstream: Upstream
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+    def send_json(self, status: int, body: Any, headers: dict = None) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        self.handle_call("GET")
+
+    def do_POST(self) -> None:
+        self.handle_call("POST")
+
+    def handle_call(self, method: str) -> None:
+        url = urlsplit(self.path)
+        parts = [unquote(part) for part in url.path.strip("/").split("/")]
+        params = dict(parse_qsl(url.query, keep_blank_values=True))
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+
+        if parts[0] == "_stats":
+            return self.send_json(200, self.upstream.stats())
+        if parts[0] == "_reset":
+            with self.upstream.lock:
+                self.upstream.calls.clear()
+            return self.send_json(200, {})
+        if parts[0] not in ("tcgdex", "justtcg"):
+            return self.send_json(404, {"error": "unknown provider"})
+
+        provider = parts[0]
+        route = parts[3] if provider == "tcgdex" and len(parts) > 3 else (parts[2] if len(parts) > 2 else "")
+        self.upstream.count(f"{provider} {method} {route}{'/:id' if provider == 'tcgdex' and len(parts) > 4 else ''}")
+
+        delay = self.upstream.latency + self.upstream.random.random() * self.upstream.jitter
+        if delay:
+            time.sleep(delay)
+        fault = self.upstream.fault()
+        if fault == 429:
+            return self.send_json(429, {"error": "rate limited"}, {"Retry-After": str(self.upstream.retry_after)})
+        if fault == 503:
+            return self.send_json(503, {"error": "injected failure"})
+
+        if provider == "tcgdex":
+            status, result = self.tcgdex(parts[3:], params)
+        else:
+            status, result = self.justtcg(method, parts[2:], params, body)
+        self.send_json(status, result)
+
+    def tcgdex(self, parts: list[str], params: dict) -> tuple[int, Any]:
+        """ Answers /v2/<language>/<endpoint>[/<id>]. """
+        data = self.upstream.fixtures["tcgdex"]
+        endpoint, id = parts[0] if parts else "", parts[1] if len(parts) > 1 else None
+        if endpoint in TCGDEX_LISTS and id is None:
+            return 200, data["lists"].get(endpoint, [])
+        if endpoint == "series":
+            if id is None:
+                return 200, [{"id": serie["id"], "name": serie["name"], "logo": serie.get("logo")} for serie in data["series"]]
+            serie = next((serie for serie in data["series"] if serie["id"] == id), None)
+            return (200, serie) if serie else (404, {"error": "not found"})
+        if endpoint == "sets":
+            if id is None:
+                return 200, [{k: set[k] for k in ("id", "name", "logo", "symbol", "cardCount")} for set in data["sets"].values()
+                             if all(_matches(set, key, value) for key, value in params.items())]
+            return (200, data["sets"][id]) if id in data["sets"] else (404, {"error": "not found"})
+        if endpoint == "cards":
+            if id is not None:
+                return (200, data["cards"][id]) if id in data["cards"] else (404, {"error": "not found"})
+            page = int(params.pop("pagination:page", 1))
+            per_page = int(params.pop("pagination:itemsPerPage", 0))
+            field, order = params.pop("sort:field", None), params.pop("sort:order", "asc")
+            cards = [card for card in data["cards"].values()
+                     if all(_matches(card, key, value) for key, value in params.items())]
+            if field:
+                cards.sort(key=lambda card: str((_field(card, field) or [""])[0]), reverse=order == "desc")
+            if per_page:
+                cards = cards[(page - 1) * per_page:page * per_page]
+            return 200, [{k: card.get(k) for k in ("id", "localId", "name", "image")} for card in cards]
+        return 404, {"error": "unknown endpoint"}
+
+    def justtcg(self, method: str, parts: list[str], params: dict, body: Any) -> tuple[int, Any]:
+        """ Answers /v1/games, /v1/sets and /v1/cards (GET search or lookup, POST batch lookup). """
+        data = self.upstream.fixtures["justtcg"]
+        endpoint = parts[0] if parts else ""
+        if endpoint == "games":
+            return 200, {"data": data["games"]}
+        if endpoint == "sets":
+            return 200, {"data": [set for set in data["sets"] if set.get("game_id") == params.get("game", set.get("game_id"))]}
+        if endpoint != "cards":
+            return 404, {"error": "unknown endpoint"}
+        if method == "POST":
+            return 200, {"data": [card for query in body or [] if (card := self.lookup(query)) is not None]}
+
+        lookup = self.lookup(params)
+        if lookup is not None or any(key in params for key in self.upstream.justtcg_index):
+            return 200, {"data": [lookup] if lookup else [], "meta": {"total": int(lookup is not None)}}
+        cards = [card for card in data["cards"]
+                 if params.get("set", card["set"]) == card["set"]
+                 and params.get("q", "").casefold() in card["name"].casefold()]
+        if params.get("order_by") == "price":
+            cards.sort(key=lambda card: max((v["price"] for v in card["variants"]), default=0),
+                       reverse=params.get("order_direction") == "desc")
+        offset, limit = int(params.get("offset", 0)), int(params.get("limit", 20))
+        page = [self.with_condition(card, params.get("condition")) for card in cards[offset:offset + limit]]
+        return 200, {"data": page, "meta": {"total": len(cards), "limit": limit, "offset": offset,
+                                            "hasMore": offset + limit < len(cards)}}
+
+    def lookup(self, query: dict) -> Union[dict, None]:
+        """ Finds the card of an identifier query. """
+        for key in ("variantId", "tcgplayerId", "cardId"):
+            if query.get(key):
+                card = self.upstream.justtcg_index[key].get(str(query[key]))
+                if card is not None and key == "variantId":
+                    card = card | {"variants": [v for v in card["variants"] if v["id"] == query[key]]}
+                return self.with_condition(card, query.get("condition")) if card else None
+        return None
+
+    @staticmethod
+    def with_condition(card: dict, condition: Union[str, None]) -> dict:
+        """ Keeps only the variants of a condition (full name or abbreviation). """
+        if not condition:
+            return card
+        names = {"S": "Sealed", "NM": "Near Mint", "LP": "Lightly Played", "MP": "Moderately Played",
+                 "HP": "Heavily Played", "D": "Damaged"}
+        condition = names.get(condition.upper(), condition).casefold()
+        return card | {"variants": [v for v in card["variants"] if v["condition"].casefold() == condition]}
+
+
+def serve(upstream: Upstream, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """
+    Starts the stand-in server in a background thread.
+
+    Args:
+        upstream (Upstream): The fixtures and fault settings.
+        host (str, optional): Interface to listen on. Default is 127.0.0.1.
+        port (int, optional): Port to listen on, 0 picks a free one. Default is 0.
+    Returns:
+        ThreadingHTTPServer: The running server, its port is server.server_address[1].
+    """
+    handler = type("BoundHandler", (Handler,), {"upstream": upstream})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve fixtures as stand-in TCGdex and JustTCG APIs.")
+    parser.add_argument("--fixtures", help="fixture file, generated fixtures are used when omitted")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    fixtures = fixture_files.load(args.fixtures) if args.fixtures else fixture_files.generate(seed=args.seed)
+    upstream = Upstream(fixtures, args.latency_ms / 1000, args.jitter_ms / 1000,
+                        args.error_rate, args.throttle_rate, args.retry_after, args.seed)
+    server = serve(upstream, args.host, args.port)
+    # the first output line tells the benchmark runner where to connect
+    print(server.server_address[1], flush=True)
+    try:
+        sys.stdin.read()
+    except KeyboardInterrupt:
+        pass
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
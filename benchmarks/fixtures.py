@@ -0,0 +1,193 @@
+# Fixtures served by the stand-in TCGdex and JustTCG servers of the benchmarks.
+#
+# A fixture file is a JSON object:
+#   {"tcgdex": {"series": [...], "sets": {id: set}, "cards": {id: card}, "lists": {endpoint: [...]}},
+#    "justtcg": {"games": [...], "sets": [...], "cards": [...]}}
+# It is either generated (`python fixtures.py generate`) or recorded from the live APIs
+# (`python fixtures.py record`).
+import argparse
+import json
+import os
+import random
+import time
+import urllib.request
+from typing import Any
+
+TCGDEX_URL = "https://api.tcgdex.net/v2"
+JUSTTCG_URL = "https://api.justtcg.com/v1"
+
+# endpoint of each reference list -> values of the generated fixtures
+LISTS = {
+    "types": ["Colorless", "Darkness", "Dragon", "Fairy", "Fighting", "Fire", "Grass", "Lightning", "Metal", "Psychic", "Water"],
+    "rarities": ["Common", "Uncommon", "Rare", "Rare Holo", "Double rare", "Illustration rare"],
+    "trainer-types": ["Item", "Supporter", "Stadium", "Tool"],
+    "energy-types": ["Normal", "Special"],
+    "stages": ["Basic", "Stage1", "Stage2", "VMAX", "VSTAR"],
+    "regulation-marks": ["D", "E", "F", "G", "H"],
+    "categories": ["Pokemon", "Trainer", "Energy"],
+    "illustrators": [f"Illustrator {i}" for i in range(40)],
+}
+
+NAMES = ["Bulbasaur", "Charmander", "Squirtle", "Pikachu", "Eevee", "Snorlax", "Gengar", "Dragonite",
+         "Mewtwo", "Lucario", "Gardevoir", "Greninja", "Rayquaza", "Garchomp", "Umbreon", "Sylveon"]
+CONDITIONS = ["Near Mint", "Lightly Played", "Moderately Played", "Heavily Played", "Damaged"]
+
+
+def generate(series: int = 2, sets: int = 4, cards_per_set: int = 60, seed: int = 0) -> dict:
+    """
+    Generates deterministic fixtures with the shape of the real API responses.
+
+    Args:
+        series (int, optional): Number of series. Default is 2.
+        sets (int, optional): Number of sets, spread over the series. Default is 4.
+        cards_per_set (int, optional): Number of cards per set. Default is 60.
+        seed (int, optional): Seed of the random values. Default is 0.
+    Returns:
+        dict: The fixtures.
+    """
+    rng = random.Random(seed)
+    now = int(time.time())
+    tcgdex = {"series": [], "sets": {}, "cards": {}, "lists": dict(LISTS)}
+    justtcg = {"games": [], "sets": [], "cards": []}
+
+    for s in range(series):
+        tcgdex["series"].append({"id": f"s{s}", "name": f"Serie {s}", "logo": None, "sets": []})
+    for index in range(sets):
+        set_id, set_name = f"set{index}", f"Benchmark Set {index}"
+        serie = tcgdex["series"][index % series]
+        resume = {"id": set_id, "name": set_name, "logo": None, "symbol": None,
+                  "cardCount": {"total": cards_per_set, "official": cards_per_set}}
+        serie["sets"].append(resume)
+        cards = []
+        for number in range(1, cards_per_set + 1):
+            name = f"{rng.choice(NAMES)} {number}"
+            card_id = f"{set_id}-{number}"
+            category = rng.choice(LISTS["categories"])
+            card = {
+                "id": card_id, "localId": str(number), "name": name, "image": None,
+                "illustrator": rng.choice(LISTS["illustrators"]), "rarity": rng.choice(LISTS["rarities"]),
+                "category": category, "set": resume,
+                "variants": {"normal": True, "reverse": rng.random() < 0.5, "holo": rng.random() < 0.3,
+                             "firstEdition": False, "wPromo": False},
+                "hp": rng.choice([60, 90, 120, 220]) if category == "Pokemon" else None,
+                "types": [rng.choice(LISTS["types"])] if category == "Pokemon" else None,
+                "stage": rng.choice(LISTS["stages"]) if category == "Pokemon" else None,
+                "trainerType": rng.choice(LISTS["trainer-types"]) if category == "Trainer" else None,
+                "energyType": rng.choice(LISTS["energy-types"]) if category == "Energy" else None,
+                "attacks": [{"name": "Tackle", "cost": ["Colorless"], "damage": 20, "effect": None}] if category == "Pokemon" else None,
+                "retreat": rng.randint(0, 3) if category == "Pokemon" else None,
+                "regulationMark": rng.choice(LISTS["regulation-marks"]),
+                "legal": {"standard": rng.random() < 0.5, "expanded": True},
+            }
+            tcgdex["cards"][card_id] = card
+            cards.append({"id": card_id, "localId": str(number), "name": name, "image": None})
+
+            variants = []
+            for condition in CONDITIONS[:3]:
+                price = round(rng.uniform(0.1, 50), 2)
+                history = [{"t": now - day * 86400, "p": round(price * rng.uniform(0.8, 1.2), 2)} for day in range(30, -1, -1)]
+                variants.append({
+                    "id": f"{card_id}-{condition.lower().replace(' ', '-')}", "printing": "Normal",
+                    "condition": condition, "price": price, "lastUpdated": now - rng.randint(0, 3600),
+                    "priceChange7d": round(rng.uniform(-20, 20), 2), "priceHistory": history,
+                    "priceHistory30d": history,
+                })
+            justtcg["cards"].append({
+                "id": f"pokemon-{set_id}-{name.lower().replace(' ', '-')}", "name": name, "game": "Pokemon",
+                "set": set_id, "number": str(number), "tcgplayerId": str(100000 + index * 1000 + number),
+                "rarity": card["rarity"], "variants": variants,
+            })
+        tcgdex["sets"][set_id] = resume | {"serie": {"id": serie["id"], "name": serie["name"]}, "tcgOnline": f"BS{index}",
+                                           "releaseDate": f"202{index % 10}-01-01",
+                                           "legal": {"standard": True, "expanded": True}, "cards": cards}
+        justtcg["sets"].append({"id": set_id, "name": set_name, "game_id": "pokemon", "game": "Pokemon",
+                                "cards_count": cards_per_set})
+    justtcg["games"].append({"id": "pokemon", "name": "Pokemon", "cards_count": len(justtcg["cards"]),
+                             "sets_count": sets})
+    return {"tcgdex": tcgdex, "justtcg": justtcg}
+
+
+def _get(url: str, headers: dict = None) -> Any:
+    """ Fetches a JSON document. """
+    request = urllib.request.Request(url, headers={"User-Agent": "pokemon-tcg-mcp-benchmarks", **(headers or {})})
+    with urllib.request.urlopen(request) as response:
+        return json.load(response)
+
+
+def record(set_ids: list[str], language: str = "en", justtcg_key: str = None) -> dict:
+    """
+    Records fixtures from the live APIs.
+
+    Args:
+        set_ids (list[str]): TCGdex ids of the sets (and their cards) to record.
+        language (str, optional): TCGdex language. Default is en.
+        justtcg_key (str, optional): JustTCG API key, the JustTCG fixtures are only recorded when given.
+    Returns:
+        dict: The fixtures.
+    """
+    base = f"{TCGDEX_URL}/{language}"
+    tcgdex = {"series": [], "sets": {}, "cards": {}, "lists": {}}
+    for endpoint in LISTS:
+        tcgdex["lists"][endpoint] = _get(f"{base}/{endpoint}")
+    for set_id in set_ids:
+        set = tcgdex["sets"][set_id] = _get(f"{base}/sets/{set_id}")
+        for card in set.get("cards") or []:
+            tcgdex["cards"][card["id"]] = _get(f"{base}/cards/{card['id']}")
+    for serie_id in sorted({set["serie"]["id"] for set in tcgdex["sets"].values()}):
+        tcgdex["series"].append(_get(f"{base}/series/{serie_id}"))
+
+    justtcg = {"games": [], "sets": [], "cards": []}
+    if justtcg_key:
+        headers = {"X-API-Key": justtcg_key}
+        justtcg["games"] = _get(f"{JUSTTCG_URL}/games", headers)["data"]
+        justtcg["sets"] = _get(f"{JUSTTCG_URL}/sets?game=pokemon", headers)["data"]
+        for set in tcgdex["sets"].values():
+            match = next((s for s in justtcg["sets"] if s["name"].lower() == set["name"].lower()), None)
+            offset = 0
+            while match is not None:
+                page = _get(f"{JUSTTCG_URL}/cards?game=pokemon&set={match['id']}&limit=20&offset={offset}", headers)["data"]
+                justtcg["cards"].extend(page)
+                offset += 20
+                if len(page) < 20:
+                    break
+    return {"tcgdex": tcgdex, "justtcg": justtcg}
+
+
+def load(path: str) -> dict:
+    """ Loads a fixture file. """
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save(fixtures: dict, path: str) -> None:
+    """ Writes a fixture file. """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(fixtures, f)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate or record the fixtures of the benchmarks.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    generate_parser = commands.add_parser("generate", help="generate deterministic fixtures")
+    generate_parser.add_argument("--series", type=int, default=2)
+    generate_parser.add_argument("--sets", type=int, default=4)
+    generate_parser.add_argument("--cards-per-set", type=int, default=60)
+    generate_parser.add_argument("--seed", type=int, default=0)
+    record_parser = commands.add_parser("record", help="record fixtures from the live APIs")
+    record_parser.add_argument("sets", nargs="+", help="TCGdex set ids to record")
+    record_parser.add_argument("--language", default="en")
+    for command in (generate_parser, record_parser):
+        command.add_argument("--output", required=True, help="fixture file to write")
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        fixtures = generate(args.series, args.sets, args.cards_per_set, args.seed)
+    else:
+        fixtures = record(args.sets, args.language, os.getenv("JUSTTCG_API_KEY"))
+    save(fixtures, args.output)
+    print(f"{len(fixtures['tcgdex']['cards'])} TCGdex cards, {len(fixtures['justtcg']['cards'])} JustTCG cards written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+# Benchmarks of the MCP tools against local stand-in TCGdex and JustTCG servers.
+#
+# Starts fake_upstream.py in a child process, points the server at it, drives the real
+# tools through an in-process MCP client and prints a JSON report:
+#   python benchmarks/run.py --requests 200 --concurrency 16 --latency-ms 40 --output report.json
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+import urllib.request
+from collections.abc import Callable
+from typing import Any
+
+import fixtures as fixture_files
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(os.path.dirname(HERE), "src")
+
+# get_available_* tools, called in turn by the "get_available" scenario
+AVAILABLE_TOOLS = ["get_available_types", "get_available_rarities", "get_available_series", "get_available_sets",
+                   "get_available_trainerTypes", "get_available_energyTypes", "get_available_stages",
+                   "get_available_regulationMarks", "get_available_categories", "get_available_illustrators"]
+
+
+def scenarios(fixtures: dict, rng: random.Random) -> dict[str, Callable[[int], tuple[str, dict]]]:
+    """
+    Builds the benchmark scenarios, each returns the tool and arguments of its i-th call.
+
+    Args:
+        fixtures (dict): The fixtures served by the stand-in servers.
+        rng (random.Random): Source of the random arguments.
+    Returns:
+        dict: Scenario name -> call builder.
+    """
+    card_ids = list(fixtures["tcgdex"]["cards"])
+    set_ids = list(fixtures["tcgdex"]["sets"])
+    justtcg_ids = [card["id"] for card in fixtures["justtcg"]["cards"]] or ["missing"]
+    names = sorted({card["name"].split(" ")[0] for card in fixtures["tcgdex"]["cards"].values()}) or ["a"]
+    return {
+        "get_available": lambda i: (AVAILABLE_TOOLS[i % len(AVAILABLE_TOOLS)], {}),
+        "get_card_by_id": lambda i: ("get_card_by_id", {"card_ids": rng.sample(card_ids, min(5, len(card_ids)))}),
+        "get_set_by_id": lambda i: ("get_set_by_id", {"set_ids": [rng.choice(set_ids)], "full": True}),
+        "get_card_by_query": lambda i: ("get_card_by_query", {
+            "query": f'Query().equal("set.id", "{rng.choice(set_ids)}").contains("name", "{rng.choice(names)}")',
+            "page_size": 10,
+        }),
+        "get_cards_by_query_JustTCG": lambda i: ("get_cards_by_query_JustTCG", {"cardId": rng.choice(justtcg_ids)}),
+    }
+
+
+def percentile(values: list[float], q: float) -> float:
+    """ Nearest-rank percentile of sorted values. """
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, round(q / 100 * len(values) + 0.5) - 1))]
+
+
+def peak_rss_mb() -> float:
+    """ Peak resident set size of this process in MiB. """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def upstream_stats(base: str, reset: bool = False) -> dict:
+    """ Reads (or resets) the call counters of the stand-in servers. """
+    request = urllib.request.Request(f"{base}/{'_reset' if reset else '_stats'}", method="POST" if reset else "GET")
+    with urllib.request.urlopen(request) as response:
+        return json.load(response)
+
+
+async def run_scenario(client, build: Callable[[int], tuple[str, dict]], requests: int, concurrency: int) -> dict:
+    """
+    Makes `requests` tool calls with at most `concurrency` in flight.
+
+    Returns:
+        dict: Number of calls and errors, duration, throughput and latency percentiles.
+    """
+    latencies: list[float] = []
+    errors = 0
+    calls = iter(range(requests))
+
+    async def worker() -> None:
+        nonlocal errors
+        for i in calls:
+            name, arguments = build(i)
+            start = time.perf_counter()
+            try:
+                result = await client.call_tool(name, arguments)
+                errors += bool(result.isError)
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    duration = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(requests / duration, 2) if duration else None,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p95": round(percentile(latencies, 95) * 1000, 2),
+            "p99": round(percentile(latencies, 99) * 1000, 2),
+            "mean": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+            "max": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        },
+    }
+
+
+async def benchmark(args: argparse.Namespace, fixtures: dict, base: str) -> dict:
+    """ Runs the selected scenarios against the server module and returns the report. """
+    sys.path.insert(0, SRC)
+    from mcp.shared.memory import create_connected_server_and_client_session
+
+    import_start = time.perf_counter()
+    import server
+    import_time = time.perf_counter() - import_start
+
+    builders = scenarios(fixtures, random.Random(args.seed))
+    report: dict[str, Any] = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "import_s": round(import_time, 3),
+        "scenarios": {},
+    }
+    async with create_connected_server_and_client_session(server.mcp._mcp_server) as client:
+        for name in args.scenarios:
+            if name not in builders:
+                raise SystemExit(f"unknown scenario '{name}', choose from {', '.join(builders)}")
+            if args.warmup:
+                await run_scenario(client, builders[name], args.warmup, args.concurrency)
+            upstream_stats(base, reset=True)
+            result = await run_scenario(client, builders[name], args.requests, args.concurrency)
+            result["upstream_calls"] = upstream_stats(base)["total"]
+            result["peak_rss_mb"] = peak_rss_mb()
+            report["scenarios"][name] = result
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the MCP tools against local stand-in APIs.")
+    parser.add_argument("--scenarios", nargs="+", default=["get_available", "get_set_by_id", "get_card_by_id",
+                                                           "get_card_by_query", "get_cards_by_query_JustTCG"])
+    parser.add_argument("--requests", type=int, default=100, help="measured calls per scenario")
+    parser.add_argument("--warmup", type=int, default=0, help="unmeasured calls made before each scenario")
+    parser.add_argument("--concurrency", type=int, default=8, help="calls in flight")
+    parser.add_argument("--fixtures", help="fixture file (see fixtures.py), generated fixtures are used when omitted")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="latency added by the stand-in servers")
+    parser.add_argument("--jitter-ms", type=float, default=10.0, help="maximum random latency added on top")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of upstream calls failing with 503")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of upstream calls failing with 429")
+    parser.add_argument("--retry-after", type=float, default=0.5, help="Retry-After of the injected 429 responses")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="file to write the JSON report to, printed when omitted")
+    args = parser.parse_args()
+
+    fixtures = fixture_files.load(args.fixtures) if args.fixtures else fixture_files.generate(seed=args.seed)
+    command = [sys.executable, os.path.join(HERE, "fake_upstream.py"),
+               "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+               "--error-rate", str(args.error_rate), "--throttle-rate", str(args.throttle_rate),
+               "--retry-after", str(args.retry_after), "--seed", str(args.seed)]
+    if args.fixtures:
+        command += ["--fixtures", args.fixtures]
+    # the stand-in servers run in their own process so they do not share the GIL or the RSS of the server
+    upstream = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    try:
+        base = f"http://127.0.0.1:{upstream.stdout.readline().strip()}"
+        # the defaults keep the run isolated and unthrottled, any of them can be overridden from the environment
+        os.environ["TCGDEX_ENDPOINT"] = f"{base}/tcgdex/v2"
+        os.environ["JUSTTCG_BASE_URL"] = f"{base}/justtcg/v1"
+        for name, value in {"JUSTTCG_API_KEY": "benchmark", "TCGDEX_CACHE_PERSIST": "0", "TCGDEX_CATALOG": "0",
+                            "TCGDEX_RATE_LIMIT": "0", "JUSTTCG_RATE_LIMIT": "0"}.items():
+            os.environ.setdefault(name, value)
+
+        report = asyncio.run(benchmark(args, fixtures, base))
+    finally:
+        upstream.stdin.close()
+        upstream.wait(timeout=10)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
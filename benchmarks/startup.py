@@ -0,0 +1,175 @@
+# Cold start benchmark: time from process launch to the first tools/list response over stdio,
+# and an import-time profile of the server (summary of `python -X importtime`).
+#   python benchmarks/startup.py --runs 10 --output startup.json
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(os.path.dirname(HERE), "src")
+
+HANDSHAKE = [
+    {"jsonrpc": "2.0", "id": 1, "method": "initialize", "params": {
+        "protocolVersion": "2025-06-18", "capabilities": {},
+        "clientInfo": {"name": "startup-benchmark", "version": "1"}}},
+    {"jsonrpc": "2.0", "method": "notifications/initialized"},
+    {"jsonrpc": "2.0", "id": 2, "method": "tools/list"},
+]
+
+# optional subsystems and heavy dependencies, imported on first use by the tools needing them and never by `import server`
+DEFERRED_MODULES = ("analytics", "card_map", "catalog", "cursors", "decklist", "governor", "images",
+                    "justTCG", "name_index", "numpy", "tcgdexsdk", "watchlist")
+
+
+def parse_importtime(stderr: str) -> list[dict]:
+    """
+    Parses the `-X importtime` lines of a process.
+
+    Returns:
+        list[dict]: One {"module", "self_ms", "cumulative_ms", "depth"} entry per imported module.
+    """
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line.split(":", 1)[1].split("|")
+        modules.append({
+            "module": name.strip(),
+            "self_ms": int(self_us) / 1000,
+            "cumulative_ms": int(cumulative_us) / 1000,
+            # nested imports are indented by two spaces per level after the separator space
+            "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+        })
+    return modules
+
+
+# runs the stdio session lifespan of the server and lists its tools, as the MCP handshake does
+LIFESPAN_CHECK = """
+import asyncio, json, sys, server
+
+async def main():
+    async with server.lifespan(server.mcp):
+        await server.mcp.list_tools()
+
+asyncio.run(main())
+print(json.dumps([m for m in {modules!r} if m in sys.modules]))
+"""
+
+
+def check_deferred_imports(env: dict) -> None:
+    """
+    Starts the server in a fresh process, up to the listing of its tools, and fails if any of DEFERRED_MODULES was
+    imported. The JustTCG tools are enabled and a watchlist exists, as the startup hooks depend on both.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        # only the presence of the database is checked at startup
+        open(os.path.join(directory, "watchlist.sqlite"), "wb").close()
+        env = dict(env, JUSTTCG_API_KEY=env.get("JUSTTCG_API_KEY") or "benchmark", JUSTTCG_WATCHLIST_DIR=directory,
+                   MCP_TRANSPORT="stdio")
+        code = LIFESPAN_CHECK.format(modules=DEFERRED_MODULES)
+        result = subprocess.run([sys.executable, "-c", code], cwd=SRC, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"starting the server failed:\n{result.stderr}")
+    imported = json.loads(result.stdout.splitlines()[-1])
+    if imported:
+        raise RuntimeError(f"imported at startup instead of on first use: {', '.join(imported)}")
+
+
+def run_once(env: dict, importtime: bool) -> tuple[float, float, str]:
+    """
+    Launches the server, makes the MCP handshake and lists the tools.
+
+    Returns:
+        tuple: (ms to the initialize response, ms to the tools/list response, stderr of the process).
+    """
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["server.py"]
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=SRC, env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE, text=True)
+    initialized = listed = None
+    try:
+        process.stdin.write(json.dumps(HANDSHAKE[0]) + "\n")
+        process.stdin.flush()
+        for line in process.stdout:
+            message = json.loads(line)
+            if message.get("id") == 1:
+                initialized = time.perf_counter() - start
+                for request in HANDSHAKE[1:]:
+                    process.stdin.write(json.dumps(request) + "\n")
+                process.stdin.flush()
+            elif message.get("id") == 2:
+                listed = time.perf_counter() - start
+                if "error" in message:
+                    raise RuntimeError(f"tools/list failed: {message['error']}")
+                break
+    finally:
+        # communicate() closes stdin, which ends the stdio session of the server
+        try:
+            stderr = process.communicate(timeout=10)[1]
+        except subprocess.TimeoutExpired:
+            process.kill()
+            stderr = process.communicate()[1]
+    if listed is None:
+        raise RuntimeError(f"the server exited before answering tools/list:\n{stderr}")
+    return initialized * 1000, listed * 1000, stderr
+
+
+def summary(values: list[float]) -> dict:
+    """ Median, min and max of a series of timings in ms. """
+    return {"median": round(statistics.median(values), 1), "min": round(min(values), 1), "max": round(max(values), 1)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure the cold start of the MCP server.")
+    parser.add_argument("--runs", type=int, default=5, help="number of launches")
+    parser.add_argument("--top", type=int, default=20, help="number of modules listed in the import profile")
+    parser.add_argument("--fast-startup", action="store_true", help="run in the startup-optimized mode (MCP_FAST_STARTUP=1)")
+    parser.add_argument("--output", help="file to write the JSON report to, printed when omitted")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.setdefault("JUSTTCG_API_KEY", "benchmark")
+    if args.fast_startup:
+        env["MCP_FAST_STARTUP"] = "1"
+
+    check_deferred_imports(env)
+    initialize, tools_list = [], []
+    for _ in range(args.runs):
+        first, listed, _ = run_once(env, importtime=False)
+        initialize.append(first)
+        tools_list.append(listed)
+    # a separate launch for the profile, -X importtime slows the imports down
+    _, _, stderr = run_once(env, importtime=True)
+    modules = parse_importtime(stderr)
+    top_level = [m for m in modules if m["depth"] == 0]
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "runs": args.runs,
+        "fast_startup": args.fast_startup,
+        "initialize_ms": summary(initialize),
+        "tools_list_ms": summary(tools_list),
+        "imports": {
+            "modules": len(modules),
+            "total_ms": round(sum(m["self_ms"] for m in modules), 1),
+            "top_cumulative": sorted(top_level, key=lambda m: m["cumulative_ms"], reverse=True)[:args.top],
+            "top_self": sorted(modules, key=lambda m: m["self_ms"], reverse=True)[:args.top],
+        },
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+# Vectorized price analytics over the price histories of JustTCG variants.
+from dataclasses import dataclass
+from typing import Union
+
+import numpy as np
+
+DAY = 86400
+
+
+@dataclass
+class PriceMatrix:
+    """
+    Price histories of many variants aligned on the same daily timestamps.
+
+    `prices` has one row per variant and one column per day. Each row is forward
+    filled from its first observation, days before it are NaN.
+    """
+
+    timestamps: np.ndarray
+    """(days,) int64 unix timestamps of the start of each day, ascending"""
+    prices: np.ndarray
+    """(variants, days) float64 prices"""
+    variants: list[dict]
+    """one metadata dictionary per row (variantId, cardId, name, set, condition, printing, price)"""
+
+
+def build_matrix(cards: list[dict], history: str = "priceHistory") -> PriceMatrix:
+    """
+    Loads the price histories of every variant of the given cards into a PriceMatrix.
+
+    Args:
+        cards (list[dict]): Cards as returned by justTCG.get_cards_by_query or get_cards_by_batch_query.
+        history (str, optional): The variant history field to load (priceHistory or priceHistory30d). Default is priceHistory.
+    Returns:
+        PriceMatrix: The aligned histories, variants without history are left out.
+    """
+    variants, rows, days, values = [], [], [], []
+    for card in cards:
+        for variant in card.get("variants") or []:
+            points = variant.get(history) or []
+            if not points:
+                continue
+            # points are sorted by time so the last price of a day wins when assigning below
+            points = sorted((p["t"], p["p"]) for p in points if p.get("t") is not None and p.get("p") is not None)
+            if not points:
+                continue
+            t, p = np.array(points, dtype=np.float64).T
+            rows.append(np.full(len(t), len(variants), dtype=np.int64))
+            days.append((t // DAY * DAY).astype(np.int64))
+            values.append(p)
+            variants.append({
+                "variantId": variant.get("id"),
+                "cardId": card.get("id"),
+                "name": card.get("name"),
+                "set": card.get("set"),
+                "condition": variant.get("condition"),
+                "printing": variant.get("printing"),
+                "price": variant.get("price"),
+            })
+
+    if not variants:
+        return PriceMatrix(np.empty(0, dtype=np.int64), np.empty((0, 0)), [])
+
+    rows, days, values = np.concatenate(rows), np.concatenate(days), np.concatenate(values)
+    timestamps, columns = np.unique(days, return_inverse=True)
+    prices = np.full((len(variants), len(timestamps)), np.nan)
+    prices[rows, columns] = values
+    return PriceMatrix(timestamps, forward_fill(prices), variants)
+
+
+def forward_fill(prices: np.ndarray) -> np.ndarray:
+    """ Replaces the NaN of each row by the last valid value before them. """
+    index = np.where(np.isnan(prices), 0, np.arange(prices.shape[1]))
+    np.maximum.accumulate(index, axis=1, out=index)
+    return prices[np.arange(prices.shape[0])[:, None], index]
+
+
+def window_start(matrix: PriceMatrix, window_days: int) -> int:
+    """ Returns the column of the first day of a window ending on the last day. """
+    return int(np.searchsorted(matrix.timestamps, matrix.timestamps[-1] - window_days * DAY))
+
+
+def windowed_returns(matrix: PriceMatrix, window_days: int) -> np.ndarray:
+    """
+    Computes the relative price change of every variant over the last `window_days` days.
+
+    Args:
+        matrix (PriceMatrix): The price histories.
+        window_days (int): Length of the window in days.
+    Returns:
+        np.ndarray: (variants,) returns, NaN when the variant has no price at the window start.
+    """
+    start = matrix.prices[:, window_start(matrix, window_days)]
+    end = matrix.prices[:, -1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = end / start - 1.0
+    returns[~np.isfinite(returns)] = np.nan
+    return returns
+
+
+def rolling_stats(matrix: PriceMatrix, window_days: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Computes the rolling mean and standard deviation of every variant.
+
+    Args:
+        matrix (PriceMatrix): The price histories.
+        window_days (int): Length of the rolling window in days.
+    Returns:
+        tuple[np.ndarray, np.ndarray]: (variants, days) rolling means and standard deviations,
+        NaN where the window holds no price.
+    """
+    valid = ~np.isnan(matrix.prices)
+    prices = np.where(valid, matrix.prices, 0.0)
+    pad = np.zeros((prices.shape[0], 1))
+    count = np.hstack([pad, np.cumsum(valid, axis=1)])
+    total = np.hstack([pad, np.cumsum(prices, axis=1)])
+    squares = np.hstack([pad, np.cumsum(prices ** 2, axis=1)])
+
+    # sums over the window ending on each day, from the cumulative sums
+    end = np.arange(1, prices.shape[1] + 1)
+    start = np.maximum(end - max(1, window_days), 0)
+    n = count[:, end] - count[:, start]
+    s = total[:, end] - total[:, start]
+    q = squares[:, end] - squares[:, start]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = s / n
+        std = np.sqrt(np.maximum(q / n - mean ** 2, 0.0))
+    mean[n == 0] = np.nan
+    std[n == 0] = np.nan
+    return mean, std
+
+
+def volatility(matrix: PriceMatrix, window_days: int) -> np.ndarray:
+    """
+    Computes the standard deviation of the daily log returns of every variant over the last `window_days` days.
+
+    Args:
+        matrix (PriceMatrix): The price histories.
+        window_days (int): Length of the window in days.
+    Returns:
+        np.ndarray: (variants,) daily volatilities, NaN when fewer than two prices are available.
+    """
+    window = matrix.prices[:, window_start(matrix, window_days):]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_returns = np.diff(np.log(np.where(window > 0, window, np.nan)), axis=1)
+    valid = (~np.isnan(log_returns)).sum(axis=1)
+    result = np.full(window.shape[0], np.nan)
+    mask = valid > 0
+    result[mask] = np.nanstd(log_returns[mask], axis=1)
+    return result
+
+
+def top(values: np.ndarray, n: int, largest: bool = True) -> np.ndarray:
+    """
+    Returns the row indices of the `n` largest (or smallest) values, ignoring NaN.
+
+    Args:
+        values (np.ndarray): (variants,) values to rank.
+        n (int): Number of rows to return.
+        largest (bool, optional): Rank from the largest value. Default is True.
+    Returns:
+        np.ndarray: The indices, best first.
+    """
+    candidates = np.flatnonzero(~np.isnan(values))
+    keys = -values[candidates] if largest else values[candidates]
+    if n < len(candidates):
+        part = np.argpartition(keys, n)[:n]
+        candidates, keys = candidates[part], keys[part]
+    return candidates[np.argsort(keys, kind="stable")]
+
+
+def set_index(matrix: PriceMatrix) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Computes two set-level indexes over time.
+
+    Args:
+        matrix (PriceMatrix): The price histories.
+    Returns:
+        tuple[np.ndarray, np.ndarray]: (days,) equal weighted index, each variant rebased to 100 on
+        its first price, and (days,) total price of every variant.
+    """
+    prices = matrix.prices
+    first_column = np.argmax(~np.isnan(prices), axis=1)
+    first = prices[np.arange(prices.shape[0]), first_column]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rebased = prices / np.where(first > 0, first, np.nan)[:, None] * 100.0
+    valid = ~np.isnan(rebased)
+    count = valid.sum(axis=0)
+    equal_weight = np.where(count > 0, np.where(valid, rebased, 0.0).sum(axis=0) / np.maximum(count, 1), np.nan)
+    total = np.nansum(prices, axis=0)
+    return equal_weight, total
+
+
+def correlation(matrix: PriceMatrix) -> np.ndarray:
+    """
+    Computes the correlation of the daily returns between every pair of variants.
+
+    Args:
+        matrix (PriceMatrix): The price histories.
+    Returns:
+        np.ndarray: (variants, variants) correlation matrix, NaN for variants whose price never changes.
+    """
+    prices = matrix.prices
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = np.diff(prices, axis=1) / prices[:, :-1]
+    returns = np.where(np.isfinite(returns), returns, 0.0)
+    centered = returns - returns.mean(axis=1, keepdims=True)
+    norms = np.sqrt((centered ** 2).sum(axis=1))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (centered @ centered.T) / np.outer(norms, norms)
+
+
+def sample(values: np.ndarray, timestamps: np.ndarray, points: int) -> list[dict]:
+    """ Returns at most `points` evenly spaced {t, v} entries of a series, always keeping the last one. """
+    if len(values) == 0:
+        return []
+    index = np.unique(np.linspace(0, len(values) - 1, min(points, len(values))).round().astype(int))
+    return [{"t": int(timestamps[i]), "v": round_or_none(values[i])} for i in index]
+
+
+def round_or_none(value: Union[float, np.floating], digits: int = 4) -> Union[float, None]:
+    """ Rounds a value for output, NaN becomes None. """
+    return None if np.isnan(value) else round(float(value), digits)
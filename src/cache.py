@@ -0,0 +1,276 @@
+# In-memory TTL/LRU cache with optional JSON persistence, used for TCGdex reference data,
+# and the SQLite store shared by the worker processes of an HTTP deployment.
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from typing import Any, Union
+
+CACHE_DIR = os.getenv("TCGDEX_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "pokemon_tcg_mcp"))
+CACHE_MAXSIZE = int(os.getenv("TCGDEX_CACHE_MAXSIZE", "256"))
+# set TCGDEX_CACHE_PERSIST=0 to keep the cache in memory only
+CACHE_PERSIST = os.getenv("TCGDEX_CACHE_PERSIST", "1") != "0"
+# SQLite file shared by every process of the server (e.g. the HTTP workers), unset for per process caches
+SHARED_CACHE_PATH = os.getenv("MCP_SHARED_CACHE") or None
+# seconds an entry read from the shared store is served from memory before the store is read again,
+# bounds how long an invalidation made by another process goes unnoticed
+SHARED_CACHE_LOCAL_TTL = float(os.getenv("MCP_SHARED_CACHE_LOCAL_TTL", "60"))
+
+
+class SharedStore:
+    """
+    Expiring JSON values in an SQLite file, grouped by namespace.
+
+    The file is opened in WAL mode so any number of processes can read it while
+    one of them writes, which lets the workers of a deployment reuse what the
+    others fetched.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): The SQLite file, created if needed.
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS entries (
+            namespace TEXT, key TEXT, expiry REAL, value TEXT, PRIMARY KEY (namespace, key))""")
+        self._lock = threading.Lock()
+
+    def get(self, namespace: str, key: str) -> Union[tuple[float, Any], None]:
+        """
+        Returns the (expiry, value) of an entry, None if it is missing or expired.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT expiry, value FROM entries WHERE namespace = ? AND key = ?",
+                                   (namespace, key)).fetchone()
+        if row is None or row[0] < time.time():
+            return None
+        return row[0], json.loads(row[1])
+
+    def set(self, namespace: str, key: str, value: Any, expiry: float) -> None:
+        """ Stores a value until `expiry` (unix timestamp). """
+        data = json.dumps(value)
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)", (namespace, key, expiry, data))
+
+    def delete(self, namespace: str, keys: Union[list[str], None] = None) -> list[str]:
+        """
+        Drops entries of a namespace.
+
+        Args:
+            namespace (str): The namespace.
+            keys (list[str], optional): The keys to drop. Default is None (the whole namespace).
+        Returns:
+            list[str]: The keys that were dropped.
+        """
+        with self._lock:
+            if keys is None:
+                dropped = [row[0] for row in self._db.execute("SELECT key FROM entries WHERE namespace = ?", (namespace,))]
+                self._db.execute("DELETE FROM entries WHERE namespace = ?", (namespace,))
+                return dropped
+            dropped = []
+            for key in keys:
+                if self._db.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key)).rowcount:
+                    dropped.append(key)
+            return dropped
+
+    def purge(self) -> int:
+        """ Drops the expired entries and returns their number. """
+        with self._lock:
+            return self._db.execute("DELETE FROM entries WHERE expiry < ?", (time.time(),)).rowcount
+
+    def close(self) -> None:
+        """ Closes the database. """
+        with self._lock:
+            self._db.close()
+
+
+_shared_store: Union[SharedStore, None] = None
+
+
+def shared_store() -> Union[SharedStore, None]:
+    """ Returns the store of MCP_SHARED_CACHE, opened on first use by each process, or None when unset. """
+    global _shared_store
+    if _shared_store is None and SHARED_CACHE_PATH:
+        _shared_store = SharedStore(SHARED_CACHE_PATH)
+    return _shared_store
+
+
+def close_shared_store() -> None:
+    """ Closes the shared store of this process, if it was opened. """
+    global _shared_store
+    if _shared_store is not None:
+        _shared_store.close()
+        _shared_store = None
+
+
+class TTLCache:
+    """
+    Least recently used cache whose entries expire after a per-entry time to live.
+
+    Values must be JSON serializable when the cache is persisted: every write is
+    flushed to `path` and the file is loaded back on creation, so a restarted
+    server can answer from the cache right away. With a `namespace` and a shared
+    store (MCP_SHARED_CACHE), writes go to the store instead and misses are read
+    from it, so every process of the server shares the entries.
+    """
+
+    def __init__(self, maxsize: int = CACHE_MAXSIZE, path: Union[str, None] = None,
+                 namespace: Union[str, None] = None):
+        """
+        Args:
+            maxsize (int, optional): Maximum number of entries kept in memory. Default is TCGDEX_CACHE_MAXSIZE.
+            path (str, optional): JSON file the cache is persisted to when there is no shared store. Default is None (memory only).
+            namespace (str, optional): Namespace of the entries in the shared store. Default is None (not shared).
+        """
+        self.maxsize = maxsize
+        self.namespace = namespace
+        self.store = shared_store() if namespace else None
+        self.path = path if self.store is None else None
+        # key -> (expiry as a unix timestamp, value)
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        # key -> expiry the value was stored with, a new value of the key gets a new one
+        self._versions: dict[str, float] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+        self.load()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """
+        Returns the value stored under a key if it has not expired.
+
+        Args:
+            key (str): The key to look up.
+            default (Any, optional): The value returned on a miss. Default is None.
+        Returns:
+            Any: The cached value or `default`.
+        """
+        entry = self._entries.get(key)
+        if (entry is None or entry[0] < time.time()) and self.store is not None:
+            entry = self.store.get(self.namespace, key)
+            if entry is not None:
+                # kept in memory for a short while only, the store stays the reference
+                self._remember(key, min(entry[0], time.time() + SHARED_CACHE_LOCAL_TTL), entry[1], entry[0])
+        if entry is None or entry[0] < time.time():
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        """
+        Stores a value, evicting the least recently used entries above `maxsize`.
+
+        Args:
+            key (str): The key to store the value under.
+            value (Any): The value to store.
+            ttl (float): Time to live of the entry in seconds.
+        """
+        expiry = local_expiry = time.time() + ttl
+        if self.store is not None:
+            self.store.set(self.namespace, key, value, expiry)
+            local_expiry = min(expiry, time.time() + SHARED_CACHE_LOCAL_TTL)
+        self._remember(key, local_expiry, value, expiry)
+        self.save()
+
+    def _remember(self, key: str, expiry: float, value: Any, version: float) -> None:
+        """ Stores an entry in memory, evicting the least recently used entries above `maxsize`. """
+        self._entries[key] = (expiry, value)
+        self._versions[key] = version
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            evicted, _ = self._entries.popitem(last=False)
+            self._versions.pop(evicted, None)
+
+    def version(self, key: str) -> Union[float, None]:
+        """
+        Returns the version of the value last read or stored under a key, None if the key is not in memory.
+
+        The version changes every time the key is stored again, by this process or by another one through the
+        shared store, so callers deriving data from a large value can tell if it changed without comparing it.
+        """
+        return self._versions.get(key)
+
+    def invalidate(self, keys: Union[list[str], None] = None) -> list[str]:
+        """
+        Drops entries from the cache.
+
+        Args:
+            keys (list[str], optional): The keys to drop. Default is None (drop everything).
+        Returns:
+            list[str]: The keys that were dropped.
+        """
+        dropped = list(self._entries) if keys is None else [key for key in keys if key in self._entries]
+        for key in dropped:
+            del self._entries[key]
+            self._versions.pop(key, None)
+        if self.store is not None:
+            dropped = sorted(set(dropped) | set(self.store.delete(self.namespace, keys)))
+        self.save()
+        return dropped
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: float) -> Any:
+        """
+        Returns the cached value of a key, calling `loader` on a miss.
+
+        Concurrent misses on the same key share a single call to `loader`. Empty results
+        are returned but not cached so a failed upstream call is retried next time.
+
+        Args:
+            key (str): The key to look up.
+            loader (Callable[[], Awaitable[Any]]): Coroutine function producing the value.
+            ttl (float): Time to live of the loaded value in seconds.
+        Returns:
+            Any: The cached or freshly loaded value.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            value = self.get(key)
+            if value is None:
+                value = await loader()
+                if value:
+                    self.set(key, value, ttl)
+        return value
+
+    def load(self) -> None:
+        """ Loads the non-expired entries persisted to `path`, if any. """
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning("Ignoring unreadable cache file '%s': %s", self.path, e)
+            return
+        now = time.time()
+        for key, (expiry, value) in entries.items():
+            if expiry >= now:
+                self._entries[key] = (expiry, value)
+                self._versions[key] = expiry
+
+    def save(self) -> None:
+        """ Writes the cache to `path` atomically, if persistence is enabled. """
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logging.warning("Could not persist cache to '%s': %s", self.path, e)
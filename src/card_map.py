@@ -0,0 +1,322 @@
+# Persistent index linking TCGdex card ids to JustTCG cards, built by matching set names and collector numbers.
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Union
+
+import cache
+import hydration
+import justTCG
+import tools
+
+CARD_MAP_PATH = os.getenv("CARD_MAP_PATH", os.path.join(cache.CACHE_DIR, "card_map.sqlite"))
+# seconds before a mapped set is matched again on an incremental refresh, new JustTCG listings
+# of an unchanged TCGdex set are picked up at that point
+CARD_MAP_TTL = float(os.getenv("CARD_MAP_TTL", "604800"))
+# number of JustTCG cards requested per page while listing a set
+CARD_MAP_PAGE_SIZE = int(os.getenv("CARD_MAP_PAGE_SIZE", "20"))
+JUSTTCG_GAME = "pokemon"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cards (
+    tcgdex_id TEXT PRIMARY KEY,
+    set_id TEXT,
+    local_id TEXT,
+    name TEXT,
+    justtcg_id TEXT,
+    tcgplayer_id TEXT,
+    matched_by TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_cards_set_id ON cards(set_id);
+CREATE TABLE IF NOT EXISTS sets (
+    set_id TEXT PRIMARY KEY,
+    name TEXT,
+    justtcg_set TEXT,
+    card_count INTEGER,
+    mapped INTEGER,
+    refreshed_at REAL
+);
+"""
+
+
+def normalize_name(name: Union[str, None]) -> str:
+    """ Lowercase alphanumeric form of a set or card name, without accents nor a "SV03:" like code prefix. """
+    text = unicodedata.normalize("NFKD", name or "").encode("ascii", "ignore").decode().casefold()
+    text = re.sub(r"^[a-z0-9.]+:\s*", "", text)
+    return re.sub(r"[^a-z0-9]", "", text)
+
+
+def normalize_number(number: Union[str, int, None]) -> str:
+    """ Collector number without its "/102" total nor leading zeros ("004/102" -> "4", "TG05" -> "tg05"). """
+    text = str(number or "").split("/")[0].strip().casefold()
+    return text.lstrip("0") or text if text.isdigit() else text
+
+
+class CardMap:
+    """ SQLite index of the JustTCG cardId and tcgplayerId of TCGdex cards, and of the sets mapped so far. """
+
+    def __init__(self, path: str = CARD_MAP_PATH):
+        """
+        Args:
+            path (str, optional): Location of the SQLite database, created if missing. Default is CARD_MAP_PATH.
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # several worker processes may use the same file, they wait for each other's writes
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def close(self) -> None:
+        """ Closes the database connection. """
+        self.connection.close()
+
+    def lookup(self, card_ids: list[str]) -> dict[str, dict]:
+        """
+        Returns the JustTCG identifiers of TCGdex cards.
+
+        Args:
+            card_ids (list[str]): The TCGdex card ids.
+        Returns:
+            dict[str, dict]: TCGdex id -> {"cardId", "tcgplayerId", "matchedBy"} for the mapped cards.
+        """
+        if not card_ids:
+            return {}
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT tcgdex_id, justtcg_id, tcgplayer_id, matched_by FROM cards "
+                f"WHERE justtcg_id IS NOT NULL AND tcgdex_id IN ({', '.join('?' * len(card_ids))})", card_ids
+            ).fetchall()
+        return {row[0]: {"cardId": row[1], "tcgplayerId": row[2], "matchedBy": row[3]} for row in rows}
+
+    def sets(self) -> dict[str, dict]:
+        """ Returns the state of the mapped sets, keyed by TCGdex set id. """
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT set_id, name, justtcg_set, card_count, mapped, refreshed_at FROM sets"
+            ).fetchall()
+        return {row[0]: {"name": row[1], "justtcgSet": row[2], "cards": row[3], "mapped": row[4], "refreshedAt": row[5]}
+                for row in rows}
+
+    def store_set(self, set_id: str, name: str, card_count: int, justtcg_set: Union[str, None], rows: list[tuple]) -> None:
+        """
+        Replaces the mapping of a set.
+
+        Args:
+            set_id (str): The TCGdex set id.
+            name (str): The TCGdex set name.
+            card_count (int): The total card count announced by TCGdex, tells when the set changes.
+            justtcg_set (str): The id of the matching JustTCG set, None if there is none.
+            rows (list[tuple]): (tcgdex_id, local_id, name, justtcg_id, tcgplayer_id, matched_by) per TCGdex card.
+        """
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM cards WHERE set_id = ?", (set_id,))
+            self.connection.executemany("INSERT OR REPLACE INTO cards VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                        [(row[0], set_id, *row[1:]) for row in rows])
+            self.connection.execute("INSERT OR REPLACE INTO sets VALUES (?, ?, ?, ?, ?, ?)",
+                                    (set_id, name, justtcg_set, card_count, sum(1 for row in rows if row[3]), time.time()))
+
+    def stats(self) -> dict:
+        """ Returns the number of mapped sets and cards. """
+        with self.lock:
+            sets, cards = self.connection.execute("SELECT COUNT(*), COALESCE(SUM(mapped), 0) FROM sets").fetchone()
+        return {"sets": sets, "cards": cards}
+
+
+def match_set(name: str, justtcg_sets: list[dict]) -> Union[dict, None]:
+    """
+    Finds the JustTCG set of a TCGdex set from its name.
+
+    Args:
+        name (str): The TCGdex set name (in English).
+        justtcg_sets (list[dict]): The JustTCG sets of the game.
+    Returns:
+        dict: The JustTCG set with the same normalized name, else the only one containing it, else None.
+    """
+    key = normalize_name(name)
+    if not key:
+        return None
+    exact = [set for set in justtcg_sets if normalize_name(set.get("name")) == key]
+    if exact:
+        return exact[0]
+    partial = [set for set in justtcg_sets if key in normalize_name(set.get("name"))]
+    return partial[0] if len(partial) == 1 else None
+
+
+def match_cards(tcgdex_cards: list[dict], justtcg_cards: list[dict]) -> list[tuple]:
+    """
+    Matches the cards of a TCGdex set with the cards of its JustTCG set.
+
+    Cards are matched on their collector number, the name breaks the ties (several JustTCG
+    products with the same number), and a card without number match falls back to the only
+    JustTCG card of the same name.
+
+    Args:
+        tcgdex_cards (list[dict]): The TCGdex cards, with their id, localId and name.
+        justtcg_cards (list[dict]): The JustTCG cards of the set.
+    Returns:
+        list[tuple]: (tcgdex_id, local_id, name, justtcg_id, tcgplayer_id, matched_by) per TCGdex card,
+        the JustTCG fields are None for the cards left unmatched.
+    """
+    by_number: dict[str, list[dict]] = {}
+    by_name: dict[str, list[dict]] = {}
+    for card in justtcg_cards:
+        if normalize_number(card.get("number")):
+            by_number.setdefault(normalize_number(card.get("number")), []).append(card)
+        by_name.setdefault(normalize_name(card.get("name")), []).append(card)
+
+    rows = []
+    for card in tcgdex_cards:
+        name = normalize_name(card.get("name"))
+        candidates = by_number.get(normalize_number(card.get("localId")), [])
+        match, matched_by = None, None
+        if len(candidates) == 1:
+            match, matched_by = candidates[0], "number"
+        elif candidates:
+            named = [candidate for candidate in candidates if normalize_name(candidate.get("name")).startswith(name)]
+            match, matched_by = (named[0], "number+name") if named else (None, None)
+        elif len(by_name.get(name, [])) == 1:
+            match, matched_by = by_name[name][0], "name"
+        rows.append((card["id"], card.get("localId"), card.get("name"),
+                     match.get("id") if match else None,
+                     str(match["tcgplayerId"]) if match and match.get("tcgplayerId") else None,
+                     matched_by))
+    return rows
+
+
+async def map_set(card_map: CardMap, set: dict, justtcg_sets: list[dict]) -> dict:
+    """
+    Matches the cards of a TCGdex set and stores the result.
+
+    Args:
+        card_map (CardMap): The index to update.
+        set (dict): The TCGdex set, as returned by tools.Set_to_dict (with its cards).
+        justtcg_sets (list[dict]): The JustTCG sets of the game.
+    Returns:
+        dict: The JustTCG set id and the number of cards and mapped cards.
+    """
+    justtcg_set = match_set(set["name"], justtcg_sets)
+    justtcg_cards = []
+    if justtcg_set is not None:
+        justtcg_cards = [card async for card in justTCG.iter_cards_by_query(
+            game=JUSTTCG_GAME, set=justtcg_set["id"], limit=CARD_MAP_PAGE_SIZE)]
+    rows = match_cards(set.get("cards") or [], justtcg_cards)
+    card_map.store_set(set["id"], set["name"], (set.get("cardCount") or {}).get("total"),
+                       justtcg_set["id"] if justtcg_set else None, rows)
+    mapped = sum(1 for row in rows if row[3])
+    logging.info("Mapped %d/%d cards of set '%s'", mapped, len(rows), set["id"])
+    return {"justtcgSet": justtcg_set["id"] if justtcg_set else None, "cards": len(rows), "mapped": mapped}
+
+
+def stale_sets(card_map: CardMap, set_resumes: list[dict], ttl: float = CARD_MAP_TTL) -> list[str]:
+    """
+    Returns the TCGdex sets to map again: never mapped, whose card count changed, or mapped more than `ttl` seconds ago.
+
+    Args:
+        card_map (CardMap): The index.
+        set_resumes (list[dict]): The TCGdex sets, as returned by tools.SetResume_to_dict.
+        ttl (float, optional): Maximum age in seconds of a mapping. Default is CARD_MAP_TTL.
+    Returns:
+        list[str]: The set ids.
+    """
+    mapped = card_map.sets()
+    now = time.time()
+    stale = []
+    for set in set_resumes:
+        state = mapped.get(set["id"])
+        if (state is None or state["cards"] != (set.get("cardCount") or {}).get("total")
+                or now - state["refreshedAt"] > ttl):
+            stale.append(set["id"])
+    return stale
+
+
+async def build(card_map: CardMap, set_hydrator: hydration.Hydrator, set_ids: list[str]) -> dict:
+    """
+    Maps the cards of TCGdex sets to JustTCG.
+
+    The JustTCG sets are listed once, then every TCGdex set is fetched with its card list
+    and matched with the cards of its JustTCG set.
+
+    Args:
+        card_map (CardMap): The index to update.
+        set_hydrator (Hydrator): Fetches the TCGdex sets, in English as the JustTCG names.
+        set_ids (list[str]): The TCGdex sets to map.
+    Returns:
+        dict: Per set id, the JustTCG set and the number of cards and mapped cards.
+    """
+    if not set_ids:
+        return {}
+    justtcg_sets = await justTCG.get_list_of_sets(JUSTTCG_GAME)
+    report = {}
+    async for _, set in set_hydrator.stream(set_ids):
+        if set is not None:
+            report[set.id] = await map_set(card_map, tools.Set_to_dict(set), justtcg_sets)
+    return report
+
+
+_card_map: Union[CardMap, None] = None
+
+
+def open_card_map() -> CardMap:
+    """ Returns the index of CARD_MAP_PATH, opened on first use. """
+    global _card_map
+    if _card_map is None:
+        _card_map = CardMap()
+    return _card_map
+
+
+def close_card_map() -> None:
+    """ Closes the index opened by open_card_map, if any. """
+    global _card_map
+    if _card_map is not None:
+        _card_map.close()
+        _card_map = None
+
+
+def main() -> None:
+    """ Command line entry point: `python card_map.py build [--incremental] [--sets base1 swsh3]`. """
+    parser = argparse.ArgumentParser(description="Build the TCGdex to JustTCG card index.")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("--sets", nargs="*", help="TCGdex set ids to map, every set when omitted")
+    parser.add_argument("--incremental", action="store_true", help="only map new, changed and outdated sets")
+    parser.add_argument("--path", default=CARD_MAP_PATH, help="location of the SQLite database")
+    parser.add_argument("--concurrency", type=int, default=hydration.MAX_CONCURRENCY)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    from tcgdexsdk import TCGdex
+
+    # JustTCG lists English names, the TCGdex ids are the same in every language
+    sdk = TCGdex("en")
+    if os.getenv("TCGDEX_ENDPOINT"):
+        sdk.setEndpoint(os.getenv("TCGDEX_ENDPOINT"))
+    card_map = CardMap(args.path)
+
+    async def fetch_set(set_id: str):
+        return await asyncio.to_thread(sdk.set.getSync, set_id)
+
+    async def run() -> dict:
+        set_ids = args.sets
+        if not set_ids:
+            set_resumes = [tools.SetResume_to_dict(set) for set in await asyncio.to_thread(sdk.set.listSync)]
+            set_ids = stale_sets(card_map, set_resumes) if args.incremental else [set["id"] for set in set_resumes]
+        try:
+            return await build(card_map, hydration.Hydrator(fetch_set, args.concurrency), set_ids)
+        finally:
+            await justTCG.aclose()
+
+    report = asyncio.run(run())
+    print(json.dumps(report, indent=2))
+    card_map.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,457 @@
+# Local SQLite mirror of the TCGdex card catalog, used to answer card queries without the network.
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Union
+
+if TYPE_CHECKING:
+    from tcgdexsdk import TCGdex, Set
+
+import tools
+from query_plan import Filter, QueryPlan
+import hydration
+import cache
+
+CATALOG_ENABLED = os.getenv("TCGDEX_CATALOG", "1") != "0"
+CATALOG_DIR = os.getenv("TCGDEX_CATALOG_DIR", cache.CACHE_DIR)
+
+# Card_to_dict fields stored in their own indexed column
+INDEXED_COLUMNS = {
+    "name": "name",
+    "set": "set_id",
+    "set.id": "set_id",
+    "set.name": "set_name",
+    "rarity": "rarity",
+    "types": "types",
+    "hp": "hp",
+    "stage": "stage",
+    "regulationMark": "regulation_mark",
+    "illustrator": "illustrator",
+    "category": "category",
+    "id": "id",
+    "localId": "local_id",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cards (
+    id TEXT PRIMARY KEY,
+    local_id TEXT,
+    name TEXT COLLATE NOCASE,
+    set_id TEXT COLLATE NOCASE,
+    set_name TEXT COLLATE NOCASE,
+    rarity TEXT COLLATE NOCASE,
+    types TEXT COLLATE NOCASE,
+    hp INTEGER,
+    stage TEXT COLLATE NOCASE,
+    regulation_mark TEXT COLLATE NOCASE,
+    illustrator TEXT COLLATE NOCASE,
+    category TEXT COLLATE NOCASE,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_cards_name ON cards(name);
+CREATE INDEX IF NOT EXISTS idx_cards_set_id ON cards(set_id);
+CREATE INDEX IF NOT EXISTS idx_cards_set_name ON cards(set_name);
+CREATE INDEX IF NOT EXISTS idx_cards_rarity ON cards(rarity);
+CREATE INDEX IF NOT EXISTS idx_cards_types ON cards(types);
+CREATE INDEX IF NOT EXISTS idx_cards_hp ON cards(hp);
+CREATE INDEX IF NOT EXISTS idx_cards_stage ON cards(stage);
+CREATE INDEX IF NOT EXISTS idx_cards_regulation_mark ON cards(regulation_mark);
+CREATE INDEX IF NOT EXISTS idx_cards_illustrator ON cards(illustrator);
+CREATE INDEX IF NOT EXISTS idx_cards_category ON cards(category);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS manifest (
+    set_id TEXT PRIMARY KEY,
+    name TEXT,
+    card_total INTEGER,
+    card_official INTEGER,
+    release_date TEXT,
+    card_listed INTEGER,
+    synced_at REAL
+);
+"""
+
+# number of hydrated cards written to the catalog at once during a sync
+SYNC_CHUNK_SIZE = 50
+
+# query plan comparison operators and their SQL equivalent
+OPERATORS = {
+    "eq": "=",
+    "neq": "!=",
+    "gte": ">=",
+    "lte": "<=",
+    "gt": ">",
+    "lt": "<",
+}
+
+
+def like_pattern(value: Any, prefix: str = "%", suffix: str = "%") -> str:
+    """ Returns a LIKE pattern matching a literal value, its wildcards are escaped with a backslash. """
+    escaped = str(value).replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"{prefix}{escaped}{suffix}"
+
+
+def default_path(language: str) -> str:
+    """ Returns the default location of the catalog for a language. """
+    return os.path.join(CATALOG_DIR, f"catalog_{language}.sqlite")
+
+
+def card_row(card: dict) -> tuple:
+    """ Converts a Card_to_dict output to a row of the cards table. """
+    return (
+        card["id"],
+        card.get("localId"),
+        card.get("name"),
+        card["set"]["id"],
+        card["set"]["name"],
+        card.get("rarity"),
+        # delimited so that a single type can be matched with LIKE
+        f",{card['types'].replace(', ', ',')}," if card.get("types") else None,
+        card.get("hp"),
+        card.get("stage"),
+        card.get("regulationMark"),
+        card.get("illustrator"),
+        card.get("category"),
+        json.dumps(card),
+    )
+
+
+class Catalog:
+    """ SQLite card catalog storing the Card_to_dict output of every card. """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): Location of the SQLite database, created if missing.
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def close(self) -> None:
+        """ Closes the database connection. """
+        self.connection.close()
+
+    def get_meta(self, key: str) -> Union[str, None]:
+        """ Returns a metadata value, or None if missing. """
+        with self.lock:
+            row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        """ Stores a metadata value. """
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    @property
+    def is_ready(self) -> bool:
+        """ True once a full sync has completed. """
+        return self.get_meta("synced_at") is not None
+
+    def store_cards(self, cards: list[dict]) -> None:
+        """
+        Inserts or replaces cards in the catalog.
+
+        Args:
+            cards (list[dict]): Cards as returned by tools.Card_to_dict.
+        """
+        with self.lock, self.connection:
+            self.connection.executemany(
+                f"INSERT OR REPLACE INTO cards VALUES ({', '.join('?' * 13)})",
+                [card_row(card) for card in cards],
+            )
+
+    def card_ids(self, set_id: Union[str, None] = None) -> set[str]:
+        """ Returns the ids of every card stored in the catalog, or in one of its sets. """
+        with self.lock:
+            if set_id is None:
+                return {row[0] for row in self.connection.execute("SELECT id FROM cards")}
+            return {row[0] for row in self.connection.execute("SELECT id FROM cards WHERE set_id = ?", (set_id,))}
+
+    def card_names(self) -> list[tuple[str, str]]:
+        """ Returns the id and name of every card stored in the catalog. """
+        with self.lock:
+            return self.connection.execute("SELECT id, name FROM cards").fetchall()
+
+    def card_counts(self) -> dict[str, int]:
+        """ Returns the number of cards stored per set id. """
+        with self.lock:
+            return dict(self.connection.execute("SELECT set_id, COUNT(*) FROM cards GROUP BY set_id"))
+
+    def manifest(self) -> dict[str, dict]:
+        """ Returns the manifest of the synced sets, keyed by set id. """
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT set_id, name, card_total, card_official, release_date, card_listed, synced_at FROM manifest"
+            ).fetchall()
+        return {row[0]: {"name": row[1], "cardCount": {"total": row[2], "official": row[3]},
+                         "releaseDate": row[4], "cards": row[5], "syncedAt": row[6]} for row in rows}
+
+    def store_manifest(self, set: "Set") -> None:
+        """ Records a set as fully synced. """
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO manifest VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (set.id, set.name, set.cardCount.total, set.cardCount.official, set.releaseDate,
+                 len(set.cards or []), time.time()),
+            )
+
+    def remove_sets(self, set_ids: list[str]) -> None:
+        """ Deletes the cards and the manifest entries of sets no longer listed upstream. """
+        parameters = [(set_id,) for set_id in set_ids]
+        with self.lock, self.connection:
+            self.connection.executemany("DELETE FROM cards WHERE set_id = ?", parameters)
+            self.connection.executemany("DELETE FROM manifest WHERE set_id = ?", parameters)
+
+    def query(self, plan: QueryPlan) -> list[dict]:
+        """
+        Runs a query plan against the catalog.
+
+        Args:
+            plan (QueryPlan): The parsed query to evaluate.
+        Returns:
+            list[dict]: The matching cards, as returned by tools.Card_to_dict.
+        """
+        return [json.loads(row[0]) for row in self._select("data", plan)]
+
+    def query_ids(self, plan: QueryPlan) -> list[str]:
+        """
+        Runs a query plan against the catalog and only returns the card ids.
+
+        Args:
+            plan (QueryPlan): The parsed query to evaluate.
+        Returns:
+            list[str]: The ids of the matching cards.
+        """
+        return [row[0] for row in self._select("id", plan)]
+
+    def get_cards(self, card_ids: list[str]) -> list[dict]:
+        """
+        Returns stored cards from their ids, in the same order, skipping unknown ids.
+
+        Args:
+            card_ids (list[str]): The ids of the cards.
+        Returns:
+            list[dict]: The cards, as returned by tools.Card_to_dict.
+        """
+        with self.lock:
+            rows = dict(self.connection.execute(
+                f"SELECT id, data FROM cards WHERE id IN ({', '.join('?' * len(card_ids))})", card_ids
+            ))
+        return [json.loads(rows[card_id]) for card_id in card_ids if card_id in rows]
+
+    def _select(self, column: str, plan: QueryPlan) -> list[tuple]:
+        """ Runs the SQL translation of a query plan, selecting a single column. """
+        where, args = [], []
+        for filter in plan.filters:
+            clause, clause_args = self._filter(filter)
+            where.append(clause)
+            args.extend(clause_args)
+
+        sql = f"SELECT {column} FROM cards"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        if plan.sort:
+            field, order = plan.sort
+            sql += f" ORDER BY {self._column(field)} {'DESC' if order == 'desc' else 'ASC'}"
+        if plan.pagination:
+            page, per_page = plan.pagination
+            sql += " LIMIT ? OFFSET ?"
+            args.extend([per_page, (max(page, 1) - 1) * per_page])
+
+        with self.lock:
+            return self.connection.execute(sql, args).fetchall()
+
+    @staticmethod
+    def _column(field: str) -> str:
+        """ Returns the SQL expression reading a card field. """
+        if field in INDEXED_COLUMNS:
+            return INDEXED_COLUMNS[field]
+        # non indexed fields are read from the stored JSON document
+        path = "".join(f'."{part}"' for part in field.split(".") if part.replace("_", "").isalnum())
+        return f"json_extract(data, '${path}')"
+
+    def _filter(self, filter: Filter) -> tuple[str, list[Any]]:
+        """ Translates a single query filter into a SQL clause and its arguments. """
+        column, value = self._column(filter.field), filter.value
+        if filter.op == "null":
+            return f"{column} IS NULL", []
+        if filter.op == "notnull":
+            return f"{column} IS NOT NULL", []
+        if filter.op == "contains":
+            return f"{column} LIKE ? ESCAPE '\\'", [like_pattern(value)]
+        if filter.op == "not":
+            return f"({column} IS NULL OR {column} NOT LIKE ? ESCAPE '\\')", [like_pattern(value)]
+        operator = OPERATORS[filter.op]
+        if column == "types" and operator in ("=", "!="):
+            negate = "NOT " if operator == "!=" else ""
+            return f"{column} {negate}LIKE ? ESCAPE '\\'", [like_pattern(value, "%,", ",%")]
+        if column == "hp" or operator not in ("=", "!="):
+            try:
+                return f"{column} {operator} ?", [float(value)]
+            except ValueError:
+                pass
+        if column.startswith("json_extract"):
+            # JSON numbers (retreat, ...) are not equal to their text, compare numbers as numbers
+            try:
+                negate = "NOT " if operator == "!=" else ""
+                return f"{negate}({column} = ? OR {column} = ? COLLATE NOCASE)", [float(value), str(value)]
+            except ValueError:
+                pass
+        return f"{column} {operator} ? COLLATE NOCASE", [str(value)]
+
+
+_catalogs: dict[str, Catalog] = {}
+
+
+def open_catalog(language: str) -> Union[Catalog, None]:
+    """
+    Returns the catalog of a language if it has been synced.
+
+    Args:
+        language (str): The TCGdex language of the catalog.
+    Returns:
+        Catalog: The catalog, or None if disabled or not synced yet.
+    """
+    if not CATALOG_ENABLED:
+        return None
+    catalog = _catalogs.get(language)
+    if catalog is None:
+        path = default_path(language)
+        if not os.path.exists(path):
+            return None
+        catalog = _catalogs[language] = Catalog(path)
+    return catalog if catalog.is_ready else None
+
+
+def changed_sets(catalog: Catalog, set_resumes: list) -> dict[str, list[str]]:
+    """
+    Compares the sets listed by TCGdex with the catalog manifest.
+
+    Args:
+        catalog (Catalog): The catalog to compare with.
+        set_resumes (list[SetResume]): The sets currently listed by TCGdex.
+    Returns:
+        dict[str, list[str]]: The set ids that are new, whose card counts changed, that miss cards
+        locally (e.g. after an interrupted sync) and that are no longer listed upstream.
+    """
+    manifest = catalog.manifest()
+    counts = catalog.card_counts()
+    report = {"new": [], "changed": [], "incomplete": [], "removed": []}
+    for set in set_resumes:
+        stored = manifest.get(set.id)
+        if stored is None:
+            report["new"].append(set.id)
+        elif stored["cardCount"] != {"total": set.cardCount.total, "official": set.cardCount.official}:
+            report["changed"].append(set.id)
+        elif counts.get(set.id, 0) < stored["cards"]:
+            report["incomplete"].append(set.id)
+    listed = {set.id for set in set_resumes}
+    report["removed"] = [set_id for set_id in manifest if set_id not in listed]
+    return report
+
+
+async def sync(sdk: "TCGdex", catalog: Catalog, max_concurrency: int = hydration.MAX_CONCURRENCY,
+               incremental: bool = False) -> dict:
+    """
+    Downloads cards into the catalog.
+
+    A full sync walks every serie and set and fetches every card again. An incremental sync
+    compares the set list with the catalog manifest and only fetches the cards missing
+    locally from new sets, sets whose card count changed and sets left incomplete. Both
+    delete the cards of the sets no longer listed upstream.
+
+    Cards are stored in chunks and a set is only recorded in the manifest once all of its
+    cards are stored, so an interrupted sync resumes where it stopped.
+
+    Args:
+        sdk (TCGdex): The SDK instance to fetch from.
+        catalog (Catalog): The catalog to fill.
+        max_concurrency (int, optional): Maximum number of requests in flight.
+        incremental (bool, optional): Only fetch what changed since the last sync. Default is False.
+    Returns:
+        dict: The set ids per kind of change (new, changed, incomplete, removed) and the number of cards stored.
+    """
+    async def fetch_serie(serie_id: str):
+        return await asyncio.to_thread(sdk.serie.getSync, serie_id)
+
+    async def fetch_set(set_id: str):
+        return await asyncio.to_thread(sdk.set.getSync, set_id)
+
+    async def fetch_card(card_id: str):
+        return await asyncio.to_thread(sdk.card.getSync, card_id)
+
+    if incremental:
+        report = changed_sets(catalog, await asyncio.to_thread(sdk.set.listSync))
+        set_ids = report["new"] + report["changed"] + report["incomplete"]
+    else:
+        serie_ids = [serie.id for serie in await asyncio.to_thread(sdk.serie.listSync)]
+        series = await hydration.Hydrator(fetch_serie, max_concurrency).hydrate(serie_ids)
+        set_ids = [set.id for serie in series for set in serie.sets or []]
+        listed = {set_id for set_id in set_ids}
+        # the sets of a serie that failed to fetch are not removed
+        removed = [set_id for set_id in catalog.manifest() if set_id not in listed] if len(series) == len(serie_ids) else []
+        report = {"new": [], "changed": set_ids, "incomplete": [], "removed": removed}
+    catalog.remove_sets(report["removed"])
+    sets = await hydration.Hydrator(fetch_set, max_concurrency).hydrate(set_ids)
+
+    card_hydrator = hydration.Hydrator(fetch_card, max_concurrency)
+    total = 0
+    for set in sets:
+        card_ids = [card.id for card in set.cards or []]
+        if incremental:
+            stored = catalog.card_ids(set.id)
+            card_ids = [card_id for card_id in card_ids if card_id not in stored]
+
+        chunk, fetched = [], 0
+        async for _, card in card_hydrator.stream(card_ids):
+            if card is None:
+                continue
+            chunk.append(tools.Card_to_dict(card))
+            if len(chunk) >= SYNC_CHUNK_SIZE:
+                catalog.store_cards(chunk)
+                fetched, chunk = fetched + len(chunk), []
+        catalog.store_cards(chunk)
+        fetched += len(chunk)
+        total += fetched
+
+        # a set with failed cards is not recorded so the next incremental sync retries it
+        if fetched == len(card_ids):
+            catalog.store_manifest(set)
+        logging.info("Synced %d/%d cards of set '%s'", fetched, len(card_ids), set.id)
+
+    catalog.set_meta("synced_at", str(time.time()))
+    report["cards"] = total
+    return report
+
+
+def main() -> None:
+    """ Command line entry point: `python catalog.py sync [--incremental] [--language en]`. """
+    parser = argparse.ArgumentParser(description="Manage the local TCGdex card catalog.")
+    parser.add_argument("command", choices=["sync"])
+    parser.add_argument("--language", default=os.getenv("TCGDEX_LANGUAGE", "en"))
+    parser.add_argument("--path", default=None, help="location of the SQLite database")
+    parser.add_argument("--concurrency", type=int, default=hydration.MAX_CONCURRENCY)
+    parser.add_argument("--incremental", action="store_true", help="only fetch new, changed and missing cards")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    catalog = Catalog(args.path or default_path(args.language))
+    from tcgdexsdk import TCGdex
+
+    report = asyncio.run(sync(TCGdex(args.language), catalog, args.concurrency, args.incremental))
+    print(json.dumps(report, indent=2))
+    catalog.close()
+
+
+if __name__ == "__main__":
+    main()
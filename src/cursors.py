@@ -0,0 +1,130 @@
+# Server-side state of paginated card queries, referenced by opaque cursors.
+import asyncio
+import os
+import secrets
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Union
+
+from cache import SharedStore
+from query_plan import QueryPlan
+
+PAGE_SIZE = int(os.getenv("TCGDEX_PAGE_SIZE", "20"))
+CURSOR_TTL = float(os.getenv("TCGDEX_CURSOR_TTL", "600"))
+CURSOR_MAXSIZE = int(os.getenv("TCGDEX_CURSOR_MAXSIZE", "1000"))
+
+
+@dataclass
+class CursorState:
+    """ Progress of a paginated query between two calls. """
+
+    plan: QueryPlan
+    page_size: int
+    fields: Union[list[str], None] = None
+    # TCGdex language of the query and of its cards
+    language: str = "en"
+    # card ids resolved from the query but not returned yet
+    ids: list[str] = field(default_factory=list)
+    # next page to request from the card list (TCGdex or local catalog), None once exhausted
+    next_list_page: Union[int, None] = 1
+    # background task preparing the next page of cards
+    prefetch: Union[asyncio.Task, None] = None
+    expires: float = 0.0
+    # number of pages returned so far, tells which copy of a shared cursor is the most recent
+    pages: int = 0
+
+    @property
+    def exhausted(self) -> bool:
+        """ True when there is nothing left to return. """
+        return not self.ids and self.next_list_page is None
+
+    def to_dict(self) -> dict:
+        """ Returns a JSON serializable form of the state, without its prefetch. """
+        return {"plan": self.plan.to_dict(), "page_size": self.page_size, "fields": self.fields,
+                "language": self.language, "ids": self.ids, "next_list_page": self.next_list_page, "pages": self.pages}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "CursorState":
+        """ Rebuilds a state from the output of to_dict. """
+        return cls(QueryPlan.from_dict(data["plan"]), data["page_size"], data["fields"], data["language"],
+                   data["ids"], data["next_list_page"], pages=data["pages"])
+
+
+class CursorStore:
+    """
+    Keeps CursorState objects for a limited time under random opaque tokens.
+
+    With a shared store, a copy of every state is also written to it so that the
+    next page can be requested from any process of the server.
+    """
+
+    def __init__(self, ttl: float = CURSOR_TTL, maxsize: int = CURSOR_MAXSIZE, store: Union[SharedStore, None] = None):
+        """
+        Args:
+            ttl (float, optional): Seconds a cursor stays valid after its last use. Default is TCGDEX_CURSOR_TTL.
+            maxsize (int, optional): Maximum number of open cursors. Default is TCGDEX_CURSOR_MAXSIZE.
+            store (SharedStore, optional): Store shared with the other processes. Default is None (this process only).
+        """
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.store = store
+        self._states: OrderedDict[str, CursorState] = OrderedDict()
+
+    def __len__(self) -> int:
+        """ Number of open cursors. """
+        return len(self._states)
+
+    def put(self, state: CursorState, token: Union[str, None] = None) -> str:
+        """
+        Stores a state and returns its cursor.
+
+        Args:
+            state (CursorState): The state to store.
+            token (str, optional): The cursor to reuse. Default is None (a new cursor is generated).
+        Returns:
+            str: The cursor referencing the state.
+        """
+        self._expire()
+        token = token or secrets.token_urlsafe(16)
+        state.expires = time.monotonic() + self.ttl
+        self._states[token] = state
+        self._states.move_to_end(token)
+        if self.store is not None:
+            self.store.set("cursors", token, state.to_dict(), time.time() + self.ttl)
+        while len(self._states) > self.maxsize:
+            self._discard(self._states.popitem(last=False)[1])
+        return token
+
+    def pop(self, token: str) -> Union[CursorState, None]:
+        """
+        Removes and returns the state of a cursor.
+
+        Args:
+            token (str): The cursor.
+        Returns:
+            CursorState: The state, or None if the cursor is unknown or expired.
+        """
+        self._expire()
+        state = self._states.pop(token, None)
+        if self.store is not None:
+            shared = self.store.get("cursors", token)
+            self.store.delete("cursors", [token])
+            # another process has returned pages of this cursor since this copy was stored
+            if shared is not None and (state is None or shared[1]["pages"] > state.pages):
+                if state is not None:
+                    self._discard(state)
+                state = CursorState.from_dict(shared[1])
+        return state
+
+    def _expire(self) -> None:
+        """ Drops the expired cursors. """
+        now = time.monotonic()
+        for token in [token for token, state in self._states.items() if state.expires < now]:
+            self._discard(self._states.pop(token))
+
+    @staticmethod
+    def _discard(state: CursorState) -> None:
+        """ Cancels the pending prefetch of a dropped state. """
+        if state.prefetch is not None:
+            state.prefetch.cancel()
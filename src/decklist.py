@@ -0,0 +1,89 @@
+# Parsing of the decklists exported by Pokemon TCG Live and Pokemon TCG Online.
+import re
+from dataclasses import dataclass
+from typing import Union
+
+from card_map import normalize_number
+
+# "4 Pikachu ex SVI 57": count, name, set code (PTCGL code or TCGdex set id), collector number
+CARD_LINE = re.compile(r"^\s*\*?\s*(\d+)\s+(.+?)\s+([A-Za-z0-9][A-Za-z0-9.-]*)\s+([A-Za-z]*\d+[A-Za-z]*)\s*$")
+# "Pokémon: 12", "Trainer: 36", "Energy: 12", "Total Cards: 60"
+SECTION_LINE = re.compile(r"^\s*##?\s*(Pok[eé]mon|Trainer|Energy)\s*(?::\s*\d*)?\s*$|^\s*(Pok[eé]mon|Trainer|Energy)\s*:\s*\d*\s*$", re.IGNORECASE)
+TOTAL_LINE = re.compile(r"^\s*Total Cards\s*:", re.IGNORECASE)
+# "4 Basic Fire Energy", basic energies may be listed without set code nor number
+COUNT_LINE = re.compile(r"^\s*\*?\s*(\d+)\s+(.+?)\s*$")
+
+# energy symbols of the PTCGL exports ("Basic {R} Energy") and the types they stand for
+ENERGY_SYMBOLS = {"G": "Grass", "R": "Fire", "W": "Water", "L": "Lightning", "P": "Psychic",
+                  "F": "Fighting", "D": "Darkness", "M": "Metal", "Y": "Fairy"}
+# "Basic {R} Energy" (PTCGL), "Basic Fire Energy", "Fire Energy" (PTCGO)
+BASIC_ENERGY = re.compile(r"^(?:Basic\s+)?(?:\{([A-Z])\}|(%s))\s+Energy$" % "|".join(ENERGY_SYMBOLS.values()), re.IGNORECASE)
+
+
+@dataclass
+class DeckLine:
+    """ One card line of a decklist. """
+
+    count: int
+    name: str
+    set_code: str
+    number: str
+    section: Union[str, None]
+    line: str
+    # type of a basic energy ("Fire"), None for the other cards
+    energy: Union[str, None] = None
+
+
+def basic_energy(name: str) -> Union[str, None]:
+    """ Returns the type of a basic energy from its decklist name ("Basic {R} Energy" -> "Fire"), None for other cards. """
+    match = BASIC_ENERGY.match(name.strip())
+    if match is None:
+        return None
+    symbol, type = match.groups()
+    return ENERGY_SYMBOLS.get(symbol.upper()) if symbol else type.capitalize()
+
+
+def parse(text: str) -> tuple[list[DeckLine], list[str]]:
+    """
+    Parses a decklist in the PTCGL / PTCGO export format.
+
+    Args:
+        text (str): The decklist, one "<count> <name> <set code> <number>" line per card, section headers
+            ("Pokémon: 12", ...) and blank lines are allowed. The set code and number of basic energies are optional,
+            PTCGL exports them with codes that are not sets ("Basic {R} Energy Energy 2", "Basic {R} Energy SVE 2").
+    Returns:
+        tuple: The card lines, and the lines that could not be parsed.
+    """
+    lines, unparsed = [], []
+    section = None
+    for raw in text.splitlines():
+        if not raw.strip() or TOTAL_LINE.match(raw):
+            continue
+        header = SECTION_LINE.match(raw)
+        if header:
+            section = (header.group(1) or header.group(2)).capitalize().replace("Pokemon", "Pokémon")
+            continue
+        match = CARD_LINE.match(raw)
+        if match is not None:
+            count, name, set_code, number = match.groups()
+        elif (match := COUNT_LINE.match(raw)) is not None and basic_energy(match.group(2)):
+            (count, name), set_code, number = match.groups(), "", ""
+        else:
+            unparsed.append(raw.strip())
+            continue
+        lines.append(DeckLine(int(count), name.strip(), set_code, number, section, raw.strip(), basic_energy(name)))
+    return lines, unparsed
+
+
+def find_card(set_cards: list[dict], number: str) -> Union[str, None]:
+    """
+    Finds a card of a set from its collector number.
+
+    Args:
+        set_cards (list[dict]): The cards of the set, with their id and localId.
+        number (str): The collector number of the decklist ("57", "057", "TG05").
+    Returns:
+        str: The TCGdex id of the card, None if the set has no card with that number.
+    """
+    key = normalize_number(number)
+    return next((card["id"] for card in set_cards if normalize_number(card.get("localId")) == key), None)
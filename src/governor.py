@@ -0,0 +1,317 @@
+# Shared governor of the calls made to an upstream API (TCGdex, JustTCG): client-side
+# rate limiting, retries of transient failures and circuit breaking.
+import asyncio
+import email.utils
+import logging
+import os
+import random
+import time
+import urllib.error
+from collections.abc import Awaitable, Callable
+from typing import Any, TypeVar, Union
+
+import httpx
+
+import metrics
+
+T = TypeVar("T")
+
+# HTTP status codes worth retrying, anything else (e.g. 404) is final
+TRANSIENT_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+
+class UpstreamError(Exception):
+    """ Raised when a call to an upstream API failed for good, describes why. """
+
+    def __init__(self, provider: str, kind: str, message: str,
+                 status: Union[int, None] = None, retry_after: Union[float, None] = None):
+        """
+        Args:
+            provider (str): Name of the upstream API.
+            kind (str): One of rate_limited, circuit_open, http, timeout, network.
+            message (str): Description of the failure.
+            status (int, optional): HTTP status code of the last response.
+            retry_after (float, optional): Seconds to wait before calling the provider again.
+        """
+        super().__init__(message)
+        self.provider = provider
+        self.kind = kind
+        self.message = message
+        self.status = status
+        self.retry_after = retry_after
+
+    def __str__(self) -> str:
+        text = f"{self.provider} {self.kind}"
+        if self.status is not None:
+            text += f" (HTTP {self.status})"
+        text += f": {self.message}"
+        if self.retry_after is not None:
+            text += f", retry after {self.retry_after:.0f}s"
+        return text
+
+    def to_dict(self) -> dict:
+        """ Returns the error as a JSON serializable dictionary. """
+        return {
+            "provider": self.provider,
+            "kind": self.kind,
+            "status": self.status,
+            "retryAfter": self.retry_after,
+            "message": self.message,
+        }
+
+
+def parse_retry_after(value: Union[str, None]) -> Union[float, None]:
+    """ Returns the delay in seconds of a Retry-After header (seconds or HTTP date). """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def classify(error: BaseException) -> tuple[str, Union[int, None], Union[float, None], bool]:
+    """
+    Describes a failed call, for httpx and urllib (tcgdexsdk) errors.
+
+    Returns:
+        tuple: (kind, HTTP status, Retry-After delay, transient).
+    """
+    if isinstance(error, httpx.HTTPStatusError):
+        status, headers = error.response.status_code, error.response.headers
+    elif isinstance(error, urllib.error.HTTPError):
+        status, headers = error.code, error.headers or {}
+    elif isinstance(error, (httpx.TimeoutException, TimeoutError)):
+        return "timeout", None, None, True
+    elif isinstance(error, (httpx.TransportError, urllib.error.URLError, ConnectionError)):
+        return "network", None, None, True
+    else:
+        return "error", None, None, False
+    retry_after = parse_retry_after(headers.get("Retry-After"))
+    kind = "rate_limited" if status == 429 else "http"
+    return kind, status, retry_after, status in TRANSIENT_STATUS
+
+
+def describe(error: BaseException) -> str:
+    """ Returns a one line description of a failed call. """
+    if isinstance(error, httpx.HTTPStatusError):
+        return f"{error.response.reason_phrase or 'error'} for {error.request.method} {error.request.url}"
+    return str(error) or type(error).__name__
+
+
+class TokenBucket:
+    """ Client-side rate limiter allowing `rate` calls per second with bursts of `burst` calls. """
+
+    def __init__(self, rate: float, burst: int):
+        """
+        Args:
+            rate (float): Tokens added per second, 0 disables the limit.
+            burst (int): Maximum number of tokens.
+        """
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        # no token is handed out before this time (set from Retry-After)
+        self.paused_until = 0.0
+
+    def pause(self, seconds: float) -> None:
+        """ Stops handing out tokens for the given time and drops the saved ones. """
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+    async def acquire(self) -> None:
+        """ Waits until a call is allowed. """
+        while True:
+            # nothing is awaited between reading and taking the tokens, so the check is atomic on the
+            # event loop, and the waits below do not hold up the callers that can go once they end
+            now = time.monotonic()
+            if now < self.paused_until:
+                wait = self.paused_until - now
+            elif self.rate <= 0:
+                return
+            else:
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            await asyncio.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Fails fast once `threshold` consecutive calls failed, until `reset_timeout` seconds
+    have passed. A single probe call is then let through and closes the circuit on success.
+    """
+
+    def __init__(self, threshold: int, reset_timeout: float):
+        """
+        Args:
+            threshold (int): Consecutive failures opening the circuit, 0 disables the breaker.
+            reset_timeout (float): Seconds the circuit stays open before a probe.
+        """
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Union[float, None] = None
+        self.probing = False
+
+    @property
+    def state(self) -> str:
+        """ closed, open or half_open. """
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    def retry_after(self) -> float:
+        """ Seconds before the next probe is allowed. """
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def allow(self) -> bool:
+        """ Checks if a call may be made, and reserves the probe of a half open circuit. """
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        """ Closes the circuit. """
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self) -> None:
+        """ Counts a failure, opening the circuit at the threshold or when the probe failed. """
+        self.failures += 1
+        if self.probing or (self.threshold > 0 and self.failures >= self.threshold):
+            if self.opened_at is None or self.probing:
+                logging.warning("Circuit opened after %d consecutive failures.", self.failures)
+            self.opened_at = time.monotonic()
+        self.probing = False
+
+
+class Governor:
+    """
+    Runs the calls made to one upstream API through a token bucket and a circuit breaker,
+    retrying transient failures with jittered exponential backoff.
+
+    A 429 response pauses the bucket for the Retry-After delay so that every pending call
+    waits instead of hammering a throttling provider. Non idempotent calls are only
+    retried on 429, since the provider did not process them.
+    """
+
+    def __init__(self, name: str, rate: float, burst: int, retries: int, backoff: float,
+                 max_backoff: float = 30.0, threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Args:
+            name (str): Name of the upstream API, used in errors.
+            rate (float): Maximum number of calls per second, 0 disables the limit.
+            burst (int): Maximum number of calls made at once after an idle period.
+            retries (int): Number of retries on transient failures.
+            backoff (float): Base delay in seconds between retries.
+            max_backoff (float, optional): Maximum delay between retries. Default is 30.
+            threshold (int, optional): Consecutive failures opening the circuit. Default is 5.
+            reset_timeout (float, optional): Seconds the circuit stays open. Default is 30.
+        """
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(threshold, reset_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    async def call(self, request: Callable[[], Awaitable[T]], idempotent: bool = True, endpoint: str = "") -> T:
+        """
+        Makes an upstream call.
+
+        Args:
+            request (Callable[[], Awaitable[T]]): Coroutine function making the call, called once per attempt.
+            idempotent (bool, optional): If the call can be retried on any transient failure. Default is True.
+            endpoint (str, optional): Name of the endpoint called, used in the metrics.
+        Returns:
+            T: The result of the call.
+        Raises:
+            UpstreamError: If the circuit is open or the call failed for good.
+        """
+        for attempt in range(self.retries + 1):
+            if not self.breaker.allow():
+                raise UpstreamError(self.name, "circuit_open", "the provider is failing, not calling it",
+                                    retry_after=round(self.breaker.retry_after(), 1))
+            await self.bucket.acquire()
+            try:
+                with metrics.upstream_call(self.name, endpoint):
+                    result = await request()
+            except asyncio.CancelledError:
+                self.breaker.probing = False
+                raise
+            except Exception as e:
+                kind, status, retry_after, transient = classify(e)
+                if kind == "rate_limited":
+                    # throttling is not an outage, only slow everyone down
+                    self.breaker.probing = False
+                    self.bucket.pause(retry_after if retry_after is not None else self._delay(attempt))
+                elif transient:
+                    self.breaker.record_failure()
+                else:
+                    # final answers (404, ...) mean the provider is up
+                    self.breaker.record_success()
+                retry = transient and (idempotent or kind == "rate_limited")
+                if retry and attempt < self.retries:
+                    logging.warning("%s call failed (%s), retrying: %s", self.name, kind, describe(e))
+                    if kind != "rate_limited":
+                        await asyncio.sleep(self._delay(attempt))
+                    continue
+                raise UpstreamError(self.name, kind, describe(e), status, retry_after) from e
+            self.breaker.record_success()
+            return result
+
+    def _delay(self, attempt: int) -> float:
+        """ Jittered exponential backoff delay of a retry. """
+        return min(self.max_backoff, self.backoff * 2 ** attempt) * (0.5 + random.random())
+
+    def stats(self) -> dict[str, Any]:
+        """ Returns the current state of the governor. """
+        return {
+            "provider": self.name,
+            "circuit": self.breaker.state,
+            "consecutiveFailures": self.breaker.failures,
+            "tokens": round(self.bucket.tokens, 2),
+            "pausedFor": round(max(0.0, self.bucket.paused_until - time.monotonic()), 1),
+        }
+
+
+def from_env(name: str, prefix: str, rate: float, burst: int, retries: int, backoff: float) -> Governor:
+    """
+    Builds a Governor configured through the <prefix>_* environment variables.
+
+    Args:
+        name (str): Name of the upstream API.
+        prefix (str): Prefix of the environment variables (e.g. JUSTTCG).
+        rate (float): Default maximum number of calls per minute.
+        burst (int): Default burst size.
+        retries (int): Default number of retries.
+        backoff (float): Default base delay between retries.
+    Returns:
+        Governor: The configured governor.
+    """
+    return Governor(
+        name,
+        rate=float(os.getenv(f"{prefix}_RATE_LIMIT", str(rate))) / 60,
+        burst=int(os.getenv(f"{prefix}_RATE_BURST", str(burst))),
+        retries=int(os.getenv(f"{prefix}_RETRIES", str(retries))),
+        backoff=float(os.getenv(f"{prefix}_RETRY_BACKOFF", str(backoff))),
+        max_backoff=float(os.getenv(f"{prefix}_MAX_BACKOFF", "30")),
+        threshold=int(os.getenv(f"{prefix}_BREAKER_THRESHOLD", "5")),
+        reset_timeout=float(os.getenv(f"{prefix}_BREAKER_RESET", "30")),
+    )
@@ -0,0 +1,128 @@
+# Bounded-concurrency fetching of TCGdex objects (cards, sets, series) from their ids.
+import asyncio
+import logging
+import os
+import random
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable
+from typing import Any, Union
+
+MAX_CONCURRENCY = int(os.getenv("TCGDEX_MAX_CONCURRENCY", "16"))
+RETRIES = int(os.getenv("TCGDEX_RETRIES", "2"))
+RETRY_BACKOFF = float(os.getenv("TCGDEX_RETRY_BACKOFF", "0.25"))
+DEADLINE = float(os.getenv("TCGDEX_HYDRATION_DEADLINE", "0")) or None
+
+
+def is_transient(error: BaseException) -> bool:
+    """ Checks if a failed upstream call is worth retrying, with the same rules as the governor (see governor.classify). """
+    import governor
+
+    return governor.classify(error)[3]
+
+
+class Hydrator:
+    """
+    Fetches the full objects behind a list of ids with a fixed pool of workers.
+
+    At most `max_concurrency` upstream calls are in flight at any time, whatever the
+    number of ids, transient failures are retried with exponential backoff and an
+    optional deadline bounds the total time spent. Calls made through a governor are
+    already retried by it, their hydrators are built with `retries=0`.
+    """
+
+    def __init__(self,
+                 fetch: Callable[[str], Awaitable[Any]],
+                 max_concurrency: int = MAX_CONCURRENCY,
+                 retries: int = RETRIES,
+                 backoff: float = RETRY_BACKOFF):
+        """
+        Args:
+            fetch (Callable[[str], Awaitable[Any]]): Coroutine function fetching one object from its id.
+            max_concurrency (int, optional): Maximum number of calls in flight. Default is TCGDEX_MAX_CONCURRENCY.
+            retries (int, optional): Number of retries on transient failures. Default is TCGDEX_RETRIES.
+            backoff (float, optional): Base delay in seconds between retries. Default is TCGDEX_RETRY_BACKOFF.
+        """
+        self.fetch = fetch
+        self.max_concurrency = max(1, max_concurrency)
+        self.retries = retries
+        self.backoff = backoff
+
+    async def fetch_one(self, id: str) -> Any:
+        """
+        Fetches a single object, retrying transient failures.
+
+        Args:
+            id (str): The id of the object to fetch.
+        Returns:
+            Any: The fetched object, or None if it could not be fetched.
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                return await self.fetch(id)
+            except Exception as e:
+                if attempt < self.retries and is_transient(e):
+                    await asyncio.sleep(self.backoff * 2 ** attempt * (0.5 + random.random()))
+                    continue
+                logging.error("Error fetching '%s': %s", id, e)
+                return None
+
+    async def stream(self, ids: list[str], deadline: Union[float, None] = DEADLINE) -> AsyncIterator[tuple[int, Any]]:
+        """
+        Fetches the objects and yields them as soon as they arrive.
+
+        Args:
+            ids (list[str]): The ids of the objects to fetch.
+            deadline (float, optional): Maximum number of seconds to spend, the remaining ids are dropped once it is reached.
+        Yields:
+            tuple[int, Any]: The position of the id in `ids` and the fetched object (None on failure).
+        """
+        pending: asyncio.Queue = asyncio.Queue()
+        for item in enumerate(ids):
+            pending.put_nowait(item)
+        done: asyncio.Queue = asyncio.Queue()
+
+        async def worker() -> None:
+            while True:
+                try:
+                    index, id = pending.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                await done.put((index, await self.fetch_one(id)))
+
+        workers = [asyncio.create_task(worker()) for _ in range(min(self.max_concurrency, len(ids)))]
+        end = time.monotonic() + deadline if deadline else None
+        try:
+            for count in range(len(ids)):
+                timeout = None if end is None else max(0.0, end - time.monotonic())
+                try:
+                    yield await asyncio.wait_for(done.get(), timeout)
+                except asyncio.TimeoutError:
+                    logging.warning("Deadline of %ss reached, returning %d partial results.", deadline, count)
+                    return
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def hydrate(self, ids: list[str], deadline: Union[float, None] = DEADLINE,
+                      on_progress: Union[Callable[[int, int], Awaitable[None]], None] = None) -> list[Any]:
+        """
+        Fetches the objects and returns them in the same order as the ids.
+
+        Ids that failed, or were not fetched before the deadline, are left out.
+
+        Args:
+            ids (list[str]): The ids of the objects to fetch.
+            deadline (float, optional): Maximum number of seconds to spend.
+            on_progress (Callable[[int, int], Awaitable[None]], optional): Called with (fetched, total) after each object.
+        Returns:
+            list[Any]: The fetched objects.
+        """
+        results: list[Any] = [None] * len(ids)
+        count = 0
+        async for index, item in self.stream(ids, deadline):
+            results[index] = item
+            count += 1
+            if on_progress is not None:
+                await on_progress(count, len(ids))
+        return [item for item in results if item is not None]
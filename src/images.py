@@ -0,0 +1,299 @@
+# Content-addressed local store of the TCGdex card, set and serie images.
+import asyncio
+import base64
+import hashlib
+import logging
+import mmap
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Union
+
+import httpx
+
+import cache
+import governor
+import hydration
+
+IMAGE_CACHE_DIR = os.getenv("TCGDEX_IMAGE_CACHE_DIR", os.path.join(cache.CACHE_DIR, "images"))
+# size cap of the stored images, the least recently used ones are deleted above it
+IMAGE_CACHE_MB = float(os.getenv("TCGDEX_IMAGE_CACHE_MB", "512"))
+# maximum number of image downloads in flight
+IMAGE_CONCURRENCY = int(os.getenv("TCGDEX_IMAGE_CONCURRENCY", "8"))
+IMAGE_TIMEOUT = float(os.getenv("TCGDEX_IMAGE_TIMEOUT", "30"))
+
+# the assets CDN has its own limits, see governor.from_env for the TCGDEX_ASSETS_* variables
+upstream = governor.from_env("TCGdex assets", "TCGDEX_ASSETS", rate=600, burst=32, retries=2, backoff=0.25)
+
+MIME_TYPES = {"png": "image/png", "jpg": "image/jpeg", "jpeg": "image/jpeg", "webp": "image/webp"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    size INTEGER,
+    mime_type TEXT,
+    last_access REAL
+);
+CREATE INDEX IF NOT EXISTS idx_blobs_last_access ON blobs(last_access);
+CREATE TABLE IF NOT EXISTS urls (
+    url TEXT PRIMARY KEY,
+    digest TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_urls_digest ON urls(digest);
+"""
+
+_client: Union[httpx.AsyncClient, None] = None
+_client_loop: Union[asyncio.AbstractEventLoop, None] = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """ Returns the shared HTTP client of the image downloads, created on first use and per event loop. """
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        _client = httpx.AsyncClient(timeout=IMAGE_TIMEOUT, follow_redirects=True,
+                                    limits=httpx.Limits(max_connections=max(1, IMAGE_CONCURRENCY)))
+        _client_loop = loop
+    return _client
+
+
+async def aclose() -> None:
+    """ Closes the shared HTTP client. """
+    global _client, _client_loop
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+    _client_loop = None
+
+
+def mime_type(url: str, content_type: Union[str, None] = None) -> str:
+    """ Returns the MIME type of an image from its Content-Type, else from the extension of its url. """
+    if content_type and content_type.startswith("image/"):
+        return content_type.split(";")[0].strip()
+    return MIME_TYPES.get(url.rsplit(".", 1)[-1].lower(), "application/octet-stream")
+
+
+class ImageStore:
+    """
+    On-disk store of images addressed by the SHA-256 of their content.
+
+    An image shared by several urls (e.g. the same art in several languages) is stored once.
+    The urls, sizes and last access times are kept in an SQLite index, so the store is shared
+    by the workers of an HTTP deployment, and the least recently used images are deleted once
+    the total size exceeds `max_bytes`. Images are read back through mmap.
+    """
+
+    def __init__(self, directory: str = IMAGE_CACHE_DIR, max_bytes: int = int(IMAGE_CACHE_MB * 1024 * 1024)):
+        """
+        Args:
+            directory (str, optional): Directory of the images and of their index. Default is TCGDEX_IMAGE_CACHE_DIR.
+            max_bytes (int, optional): Maximum total size of the images. Default is TCGDEX_IMAGE_CACHE_MB.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        # several worker processes may use the same index, they wait for each other's writes
+        self.connection = sqlite3.connect(os.path.join(directory, "index.sqlite"), timeout=30, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        # url -> download in flight, concurrent requests of the same image share it
+        self._downloads: dict[str, asyncio.Task] = {}
+        self._loop: Union[asyncio.AbstractEventLoop, None] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def close(self) -> None:
+        """ Closes the index. """
+        self.connection.close()
+
+    def path(self, digest: str) -> str:
+        """ Returns the location of an image from its digest. """
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def lookup(self, url: str) -> Union[dict, None]:
+        """
+        Finds a stored image and marks it as recently used.
+
+        Args:
+            url (str): The url of the image.
+        Returns:
+            dict: {"url", "digest", "path", "bytes", "mimeType"}, None if the image is not stored.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT blobs.digest, size, mime_type FROM urls JOIN blobs ON blobs.digest = urls.digest WHERE url = ?",
+                (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            if not os.path.exists(self.path(row[0])):
+                # deleted behind our back, e.g. by hand
+                with self.connection:
+                    self.connection.execute("DELETE FROM blobs WHERE digest = ?", (row[0],))
+                return None
+            with self.connection:
+                self.connection.execute("UPDATE blobs SET last_access = ? WHERE digest = ?", (time.time(), row[0]))
+        return {"url": url, "digest": row[0], "path": self.path(row[0]), "bytes": row[1], "mimeType": row[2]}
+
+    def add(self, url: str, temp_path: str, digest: str, size: int, mime: str) -> dict:
+        """
+        Moves a downloaded image into the store, indexes it and evicts the least recently used images above the cap.
+
+        Args:
+            url (str): The url of the image.
+            temp_path (str): The downloaded file, in the store directory.
+            digest (str): The SHA-256 of its content.
+            size (int): Its size in bytes.
+            mime (str): Its MIME type.
+        Returns:
+            dict: The stored image, as returned by lookup.
+        """
+        path = self.path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            os.remove(temp_path)
+        else:
+            os.replace(temp_path, path)
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?)", (digest, size, mime, time.time()))
+            self.connection.execute("INSERT OR REPLACE INTO urls VALUES (?, ?)", (url, digest))
+            self._evict(keep=digest)
+        return {"url": url, "digest": digest, "path": path, "bytes": size, "mimeType": mime}
+
+    def _evict(self, keep: str) -> None:
+        """ Deletes the least recently used images until the total size fits the cap. """
+        total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for digest, size in self.connection.execute(
+                "SELECT digest, size FROM blobs WHERE digest != ? ORDER BY last_access", (keep,)).fetchall():
+            try:
+                os.remove(self.path(digest))
+                if not os.listdir(os.path.dirname(self.path(digest))):
+                    os.rmdir(os.path.dirname(self.path(digest)))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                # e.g. mapped by a reader on Windows, try again on the next eviction
+                logging.warning("Image %s not evicted: %s", digest, e)
+                continue
+            self.connection.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+            self.connection.execute("DELETE FROM urls WHERE digest = ?", (digest,))
+            self.evictions += 1
+            total -= size
+            if total <= self.max_bytes:
+                return
+
+    async def fetch(self, url: str) -> dict:
+        """
+        Returns a stored image, downloading it first if needed.
+
+        Args:
+            url (str): The url of the image.
+        Returns:
+            dict: {"url", "digest", "path", "bytes", "mimeType", "cached"}.
+        Raises:
+            governor.UpstreamError: If the download failed.
+        """
+        image = await asyncio.to_thread(self.lookup, url)
+        if image is not None:
+            self.hits += 1
+            return image | {"cached": True}
+        self.misses += 1
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._downloads, self._loop = {}, loop
+        task = self._downloads.get(url)
+        if task is None:
+            task = self._downloads[url] = asyncio.ensure_future(self._download(url))
+            task.add_done_callback(lambda _: self._downloads.pop(url, None))
+        return await asyncio.shield(task) | {"cached": False}
+
+    async def _download(self, url: str) -> dict:
+        """ Streams an image to a temporary file while hashing it, then adds it to the store. """
+        client = get_client()
+
+        async def request() -> tuple[str, str, int, str]:
+            digest = hashlib.sha256()
+            size = 0
+            descriptor, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".part")
+            try:
+                with os.fdopen(descriptor, "wb") as file:
+                    async with client.stream("GET", url) as response:
+                        response.raise_for_status()
+                        async for chunk in response.aiter_bytes():
+                            digest.update(chunk)
+                            file.write(chunk)
+                            size += len(chunk)
+                        content_type = response.headers.get("content-type")
+            except BaseException:
+                os.remove(temp_path)
+                raise
+            return temp_path, digest.hexdigest(), size, mime_type(url, content_type)
+
+        temp_path, digest, size, mime = await upstream.call(request, endpoint="image")
+        return await asyncio.to_thread(self.add, url, temp_path, digest, size, mime)
+
+    async def fetch_all(self, urls: list[str], max_concurrency: int = IMAGE_CONCURRENCY) -> list[Union[dict, None]]:
+        """
+        Fetches images concurrently.
+
+        Args:
+            urls (list[str]): The urls of the images.
+            max_concurrency (int, optional): Maximum number of downloads in flight. Default is TCGDEX_IMAGE_CONCURRENCY.
+        Returns:
+            list: The stored image of each url (see fetch), None for the failed downloads.
+        """
+        images: list[Union[dict, None]] = [None] * len(urls)
+        # retries are made by the governor
+        async for position, image in hydration.Hydrator(self.fetch, max_concurrency, retries=0).stream(urls, deadline=None):
+            images[position] = image
+        return images
+
+    def stats(self) -> dict:
+        """ Returns the number and total size of the stored images and the hit, miss and eviction counts. """
+        with self.lock:
+            images, size = self.connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+        return {"images": images, "bytes": size, "maxBytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+def read_base64(image: dict) -> str:
+    """
+    Returns the base64 encoding of a stored image.
+
+    The file is mapped in memory and encoded from the mapping, it is never copied in a bytes object.
+
+    Args:
+        image (dict): The stored image, as returned by ImageStore.fetch.
+    Returns:
+        str: The base64 encoded content.
+    """
+    with open(image["path"], "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return ""
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+            return base64.b64encode(mapping).decode("ascii")
+
+
+_store: Union[ImageStore, None] = None
+
+
+def open_store() -> ImageStore:
+    """ Returns the image store of TCGDEX_IMAGE_CACHE_DIR, opened on first use. """
+    global _store
+    if _store is None:
+        _store = ImageStore()
+    return _store
+
+
+def close_store() -> None:
+    """ Closes the image store opened by open_store, if any. """
+    global _store
+    if _store is not None:
+        _store.close()
+        _store = None
@@ -1,41 +1,471 @@
 # Handling of price queries through JustTCG api.
-import requests
+import asyncio
+import importlib.util
+import json
 import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from collections.abc import AsyncIterator, Awaitable, Callable
 from typing import Union
 import logging
 
+import httpx
+
+import governor
+
 API_KEY = os.getenv('JUSTTCG_API_KEY')
 
-BASE_URL = 'https://api.justtcg.com/v1'
+# can be pointed at a mirror or at the local stand-in server of the benchmarks
+BASE_URL = os.getenv("JUSTTCG_BASE_URL", 'https://api.justtcg.com/v1')
+
+# HTTP client configuration, every value can be overridden through the environment
+TIMEOUT = float(os.getenv("JUSTTCG_TIMEOUT", "15"))
+CONNECT_TIMEOUT = float(os.getenv("JUSTTCG_CONNECT_TIMEOUT", "5"))
+MAX_CONNECTIONS = int(os.getenv("JUSTTCG_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("JUSTTCG_MAX_KEEPALIVE_CONNECTIONS", "10"))
+KEEPALIVE_EXPIRY = float(os.getenv("JUSTTCG_KEEPALIVE_EXPIRY", "30"))
+# HTTP/2 is only used when the optional `h2` package is installed (httpx[http2])
+HTTP2 = os.getenv("JUSTTCG_HTTP2", "1") != "0" and importlib.util.find_spec("h2") is not None
+
+# Batch lookups: maximum number of queries per POST /cards (depends on the JustTCG plan)
+# and maximum number of batches in flight at the same time
+BATCH_SIZE = int(os.getenv("JUSTTCG_BATCH_SIZE", "20"))
+BATCH_CONCURRENCY = int(os.getenv("JUSTTCG_BATCH_CONCURRENCY", "4"))
+
+# Paginated search: number of pages requested ahead of the one being consumed
+READ_AHEAD = int(os.getenv("JUSTTCG_READ_AHEAD", "2"))
+
+# Coalescing: identifier lookups made while requests are in flight wait this window (milliseconds) to be
+# merged into one POST /cards, 0 sends every lookup on its own (identical requests in flight are still shared)
+COALESCE_WINDOW = float(os.getenv("JUSTTCG_COALESCE_WINDOW_MS", "20")) / 1000
+
+# Price cache: a variant is served from the cache while its lastUpdated is less than
+# CACHE_MAX_STALENESS seconds old, or during CACHE_MIN_TTL seconds after it was fetched
+CACHE_ENABLED = os.getenv("JUSTTCG_CACHE", "1") != "0"
+CACHE_MAX_STALENESS = float(os.getenv("JUSTTCG_CACHE_MAX_STALENESS", "21600"))
+CACHE_MIN_TTL = float(os.getenv("JUSTTCG_CACHE_MIN_TTL", "900"))
+CACHE_MEMORY_MB = float(os.getenv("JUSTTCG_CACHE_MEMORY_MB", "64"))
+# optional SQLite file keeping the cache across restarts and memory evictions,
+# defaults to the MCP_SHARED_CACHE file shared by the workers of an HTTP deployment
+CACHE_PATH = os.getenv("JUSTTCG_CACHE_PATH") or os.getenv("MCP_SHARED_CACHE")
+
+# Rate limit (calls per minute, match your JustTCG plan), retries and circuit breaker of the API calls,
+# see governor.from_env for the JUSTTCG_RATE_LIMIT, JUSTTCG_RETRIES, JUSTTCG_BREAKER_* variables
+upstream = governor.from_env("JustTCG", "JUSTTCG", rate=60, burst=10, retries=2, backoff=0.5)
+
+# condition abbreviations accepted by the API
+CONDITIONS = {
+    "S": "Sealed",
+    "NM": "Near Mint",
+    "LP": "Lightly Played",
+    "MP": "Moderately Played",
+    "HP": "Heavily Played",
+    "D": "Damaged",
+}
+
+_client: Union[httpx.AsyncClient, None] = None
+_client_loop: Union[asyncio.AbstractEventLoop, None] = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Returns the shared JustTCG HTTP client, creating it on first use.
+
+    The client keeps its connections alive between calls so only the first request
+    pays for the TCP/TLS handshake. A new client is created if the previous one was
+    closed or belongs to another event loop.
+
+    Returns:
+        httpx.AsyncClient: The pooled client.
+    """
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        _client = httpx.AsyncClient(
+            base_url=BASE_URL,
+            headers={"X-API-Key": API_KEY or ""},
+            timeout=httpx.Timeout(TIMEOUT, connect=CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=KEEPALIVE_EXPIRY,
+            ),
+            http2=HTTP2,
+        )
+        _client_loop = loop
+    return _client
+
+
+async def aclose() -> None:
+    """ Closes the shared HTTP client and its pooled connections. """
+    global _client, _client_loop
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+    _client_loop = None
 
 
 # API request helper with error handling
-# copied from JustTCG documentation
-def api_request(endpoint, method="GET", params=None, json_data=None):
-    headers = {"X-API-Key": API_KEY}
-    url = f"{BASE_URL}/{endpoint}"
+# adapted from JustTCG documentation
+async def api_request(endpoint, method="GET", params=None, json_data=None) -> dict:
+    """
+    Makes a JustTCG API call through the upstream governor (rate limit, retries, circuit breaker).
 
-    try:
+    Args:
+        endpoint (str): The endpoint relative to BASE_URL.
+        method (str, optional): GET or POST. Default is GET.
+        params (dict, optional): Query string parameters of a GET.
+        json_data (Any, optional): JSON body of a POST.
+    Returns:
+        dict: The decoded response.
+    Raises:
+        governor.UpstreamError: If the call failed, with the reason and when to retry.
+    """
+    client = get_client()
+
+    async def send() -> dict:
         if method == "GET":
-            response = requests.get(url, headers=headers, params=params)
+            response = await client.get(endpoint, params=params)
         else:  # POST
-            response = requests.post(url, headers=headers, json=json_data)
-
+            response = await client.post(endpoint, json=json_data)
+        if response.is_error:
+            try:
+                logging.error("API Error %s: %s", response.status_code, response.json())
+            except ValueError:
+                logging.error("API Error %s: %s", response.status_code, response.text)
         response.raise_for_status()
         return response.json()
 
-    except requests.exceptions.RequestException as e:
-        print(f"API Error: {e}")
-        if hasattr(e, "response") and e.response:
-            try:
-                error_data = e.response.json()
-                print(f"Error details: {error_data}")
-            except:
-                print(f"Error status code: {e.response.status_code}")
-                print(f"Error text: {e.response.text}")
+    async def call() -> dict:
+        # POST /cards only reads data but the API treats it as a write, only 429 is retried
+        return await upstream.call(send, idempotent=method == "GET", endpoint=f"{method} {endpoint}")
+
+    if method != "GET":
+        return await call()
+    # identical GETs in flight share the same upstream call
+    return await single_flight.run(json.dumps([endpoint, params], sort_keys=True, default=str), call)
+
+
+class SingleFlight:
+    """ Shares the result of a call between the identical calls made while it is in flight. """
+
+    def __init__(self):
+        # key -> task of the call in flight
+        self._calls: dict[str, asyncio.Task] = {}
+        self._loop: Union[asyncio.AbstractEventLoop, None] = None
+        self.calls = 0
+        self.shared = 0
+
+    async def run(self, key: str, function: Callable[[], Awaitable]):
+        """
+        Runs `function` unless a call with the same key is in flight, in which case its result is awaited.
+
+        Args:
+            key (str): Identifies the identical calls.
+            function (Callable): Coroutine function making the call.
+        Returns:
+            The result of the call, its exception is raised in every caller.
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # tasks of a closed event loop can not be awaited
+            self._calls = {}
+            self._loop = loop
+        self.calls += 1
+        task = self._calls.get(key)
+        if task is None:
+            task = self._calls[key] = asyncio.ensure_future(function())
+            task.add_done_callback(lambda _: self._calls.pop(key, None) if self._calls.get(key) is task else None)
+        else:
+            self.shared += 1
+        # a cancelled caller must not cancel the call of the others
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        """ Returns the number of calls and of calls answered by another call in flight. """
+        return {"calls": self.calls, "shared": self.shared}
+
+
+single_flight = SingleFlight()
+
+
+
+class PriceCache:
+    """
+    Cache of JustTCG variants, keyed by variant id.
+
+    Identifier queries (variantId, or tcgplayerId/cardId with optional condition and printing)
+    remember the variant ids they returned, so a repeated query is answered from the cached
+    variants as long as every one of them is still fresh. Entries are evicted least recently
+    used first once their total size exceeds the memory budget, and are optionally written
+    through to an SQLite file that serves as a second tier.
+    """
+
+    def __init__(self,
+                 max_staleness: float = CACHE_MAX_STALENESS,
+                 min_ttl: float = CACHE_MIN_TTL,
+                 memory_budget: int = int(CACHE_MEMORY_MB * 1024 * 1024),
+                 path: Union[str, None] = CACHE_PATH):
+        """
+        Args:
+            max_staleness (float, optional): Maximum age in seconds of a variant lastUpdated. Default is JUSTTCG_CACHE_MAX_STALENESS.
+            min_ttl (float, optional): Seconds a fetched variant is served regardless of lastUpdated. Default is JUSTTCG_CACHE_MIN_TTL.
+            memory_budget (int, optional): Maximum size in bytes of the cached variants. Default is JUSTTCG_CACHE_MEMORY_MB.
+            path (str, optional): SQLite file of the on-disk tier. Default is JUSTTCG_CACHE_PATH (no disk tier).
+        """
+        self.max_staleness = max_staleness
+        self.min_ttl = min_ttl
+        self.memory_budget = memory_budget
+        # variant id -> (card without its variants, variant, fetched at, size in bytes)
+        self._variants: OrderedDict[str, tuple[dict, dict, float, int]] = OrderedDict()
+        # normalized query -> variant ids returned by the API
+        self._queries: OrderedDict[str, list[str]] = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self._db = None
+        self._lock = threading.Lock()
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            # several processes may use the same file, they wait for each other's writes
+            self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript("""
+                CREATE TABLE IF NOT EXISTS variants (id TEXT PRIMARY KEY, card TEXT, variant TEXT, fetched_at REAL);
+                CREATE TABLE IF NOT EXISTS queries (key TEXT PRIMARY KEY, variant_ids TEXT);
+            """)
+
+    @staticmethod
+    def query_key(query: dict) -> Union[str, None]:
+        """
+        Returns the normalized cache key of an identifier query, or None if it is not cacheable.
+
+        Args:
+            query (dict): A query built with build_card_query.
+        Returns:
+            str: The key, equal for queries that only differ by condition spelling (NM / Near Mint).
+        """
+        for kind in ("variantId", "tcgplayerId", "cardId"):
+            if query.get(kind):
+                condition = query.get("condition")
+                condition = CONDITIONS.get(str(condition).upper(), condition) if condition else None
+                printing = query.get("printing") or query.get("printingId")
+                return json.dumps([kind, str(query[kind]), str(condition or "").lower(), str(printing or "").lower()])
         return None
- 
-def get_list_of_games() -> list[dict]:
+
+    def is_fresh(self, variant: dict, fetched_at: float) -> bool:
+        """ Checks if a cached variant can still be served. """
+        now = time.time()
+        if now - fetched_at <= self.min_ttl:
+            return True
+        last_updated = variant.get("lastUpdated")
+        return isinstance(last_updated, (int, float)) and now - last_updated <= self.max_staleness
+
+    def lookup(self, query: dict) -> Union[dict, None]:
+        """
+        Answers an identifier query from the cache.
+
+        Args:
+            query (dict): A query built with build_card_query.
+        Returns:
+            dict: The card with the cached variants, or None if any of them is missing or stale.
+        """
+        key = self.query_key(query)
+        with self._lock:
+            variant_ids = self._get_query(key) if key else None
+            # a variant cached by any other query answers its own variantId lookup
+            if variant_ids is None and query.get("variantId") and not query.get("condition"):
+                variant_ids = [query["variantId"]]
+            entries = [self._get_variant(variant_id) for variant_id in variant_ids or []]
+        if not entries or any(entry is None or not self.is_fresh(entry[1], entry[2]) for entry in entries):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entries[0][0] | {"variants": [entry[1] for entry in entries]}
+
+    def store(self, query: Union[dict, None], card: dict) -> None:
+        """
+        Caches the variants of a card returned by the API, and the query that returned it.
+
+        Args:
+            query (dict): The identifier query answered by the card, None for search results.
+            card (dict): The card as returned by the API.
+        """
+        variants = card.get("variants") or []
+        meta = {k: v for k, v in card.items() if k != "variants"}
+        now = time.time()
+        with self._lock:
+            for variant in variants:
+                if variant.get("id"):
+                    self._put_variant(variant["id"], meta, variant, now)
+            key = self.query_key(query) if query else None
+            if key and variants:
+                self._put_query(key, [variant["id"] for variant in variants if variant.get("id")])
+            if self._db is not None:
+                self._db.commit()
+
+    def stats(self) -> dict:
+        """ Returns the hit and miss counts and the size of the cache. """
+        return {"hits": self.hits, "misses": self.misses, "variants": len(self._variants), "bytes": self._size}
+
+    def _get_query(self, key: str) -> Union[list[str], None]:
+        """ Returns the variant ids of a query, from memory then disk. """
+        variant_ids = self._queries.get(key)
+        if variant_ids is None and self._db is not None:
+            row = self._db.execute("SELECT variant_ids FROM queries WHERE key = ?", (key,)).fetchone()
+            if row:
+                variant_ids = self._queries[key] = json.loads(row[0])
+        if variant_ids is not None:
+            self._queries.move_to_end(key)
+        return variant_ids
+
+    def _get_variant(self, variant_id: str) -> Union[tuple[dict, dict, float, int], None]:
+        """ Returns a variant entry, from memory then disk. """
+        entry = self._variants.get(variant_id)
+        if entry is None and self._db is not None:
+            row = self._db.execute("SELECT card, variant, fetched_at FROM variants WHERE id = ?", (variant_id,)).fetchone()
+            if row:
+                self._put_variant(variant_id, json.loads(row[0]), json.loads(row[1]), row[2], persist=False)
+                entry = self._variants[variant_id]
+        if entry is not None:
+            self._variants.move_to_end(variant_id)
+        return entry
+
+    def _put_query(self, key: str, variant_ids: list[str]) -> None:
+        """ Stores the variant ids of a query. """
+        self._queries[key] = variant_ids
+        self._queries.move_to_end(key)
+        if self._db is not None:
+            self._db.execute("INSERT OR REPLACE INTO queries VALUES (?, ?)", (key, json.dumps(variant_ids)))
+
+    def _put_variant(self, variant_id: str, meta: dict, variant: dict, fetched_at: float, persist: bool = True) -> None:
+        """ Stores a variant and evicts the least recently used ones above the memory budget. """
+        card, data = json.dumps(meta), json.dumps(variant)
+        size = len(card) + len(data)
+        previous = self._variants.pop(variant_id, None)
+        if previous is not None:
+            self._size -= previous[3]
+        self._variants[variant_id] = (meta, variant, fetched_at, size)
+        self._size += size
+        while self._size > self.memory_budget and len(self._variants) > 1:
+            self._size -= self._variants.popitem(last=False)[1][3]
+        # query entries are small, keep at most one per cached variant
+        while len(self._queries) > max(len(self._variants), 1):
+            self._queries.popitem(last=False)
+        if persist and self._db is not None:
+            self._db.execute("INSERT OR REPLACE INTO variants VALUES (?, ?, ?, ?)", (variant_id, card, data, fetched_at))
+
+
+price_cache: Union[PriceCache, None] = PriceCache() if CACHE_ENABLED else None
+
+
+class LookupBatcher:
+    """
+    Merges concurrent identifier lookups into batch requests.
+
+    When no request is in flight the lookups are sent on the next iteration of the event
+    loop, together with the ones made in the same iteration. While requests are in flight,
+    the lookups made within `window` seconds of the first one are sent together. A request
+    is one POST /cards (at most `max_batch` queries) and every caller gets its own card back.
+    Identical lookups, queued or in flight, share the same answer.
+    """
+
+    def __init__(self, window: float = COALESCE_WINDOW, max_batch: int = BATCH_SIZE):
+        """
+        Args:
+            window (float, optional): Seconds a lookup made while requests are in flight waits for others before the batch is sent. Default is JUSTTCG_COALESCE_WINDOW_MS.
+            max_batch (int, optional): Maximum number of queries per request. Default is JUSTTCG_BATCH_SIZE.
+        """
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        # query key -> future of its card, from the moment it is queued until it is answered
+        self._futures: dict[str, asyncio.Future] = {}
+        self._queue: list[tuple[str, dict]] = []
+        self._timer: Union[asyncio.Handle, None] = None
+        self._sending: set[asyncio.Task] = set()
+        self._loop: Union[asyncio.AbstractEventLoop, None] = None
+        self.lookups = 0
+        self.shared = 0
+        self.requests = 0
+
+    async def lookup(self, query: dict) -> Union[dict, None]:
+        """
+        Looks a card up by identifier.
+
+        Args:
+            query (dict): A query built with build_card_query, with a variantId, tcgplayerId or cardId.
+        Returns:
+            dict: The matching card, None if JustTCG has none.
+        Raises:
+            governor.UpstreamError: If the batch request failed.
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._futures, self._queue, self._timer, self._loop = {}, [], None, loop
+        key = PriceCache.query_key(query)
+        self.lookups += 1
+        future = self._futures.get(key)
+        if future is None:
+            future = self._futures[key] = loop.create_future()
+            self._queue.append((key, query))
+            if len(self._queue) >= self.max_batch:
+                self._flush()
+            elif self._timer is None:
+                # a lone lookup is not delayed, only the ones made under load wait to be merged
+                self._timer = loop.call_later(self.window, self._flush) if self._sending else loop.call_soon(self._flush)
+        else:
+            self.shared += 1
+        return await asyncio.shield(future)
+
+    def stats(self) -> dict:
+        """ Returns the number of lookups, of lookups sharing another one and of batch requests sent. """
+        return {"lookups": self.lookups, "shared": self.shared, "requests": self.requests}
+
+    def _flush(self) -> None:
+        """ Sends the queued lookups. """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._queue = self._queue, []
+        if batch:
+            task = asyncio.create_task(self._send(batch))
+            # keep a reference, the event loop only holds weak ones
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _send(self, batch: list[tuple[str, dict]]) -> None:
+        """ Makes the batch request and answers the callers. """
+        futures = [self._futures[key] for key, _ in batch]
+        queries = [query for _, query in batch]
+        self.requests += 1
+        try:
+            result = await api_request("cards", method="POST", json_data=queries)
+            if "data" not in result:
+                logging.error("Error fetching cards batch of %d queries: %s", len(queries), result)
+                raise governor.UpstreamError("JustTCG", "http", "batch request returned no data")
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+                    # mark the exception as retrieved, every caller may have been cancelled
+                    future.exception()
+        else:
+            for query, future, card in zip(queries, futures, _match_cards(queries, result["data"])):
+                if card is not None and price_cache is not None:
+                    price_cache.store(query, card)
+                if not future.done():
+                    future.set_result(card)
+        finally:
+            for key, _ in batch:
+                self._futures.pop(key, None)
+
+
+lookup_batcher = LookupBatcher()
+
+
+async def get_list_of_games() -> list[dict]:
     """
     Returns a list of games available in JustTCG.
 
@@ -44,7 +474,7 @@ def get_list_of_games() -> list[dict]:
     """
     endpoint = "games"
     
-    result = api_request(endpoint)
+    result = await api_request(endpoint)
     
     if "data" in result:
         return result["data"]
@@ -54,7 +484,7 @@ def get_list_of_games() -> list[dict]:
     
 
 
-def get_list_of_sets(game: str) -> list[dict]:
+async def get_list_of_sets(game: str) -> list[dict]:
     """
     Returns a list of sets for a specific game.
     Args:
@@ -62,8 +492,8 @@ def get_list_of_sets(game: str) -> list[dict]:
     Returns:
         list[dict]: A list of sets with their details.
     """
-    endpoint = f"sets?game={game}"
-    result = api_request(endpoint)
+    endpoint = "sets"
+    result = await api_request(endpoint, params={"game": game})
     if "data" in result:
         return result["data"]
     else:
@@ -71,7 +501,7 @@ def get_list_of_sets(game: str) -> list[dict]:
         return []
 
 
-def get_cards_by_query(
+async def get_cards_by_query(
                         tcgplayerId: str = None,
                         cardId: str = None,
                         variantId: str = None,
@@ -123,14 +553,96 @@ def get_cards_by_query(
         ] if v is not None
     }
     
+    # identifier lookups take precedence over the search, they are answered from the price cache when fresh
+    id_query = build_card_query(tcgplayerId=tcgplayerId, cardId=cardId, variantId=variantId, condition=condition)
+    cacheable = price_cache is not None and PriceCache.query_key(id_query) is not None and not offset
+    if cacheable:
+        card = price_cache.lookup(id_query)
+        if card is not None:
+            return [card]
+
+    # a lookup by identifier returns a single card, concurrent lookups are merged into batch requests
+    if COALESCE_WINDOW > 0 and PriceCache.query_key(id_query) is not None and not offset and set is None and search_query is None:
+        try:
+            card = await lookup_batcher.lookup(id_query)
+            return [card] if card is not None else []
+        except governor.UpstreamError as e:
+            # the batch POST is not retried on server errors, fall back to a retried GET of this lookup
+            if e.kind in ("rate_limited", "circuit_open"):
+                raise
+            logging.warning("Batched lookup failed (%s), retrying it on its own", e)
+
     endpoint = "cards"
-    result = api_request(endpoint, params=params)
+    result = await api_request(endpoint, params=params)
     if "data" in result:
+        if price_cache is not None:
+            for card in result["data"]:
+                price_cache.store(id_query if cacheable and len(result["data"]) == 1 else None, card)
         return result["data"]
     else:
         logging.error("Error fetching cards: %s", result)
         return []
 
+async def iter_cards_by_query(
+                        condition: str = None,
+                        game: str = None,
+                        set: str = None,
+                        order_by: str = None,
+                        order_direction: str = None,
+                        limit: int = 20,
+                        offset: int = 0,
+                        search_query: str = None,
+                        read_ahead: int = READ_AHEAD) -> AsyncIterator[dict]:
+    """
+    Iterates over every card of a search, page by page.
+
+    While a page is being consumed, the next `read_ahead` pages are already requested.
+    The iteration stops on the first empty or short page.
+
+    Args:
+        condition (str, optional): valid conditions are [Sealed, Near Mint, Lightly Played, Moderately Played, Heavily Played, Damaged] or abreviations [S, NM, LP, MP, HP, D].
+        game (str, optional): The game ID to filter cards by (e.g., mtg, pokemon).
+        set (str, optional): The set ID to filter cards by (e.g., Battle Pack: Epic Dawn).
+        order_by (str, optional): The field to order the results by (e.g., name, price).
+        order_direction (str, optional): The direction to order the results (asc or desc).
+        limit (int, optional): The number of results to request per page. Default is 20.
+        offset (int, optional): Number of results to skip. Default is 0.
+        search_query (str, optional): A search query string to filter cards by name or other attributes.
+        read_ahead (int, optional): Number of pages requested in advance. Default is JUSTTCG_READ_AHEAD.
+    Yields:
+        dict: The cards matching the search.
+    """
+    pending: deque[asyncio.Task] = deque()
+    next_offset = offset
+
+    def request_next_page() -> None:
+        nonlocal next_offset
+        pending.append(asyncio.create_task(get_cards_by_query(
+            condition=condition,
+            game=game,
+            set=set,
+            order_by=order_by,
+            order_direction=order_direction,
+            limit=limit,
+            offset=next_offset,
+            search_query=search_query,
+        )))
+        next_offset += limit
+
+    try:
+        for _ in range(1 + max(0, read_ahead)):
+            request_next_page()
+        while pending:
+            page = await pending.popleft()
+            for card in page:
+                yield card
+            if len(page) < limit:
+                return
+            request_next_page()
+    finally:
+        for task in pending:
+            task.cancel()
+
 def build_card_query(tcgplayerId:str = None,
                      cardId:str = None,
                      variantId:str = None,
@@ -159,7 +671,7 @@ def build_card_query(tcgplayerId:str = None,
         ("condition", condition)
     ] if v is not None}
 
-def get_cards_by_batch_query(batch_query: list[dict]) -> list[dict]:
+async def get_cards_by_batch_query(batch_query: list[dict]) -> list[Union[dict, None]]:
     """
     Fetches multiple cards based on a batch query.
     
@@ -167,14 +679,101 @@ def get_cards_by_batch_query(batch_query: list[dict]) -> list[dict]:
         batch_query (list[dict]): A list of dictionaries, each representing a card query.
         
     Returns:
-        list[dict]: A list of cards matching the batch queries.
+        list[dict]: The card matching each query, in the same order as the queries and None for the
+        queries without match, or an empty list if the request failed.
     """
-    endpoint = "cards"
-
-    result = api_request(endpoint, method="POST", json_data=batch_query)
-    if "data" in result:
-        return result["data"]
-    else:
-        logging.error("Error fetching cards: %s", result)
+    results = await get_cards_by_bulk_query(batch_query, batch_size=max(1, len(batch_query)), max_concurrency=1)
+    if results and all(result.get("error") == "batch request failed" for result in results):
         return []
+    return [result.get("card") for result in results]
+
+
+
+def _match_cards(queries: list[dict], cards: list[dict]) -> list[Union[dict, None]]:
+    """
+    Matches the cards returned by the batch endpoint to the queries, a card is only used once
+    so duplicated queries (e.g. same card in two conditions) get their own answer.
+
+    Returns:
+        list: The card answering each query, None for the queries without match.
+    """
+    used = set()
+    matches = []
+    for query in queries:
+        index = next((i for i, card in enumerate(cards) if i not in used and _card_matches(query, card)), None)
+        if index is not None:
+            used.add(index)
+        matches.append(cards[index] if index is not None else None)
+    return matches
+
+
+def _card_matches(query: dict, card: dict) -> bool:
+    """ Checks if a card returned by the batch endpoint answers a given query. """
+    if "variantId" in query:
+        return any(variant.get("id") == query["variantId"] for variant in card.get("variants") or [])
+    if "tcgplayerId" in query:
+        return str(card.get("tcgplayerId")) == str(query["tcgplayerId"])
+    if "cardId" in query:
+        return card.get("id") == query["cardId"]
+    return False
+
+
+async def get_cards_by_bulk_query(batch_query: list[dict],
+                                  batch_size: int = BATCH_SIZE,
+                                  max_concurrency: int = BATCH_CONCURRENCY,
+                                  use_cache: bool = True) -> list[dict]:
+    """
+    Fetches any number of cards by splitting the queries into batches that fit the
+    API limit and sending the batches concurrently.
+
+    The results are returned in the same order as the queries. Each entry contains the
+    original query and either the matching card under "card" or the reason of the failure
+    under "error".
+
+    Args:
+        batch_query (list[dict]): A list of dictionaries built with build_card_query.
+        batch_size (int, optional): The number of queries sent per request. Default is JUSTTCG_BATCH_SIZE.
+        max_concurrency (int, optional): The maximum number of batches in flight. Default is JUSTTCG_BATCH_CONCURRENCY.
+        use_cache (bool, optional): Answer the queries from the price cache when fresh. Default is True, with False every
+            query goes upstream and the results still refresh the cache.
+
+    Returns:
+        list[dict]: One {"query", "card"} or {"query", "error"} entry per query, in input order.
+    """
+    batch_size = max(1, batch_size)
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    results: list[dict] = [None] * len(batch_query)
+
+    # answer what we can from the price cache, only the missing or stale entries go upstream
+    missing = []
+    for position, query in enumerate(batch_query):
+        card = price_cache.lookup(query) if use_cache and price_cache is not None else None
+        if card is None:
+            missing.append(position)
+        else:
+            results[position] = {"query": query, "card": card}
+
+    async def run_batch(positions: list[int]) -> None:
+        queries = [batch_query[position] for position in positions]
+        async with semaphore:
+            try:
+                result = await api_request("cards", method="POST", json_data=queries)
+            except governor.UpstreamError as e:
+                result = {"error": e.to_dict()}
+
+        if "data" not in result:
+            logging.error("Error fetching cards batch of %d queries: %s", len(queries), result)
+            for position, query in zip(positions, queries):
+                results[position] = {"query": query, "error": "batch request failed", "details": result.get("error")}
+            return
+
+        for position, query, card in zip(positions, queries, _match_cards(queries, result["data"])):
+            if card is None:
+                results[position] = {"query": query, "error": "no matching card"}
+            else:
+                results[position] = {"query": query, "card": card}
+                if price_cache is not None:
+                    price_cache.store(query, card)
 
+    await asyncio.gather(*(run_batch(missing[start:start + batch_size]) for start in range(0, len(missing), batch_size)))
+    return results
@@ -0,0 +1,392 @@
+# In-process metrics of the MCP tools and of the upstream calls: latency histograms,
+# in-flight counts, call and error counts, payload sizes, and sampled traces.
+import contextvars
+import functools
+import json
+import logging
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from collections.abc import Callable
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Iterator, Union
+
+# share of the tool calls traced (phases timed and payload measured), 0 disables tracing
+TRACE_SAMPLE_RATE = float(os.getenv("MCP_TRACE_SAMPLE_RATE", "0.01"))
+# number of recent sampled traces kept
+TRACE_BUFFER = int(os.getenv("MCP_TRACE_BUFFER", "100"))
+# optional Prometheus text exposition, written to a file and/or served over HTTP
+METRICS_FILE = os.getenv("MCP_METRICS_FILE")
+METRICS_PORT = int(os.getenv("MCP_METRICS_PORT", "0"))
+METRICS_INTERVAL = float(os.getenv("MCP_METRICS_INTERVAL", "15"))
+
+# histogram upper bounds, seconds for latencies and bytes for payloads
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, float("inf"))
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, float("inf"))
+
+
+class Histogram:
+    """ Bucketed histogram, quantiles are interpolated inside the buckets. """
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        """
+        Args:
+            buckets (tuple[float, ...], optional): Sorted upper bounds, the last one must be inf. Default is LATENCY_BUCKETS.
+        """
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        """ Records a value. """
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> Union[float, None]:
+        """ Estimates a quantile (0 to 1) of the recorded values, within their min and max. """
+        if not self.count:
+            return None
+        return min(max(self._interpolate(q * self.count), self.min), self.max)
+
+    def _interpolate(self, rank: float) -> float:
+        """ Returns the value of a rank, assuming the values are spread evenly inside each bucket. """
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index]
+                if upper == float("inf"):
+                    return lower
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-2]
+
+    def summary(self, scale: float = 1.0, digits: int = 2) -> dict:
+        """ Returns the count, mean and p50/p95/p99, multiplied by `scale` (e.g. 1000 for ms). """
+        def value(v):
+            return None if v is None else round(v * scale, digits)
+        return {
+            "count": self.count,
+            "mean": value(self.sum / self.count if self.count else None),
+            "p50": value(self.quantile(0.5)),
+            "p95": value(self.quantile(0.95)),
+            "p99": value(self.quantile(0.99)),
+            "max": value(self.max if self.count else None),
+        }
+
+
+class Registry:
+    """
+    Holds every metric of the process. Metrics are identified by a name and a tuple of
+    label values, collectors add values read from other components (caches, governors)
+    when a snapshot is taken.
+    """
+
+    def __init__(self):
+        self.histograms: dict[tuple[str, tuple], Histogram] = {}
+        self.counters: dict[tuple[str, tuple], float] = {}
+        self.gauges: dict[tuple[str, tuple], float] = {}
+        self.collectors: dict[str, Callable[[], dict[str, Any]]] = {}
+        self.traces: deque = deque(maxlen=TRACE_BUFFER)
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, labels: tuple, value: float, buckets: tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        """ Records a value in a histogram. """
+        with self._lock:
+            histogram = self.histograms.get((name, labels))
+            if histogram is None:
+                histogram = self.histograms[(name, labels)] = Histogram(buckets)
+            histogram.observe(value)
+
+    def inc(self, name: str, labels: tuple, value: float = 1) -> None:
+        """ Increments a counter. """
+        with self._lock:
+            self.counters[(name, labels)] = self.counters.get((name, labels), 0) + value
+
+    def add(self, name: str, labels: tuple, value: float) -> None:
+        """ Adds to a gauge (e.g. +1 / -1 around an in-flight call). """
+        with self._lock:
+            self.gauges[(name, labels)] = self.gauges.get((name, labels), 0) + value
+
+    def register_collector(self, name: str, collector: Callable[[], dict[str, Any]]) -> None:
+        """ Adds a function whose values are included in every snapshot under `name`. """
+        self.collectors[name] = collector
+
+    def reset(self) -> None:
+        """ Clears every recorded value. """
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.gauges.clear()
+            self.traces.clear()
+
+    def snapshot(self) -> dict:
+        """
+        Returns every metric as a JSON serializable dictionary.
+
+        Returns:
+            dict: tools and upstream calls (counts, errors, in-flight, latency and payload summaries),
+            collector values and recent sampled traces.
+        """
+        with self._lock:
+            histograms = {key: (h.summary(1000) if h.buckets is LATENCY_BUCKETS else h.summary(1, 0))
+                          for key, h in self.histograms.items()}
+            counters, gauges = dict(self.counters), dict(self.gauges)
+            traces = list(self.traces)
+
+        tools: dict[str, dict] = {}
+        upstream: dict[str, dict] = {}
+        for (name, labels), value in counters.items():
+            if name == "tool_calls":
+                tools.setdefault(labels[0], {})["calls"] = value
+            elif name == "tool_errors":
+                tools.setdefault(labels[0], {}).setdefault("errors", {})[labels[1]] = value
+            elif name == "upstream_calls":
+                entry = upstream.setdefault(f"{labels[0]} {labels[1]}", {})
+                entry.setdefault("outcomes", {})[labels[2]] = value
+        for (name, labels), value in gauges.items():
+            if name == "tool_in_flight":
+                tools.setdefault(labels[0], {})["inFlight"] = value
+            elif name == "upstream_in_flight":
+                upstream.setdefault(f"{labels[0]} {labels[1]}", {})["inFlight"] = value
+        for (name, labels), summary in histograms.items():
+            if name == "tool_latency_seconds":
+                tools.setdefault(labels[0], {})["latencyMs"] = summary
+            elif name == "tool_payload_bytes":
+                tools.setdefault(labels[0], {})["payloadBytes"] = summary
+            elif name == "upstream_latency_seconds":
+                upstream.setdefault(f"{labels[0]} {labels[1]}", {})["latencyMs"] = summary
+
+        collected = {}
+        for name, collector in list(self.collectors.items()):
+            try:
+                collected[name] = collector()
+            except Exception as e:
+                collected[name] = {"error": str(e)}
+        return {"tools": tools, "upstream": upstream, "components": collected, "traces": traces}
+
+    def prometheus(self) -> str:
+        """ Returns every metric in the Prometheus text exposition format. """
+        label_names = {
+            "tool_latency_seconds": ("tool",), "tool_payload_bytes": ("tool",), "tool_calls": ("tool",),
+            "tool_errors": ("tool", "error"), "tool_in_flight": ("tool",),
+            "upstream_latency_seconds": ("provider", "endpoint"), "upstream_in_flight": ("provider", "endpoint"),
+            "upstream_calls": ("provider", "endpoint", "outcome"),
+        }
+
+        def labels(name: str, values: tuple, extra: str = "") -> str:
+            pairs = [f'{key}="{_escape(value)}"' for key, value in zip(label_names.get(name, ()), values)]
+            if extra:
+                pairs.append(extra)
+            return "{" + ",".join(pairs) + "}" if pairs else ""
+
+        lines = []
+        with self._lock:
+            for (name, values), value in sorted(self.counters.items()):
+                lines.append(f"pokemon_tcg_mcp_{name}_total{labels(name, values)} {value}")
+            for (name, values), value in sorted(self.gauges.items()):
+                lines.append(f"pokemon_tcg_mcp_{name}{labels(name, values)} {value}")
+            for (name, values), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    le = 'le="{}"'.format("+Inf" if bound == float("inf") else repr(bound))
+                    lines.append(f"pokemon_tcg_mcp_{name}_bucket{labels(name, values, le)} {cumulative}")
+                lines.append(f"pokemon_tcg_mcp_{name}_sum{labels(name, values)} {histogram.sum}")
+                lines.append(f"pokemon_tcg_mcp_{name}_count{labels(name, values)} {histogram.count}")
+        for name, collector in list(self.collectors.items()):
+            try:
+                values = collector()
+            except Exception:
+                continue
+            for key, value in _flatten(values):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append(f'pokemon_tcg_mcp_component{{component="{_escape(name)}",metric="{_escape(key)}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: Any) -> str:
+    """ Escapes a Prometheus label value. """
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _flatten(values: dict, prefix: str = "") -> Iterator[tuple[str, Any]]:
+    """ Yields the leaves of nested dictionaries with dotted keys. """
+    for key, value in values.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{prefix}{key}.")
+        else:
+            yield f"{prefix}{key}", value
+
+
+registry = Registry()
+
+# trace of the current tool call, None when the call is not sampled
+_trace: contextvars.ContextVar[Union[dict, None]] = contextvars.ContextVar("trace", default=None)
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """ Times a phase of the current tool call (upstream call, conversion, ...), only when the call is traced. """
+    trace = _trace.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        # phases are aggregated by name, e.g. the conversion of the 100 cards of a page is one entry
+        phase = trace["phases"].setdefault(name, {"calls": 0, "ms": 0.0})
+        phase["calls"] += 1
+        phase["ms"] += (time.perf_counter() - start) * 1000
+
+
+def traced(name: str) -> Callable:
+    """ Decorator timing every call of a function as a span of the current trace. """
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _trace.get() is None:
+                return function(*args, **kwargs)
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def instrument(function: Callable, name: str = None) -> Callable:
+    """
+    Wraps an async tool function to record its latency, in-flight count, errors and,
+    for the sampled calls, a trace with the payload size and its serialization time.
+
+    Args:
+        function (Callable): The tool coroutine function.
+        name (str, optional): The tool name. Default is the function name.
+    Returns:
+        Callable: The instrumented function.
+    """
+    name = name or function.__name__
+    labels = (name,)
+
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs):
+        trace = None
+        if TRACE_SAMPLE_RATE > 0 and random.random() < TRACE_SAMPLE_RATE:
+            trace = {"tool": name, "phases": {}}
+        token = _trace.set(trace)
+        registry.add("tool_in_flight", labels, 1)
+        start = time.perf_counter()
+        try:
+            result = await function(*args, **kwargs)
+        except Exception as e:
+            registry.inc("tool_errors", (name, type(e).__name__))
+            if trace is not None:
+                trace["error"] = f"{type(e).__name__}: {e}"
+            raise
+        else:
+            if trace is not None:
+                # an estimate of the MCP serialization, which happens after the tool returns
+                with span("serialize"):
+                    size = len(json.dumps(result, default=str))
+                trace["payloadBytes"] = size
+                registry.observe("tool_payload_bytes", labels, size, SIZE_BUCKETS)
+            return result
+        finally:
+            duration = time.perf_counter() - start
+            registry.add("tool_in_flight", labels, -1)
+            registry.inc("tool_calls", labels)
+            registry.observe("tool_latency_seconds", labels, duration)
+            _trace.reset(token)
+            if trace is not None:
+                trace["durationMs"] = round(duration * 1000, 3)
+                trace["timestamp"] = time.time()
+                for phase in trace["phases"].values():
+                    phase["ms"] = round(phase["ms"], 3)
+                registry.traces.append(trace)
+
+    return wrapper
+
+
+def instrument_tools(mcp) -> None:
+    """ Instruments every tool registered on a FastMCP server. """
+    for tool in mcp._tool_manager.list_tools():
+        if not getattr(tool.fn, "__instrumented__", False):
+            tool.fn = instrument(tool.fn, tool.name)
+            tool.fn.__instrumented__ = True
+
+
+@contextmanager
+def upstream_call(provider: str, endpoint: str) -> Iterator[None]:
+    """
+    Records the latency, in-flight count and outcome of one upstream call.
+
+    Args:
+        provider (str): The upstream API (TCGdex, JustTCG).
+        endpoint (str): The endpoint called.
+    """
+    labels = (provider, endpoint)
+    registry.add("upstream_in_flight", labels, 1)
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        with span(f"{provider} {endpoint}"):
+            yield
+        outcome = "ok"
+    except Exception as e:
+        outcome = type(e).__name__
+        raise
+    finally:
+        registry.add("upstream_in_flight", labels, -1)
+        registry.observe("upstream_latency_seconds", labels, time.perf_counter() - start)
+        registry.inc("upstream_calls", (provider, endpoint, outcome))
+
+
+def write_prometheus(path: str) -> None:
+    """ Writes the Prometheus text of the registry to a file, atomically. """
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(registry.prometheus())
+    os.replace(tmp, path)
+
+
+def serve_prometheus(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """
+    Serves the Prometheus text of the registry on http://host:port/metrics from a background thread.
+
+    Args:
+        port (int): The port to listen on.
+        host (str, optional): The interface to listen on. Default is 127.0.0.1.
+    Returns:
+        ThreadingHTTPServer: The running server.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args) -> None:
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logging.info("Metrics served on http://%s:%d/metrics", host, port)
+    return server
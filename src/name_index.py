@@ -0,0 +1,125 @@
+# In-memory typo tolerant index of the card names, answering name lookups without the network.
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+
+# minimum similarity (0 to 1) of a name to be returned
+MIN_SCORE = float(os.getenv("TCGDEX_NAME_INDEX_MIN_SCORE", "0.3"))
+
+
+def normalize(name: str) -> str:
+    """ Lowercase form of a name without accents nor punctuation ("Mr. Mime" -> "mr mime", "Flabébé" -> "flabebe"). """
+    text = unicodedata.normalize("NFKD", name or "")
+    text = "".join(c for c in text if not unicodedata.combining(c)).casefold()
+    return " ".join(re.sub(r"[^\w]|_", " ", text).split())
+
+
+def trigrams(key: str) -> set[str]:
+    """ Returns the trigrams of a normalized name without spaces, padded to also index its first and last letters. """
+    padded = f"${key}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class NameIndex:
+    """
+    Trigram index of the card names of one language.
+
+    Every distinct name is indexed once with the ids of its cards. A search scores the names
+    sharing trigrams with the text by their Dice similarity, names starting with the text are
+    boosted so that the index also serves as an autocomplete. The index is updated in place
+    with the cards added or removed since the previous update.
+    """
+
+    def __init__(self):
+        # distinct names, by position: normalized key without spaces, display name, card ids
+        self._keys: list[str] = []
+        self._names: list[str] = []
+        self._card_ids: list[list[str]] = []
+        self._trigram_counts: list[int] = []
+        # normalized key -> position, trigram -> positions of the names containing it
+        self._positions: dict[str, int] = {}
+        self._postings: dict[str, list[int]] = {}
+        # card id -> position of its name
+        self._cards: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.updated_at: float = 0.0
+
+    def __len__(self) -> int:
+        return len(self._cards)
+
+    def update(self, cards: list[tuple[str, str]]) -> dict:
+        """
+        Brings the index in line with a card list, only the new and removed cards are processed.
+
+        Args:
+            cards (list[tuple[str, str]]): (id, name) of every card of the language.
+        Returns:
+            dict: The number of cards added and removed.
+        """
+        with self._lock:
+            listed = set()
+            added = 0
+            for card_id, name in cards:
+                listed.add(card_id)
+                if card_id in self._cards or not name:
+                    continue
+                self._cards[card_id] = position = self._add_name(name)
+                self._card_ids[position].append(card_id)
+                added += 1
+            removed = [card_id for card_id in self._cards if card_id not in listed]
+            for card_id in removed:
+                self._card_ids[self._cards.pop(card_id)].remove(card_id)
+            self.updated_at = time.time()
+        return {"added": added, "removed": len(removed)}
+
+    def _add_name(self, name: str) -> int:
+        """ Returns the position of a name, indexing it first if it is new. """
+        key = normalize(name).replace(" ", "")
+        position = self._positions.get(key)
+        if position is None:
+            position = self._positions[key] = len(self._keys)
+            grams = trigrams(key)
+            self._keys.append(key)
+            self._names.append(name)
+            self._card_ids.append([])
+            self._trigram_counts.append(len(grams))
+            for gram in grams:
+                self._postings.setdefault(gram, []).append(position)
+        return position
+
+    def search(self, text: str, limit: int = 10, min_score: float = MIN_SCORE) -> list[dict]:
+        """
+        Finds the names closest to a text.
+
+        Args:
+            text (str): The name or the beginning of the name, typos, accents and punctuation are tolerated.
+            limit (int, optional): Maximum number of names returned. Default is 10.
+            min_score (float, optional): Minimum similarity of the names returned. Default is TCGDEX_NAME_INDEX_MIN_SCORE.
+        Returns:
+            list[dict]: The names by decreasing similarity, each with its "score" and the "cardIds" of its cards.
+        """
+        key = normalize(text).replace(" ", "")
+        if not key:
+            return []
+        grams = trigrams(key)
+        with self._lock:
+            shared = Counter(position for gram in grams for position in self._postings.get(gram, ()))
+            scored = []
+            for position, common in shared.items():
+                if not self._card_ids[position]:
+                    continue
+                score = 2 * common / (len(grams) + self._trigram_counts[position])
+                if self._keys[position].startswith(key):
+                    score = (1 + score) / 2
+                if score >= min_score:
+                    scored.append((score, position))
+            scored.sort(key=lambda item: (-item[0], len(self._keys[item[1]]), self._keys[item[1]]))
+            return [{"name": self._names[position], "score": round(score, 3), "cardIds": list(self._card_ids[position])}
+                    for score, position in scored[:max(1, limit)]]
+
+    def stats(self) -> dict:
+        """ Returns the number of indexed cards, names and trigrams. """
+        return {"cards": len(self._cards), "names": len(self._keys), "trigrams": len(self._postings)}
@@ -0,0 +1,263 @@
+# Safe parser for the TCGdex Query() method-chain syntax used by get_card_by_query.
+import ast
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Callable, Union
+
+if TYPE_CHECKING:
+    from tcgdexsdk import Query
+
+PLAN_CACHE_SIZE = int(os.getenv("TCGDEX_QUERY_CACHE_SIZE", "1024"))
+
+# method name (and its aliases) -> (operator, number of arguments)
+FILTER_METHODS = {
+    "equal": ("eq", 2),
+    "notEqual": ("neq", 2),
+    "contains": ("contains", 2),
+    "includes": ("contains", 2),
+    "like": ("contains", 2),
+    "notContains": ("not", 2),
+    "notIncludes": ("not", 2),
+    "notLike": ("not", 2),
+    "greaterOrEqualThan": ("gte", 2),
+    "gte": ("gte", 2),
+    "lesserOrEqualThan": ("lte", 2),
+    "lessOrEqualThan": ("lte", 2),
+    "lte": ("lte", 2),
+    "greaterThan": ("gt", 2),
+    "gt": ("gt", 2),
+    "lesserThan": ("lt", 2),
+    "lessThan": ("lt", 2),
+    "lt": ("lt", 2),
+    "isNull": ("null", 1),
+    "notNull": ("notnull", 1),
+}
+
+# keyword names accepted for each argument position
+ARGUMENT_NAMES = {
+    1: ("key",),
+    2: ("key", "value"),
+    "sort": ("key", "order"),
+    "paginate": ("page", "itemsPerPage"),
+}
+
+# fields stored as ", " joined strings by tools.Card_to_dict but holding several values
+LIST_FIELDS = {"types"}
+
+
+class QuerySyntaxError(ValueError):
+    """ Raised when a query string is not a valid Query() method chain. """
+
+
+@dataclass(frozen=True)
+class Filter:
+    """ A single field condition, `op` is one of the TCGdex filter operators (eq, contains, gte, null, ...). """
+
+    field: str
+    op: str
+    value: Any = None
+
+
+@dataclass(frozen=True)
+class QueryPlan:
+    """ Normalized form of a Query() method chain. """
+
+    filters: tuple[Filter, ...] = ()
+    sort: Union[tuple[str, str], None] = None
+    pagination: Union[tuple[int, int], None] = None
+
+    @property
+    def key(self) -> str:
+        """ Canonical text of the plan, equal for every equivalent query string. """
+        return repr(self)
+
+    def to_dict(self) -> dict:
+        """ Returns a JSON serializable form of the plan, see from_dict. """
+        return {
+            "filters": [[filter.field, filter.op, filter.value] for filter in self.filters],
+            "sort": list(self.sort) if self.sort else None,
+            "pagination": list(self.pagination) if self.pagination else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "QueryPlan":
+        """ Rebuilds a plan from the output of to_dict. """
+        return cls(
+            filters=tuple(Filter(*filter) for filter in data["filters"]),
+            sort=tuple(data["sort"]) if data["sort"] else None,
+            pagination=tuple(data["pagination"]) if data["pagination"] else None,
+        )
+
+    def to_query(self) -> "Query":
+        """
+        Builds the tcgdexsdk Query equivalent to the plan.
+
+        Returns:
+            Query: The query to send to TCGdex.
+        """
+        from tcgdexsdk import Query
+
+        query = Query()
+        for filter in self.filters:
+            if filter.op == "contains":
+                query.contains(filter.field, filter.value)
+            elif filter.op in ("null", "notnull"):
+                query.params.append({"key": filter.field, "value": f"{filter.op}:"})
+            else:
+                query.params.append({"key": filter.field, "value": f"{filter.op}:{filter.value}"})
+        if self.sort:
+            query.sort(*self.sort)
+        if self.pagination:
+            query.paginate(*self.pagination)
+        return query
+
+    def predicate(self) -> Callable[[dict], bool]:
+        """
+        Builds a function evaluating the filters of the plan on a card dictionary
+        (as returned by tools.Card_to_dict). Sorting and pagination are not applied.
+
+        Returns:
+            Callable[[dict], bool]: True if the card matches every filter.
+        """
+        checks = [_filter_predicate(filter) for filter in self.filters]
+        return lambda card: all(check(card) for check in checks)
+
+
+def _field_values(card: dict, field: str) -> list[Any]:
+    """ Returns the values of a (dotted) field of a card, as a list. """
+    value: Any = card
+    for part in field.split("."):
+        value = value.get(part) if isinstance(value, dict) else None
+    if value is None:
+        return []
+    if field in LIST_FIELDS and isinstance(value, str):
+        return value.split(", ")
+    return value if isinstance(value, list) else [value]
+
+
+def _compare(left: Any, right: Any) -> int:
+    """ Compares two values numerically if possible, else as case-insensitive text. """
+    try:
+        left, right = float(left), float(right)
+    except (TypeError, ValueError):
+        left, right = str(left).casefold(), str(right).casefold()
+    return (left > right) - (left < right)
+
+
+def _filter_predicate(filter: Filter) -> Callable[[dict], bool]:
+    """ Builds the function evaluating a single filter on a card dictionary. """
+    op, field, value = filter.op, filter.field, filter.value
+    if op == "null":
+        return lambda card: not _field_values(card, field)
+    if op == "notnull":
+        return lambda card: bool(_field_values(card, field))
+    if op in ("contains", "not"):
+        needle = str(value).casefold()
+        found = lambda card: any(needle in str(v).casefold() for v in _field_values(card, field))
+        return found if op == "contains" else (lambda card: not found(card))
+    if op == "neq":
+        return lambda card: all(_compare(v, value) != 0 for v in _field_values(card, field))
+    expected = {"eq": (0,), "gte": (0, 1), "lte": (-1, 0), "gt": (1,), "lt": (-1,)}[op]
+    return lambda card: any(_compare(v, value) in expected for v in _field_values(card, field))
+
+
+def _literal(node: ast.expr) -> Union[str, int, float]:
+    """ Returns the value of a string or number literal argument. """
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub) and isinstance(node.operand, ast.Constant):
+        node = ast.Constant(-node.operand.value) if isinstance(node.operand.value, (int, float)) else node
+    if isinstance(node, ast.Constant) and isinstance(node.value, (str, int, float)) and not isinstance(node.value, bool):
+        return node.value
+    raise QuerySyntaxError(f"only string and number arguments are allowed, got: {ast.unparse(node)}")
+
+
+def _arguments(method: str, call: ast.Call, names: tuple[str, ...]) -> list[Any]:
+    """ Returns the positional and keyword arguments of a call in signature order. """
+    if len(call.args) > len(names):
+        raise QuerySyntaxError(f"'{method}' takes {len(names)} argument(s)")
+    values = [_literal(arg) for arg in call.args]
+    keywords = {keyword.arg: _literal(keyword.value) for keyword in call.keywords}
+    for name in names[len(values):]:
+        if name not in keywords:
+            raise QuerySyntaxError(f"'{method}' is missing the '{name}' argument")
+        values.append(keywords.pop(name))
+    if keywords:
+        raise QuerySyntaxError(f"'{method}' got unexpected argument(s): {', '.join(map(str, keywords))}")
+    return values
+
+
+def parse(text: str) -> QueryPlan:
+    """
+    Parses a Query() method chain without executing it.
+
+    Args:
+        text (str): The query, e.g. 'Query().equal("types", "Fire").paginate(1, 10)'.
+    Returns:
+        QueryPlan: The normalized plan.
+    Raises:
+        QuerySyntaxError: If the text is not a valid Query() method chain.
+    """
+    try:
+        module = ast.parse(text.strip())
+    except SyntaxError as e:
+        raise QuerySyntaxError(f"invalid query: {e.msg}") from None
+    # accept both `Query()...` and `query = Query()...`
+    if len(module.body) != 1 or not isinstance(module.body[0], (ast.Expr, ast.Assign)):
+        raise QuerySyntaxError("the query must be a single Query() expression")
+    node = module.body[0].value
+
+    # unwind the chain from the last call to Query()
+    calls = []
+    while isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+        calls.append((node.func.attr, node))
+        node = node.func.value
+    if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == "Query"
+            and not node.args and not node.keywords):
+        raise QuerySyntaxError("the query must start with Query()")
+
+    filters, sort, pagination = [], None, None
+    for method, call in reversed(calls):
+        if method in FILTER_METHODS:
+            op, count = FILTER_METHODS[method]
+            args = _arguments(method, call, ARGUMENT_NAMES[count])
+            filters.append(Filter(str(args[0]), op, args[1] if count == 2 else None))
+        elif method == "sort":
+            key, order = _arguments(method, call, ARGUMENT_NAMES["sort"])
+            sort = (str(key), "desc" if str(order).lower() == "desc" else "asc")
+        elif method == "paginate":
+            page, per_page = _arguments(method, call, ARGUMENT_NAMES["paginate"])
+            try:
+                pagination = (int(page), int(per_page))
+            except ValueError:
+                raise QuerySyntaxError("'paginate' takes number arguments") from None
+        else:
+            raise QuerySyntaxError(f"unknown Query method '{method}'")
+
+    # filters are combined with AND, their order does not matter
+    filters.sort(key=lambda filter: (filter.field, filter.op, str(filter.value)))
+    return QueryPlan(tuple(filters), sort, pagination)
+
+
+_plans: OrderedDict[str, QueryPlan] = OrderedDict()
+
+
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def compile(text: str) -> QueryPlan:
+    """
+    Parses a query string, memoized on the text and on the normalized plan so that
+    equivalent queries share the same plan object.
+
+    Args:
+        text (str): The query string.
+    Returns:
+        QueryPlan: The shared normalized plan.
+    Raises:
+        QuerySyntaxError: If the text is not a valid Query() method chain.
+    """
+    plan = parse(text)
+    plan = _plans.setdefault(plan.key, plan)
+    _plans.move_to_end(plan.key)
+    while len(_plans) > PLAN_CACHE_SIZE:
+        _plans.popitem(last=False)
+    return plan
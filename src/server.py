@@ -1,123 +1,576 @@
 """MCP Server implementation for Pokemon TCG API"""
 
 import logging
-from typing import Any, Union
+from typing import TYPE_CHECKING, Any, Union
 
-import urllib
-import httpx
-from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp import Context, FastMCP
+from mcp.types import ImageContent, TextContent
 
-from tcgdexsdk import TCGdex
-from tcgdexsdk import Card, Set, Serie, SerieResume, SetResume, CardResume
-import time
 import asyncio
+import dataclasses
+import functools
+import socket
+import sys
+import time
 
 import tools
-import justTCG
-from tcgdexsdk import Query
+import hydration
+import metrics
+import cache
+import query_plan
 
 import os
+from contextlib import asynccontextmanager
+from collections.abc import AsyncIterator
+
+# tcgdexsdk, numpy (analytics) and the optional subsystems (JustTCG and its governor, catalog, card map,
+# images, watchlist, name index, decklists, cursors) are imported on first use by the tools and hooks
+# needing them, they are not needed to answer the MCP handshake and only slow down the start of the server
+if TYPE_CHECKING:
+    import analytics
+    import cursors
+    import governor
+    import name_index
+    from tcgdexsdk import Card, Serie, Set, TCGdex
+
+# default language of the tools, every tool also takes an optional `language` argument
 language = os.getenv("TCGDEX_LANGUAGE", "en")
 
-sdk = TCGdex(language)
+# Startup-optimized mode: the tools are registered without output schema, which skips the
+# generation of a pydantic model per tool (results are still returned as JSON text)
+FAST_STARTUP = os.getenv("MCP_FAST_STARTUP", "0") == "1"
+
+# Transport: stdio serves a single client, streamable-http and sse serve any number of clients over the network
+TRANSPORT = os.getenv("MCP_TRANSPORT", "stdio")
+HTTP_HOST = os.getenv("MCP_HOST", "127.0.0.1")
+HTTP_PORT = int(os.getenv("MCP_PORT", "8000"))
+# worker processes of the HTTP transports, they share the caches of MCP_SHARED_CACHE
+WORKERS = max(1, int(os.getenv("MCP_WORKERS", "1")))
+# maximum number of connections and requests handled at once per worker, above it requests get a 503
+HTTP_MAX_CONCURRENCY = int(os.getenv("MCP_MAX_CONCURRENCY", "0")) or None
+# seconds the in-flight requests are given to complete on shutdown
+GRACEFUL_TIMEOUT = float(os.getenv("MCP_GRACEFUL_TIMEOUT", "30"))
+# stateless HTTP creates a transport per request so that any worker can answer any request,
+# it is required as soon as there are several workers
+STATELESS_HTTP = WORKERS > 1 or os.getenv("MCP_STATELESS_HTTP", "0") == "1"
+
+
+@functools.cache
+def supported_languages() -> frozenset[str]:
+    """ Returns the languages served by TCGdex. """
+    from tcgdexsdk.enums import Language
+
+    return frozenset(lang.value for lang in Language)
+
+
+def resolve_language(requested: Union[str, None]) -> str:
+    """
+    Returns the language a tool call is served in.
+
+    Args:
+        requested (str, optional): The language requested by the caller, None for the default TCGDEX_LANGUAGE.
+    Returns:
+        str: The TCGdex language code.
+    """
+    if not requested:
+        return language
+    requested = requested.lower()
+    if requested not in supported_languages():
+        raise ValueError(f"Unsupported language '{requested}', choose from: {', '.join(sorted(supported_languages()))}.")
+    return requested
+
+
+# seconds one attempt of a TCGdex call may take, the SDK has no timeout option and waits forever on a hung upstream
+TCGDEX_TIMEOUT = float(os.getenv("TCGDEX_TIMEOUT", "15"))
+
+
+@functools.cache
+def get_sdk(lang: str) -> "TCGdex":
+    """ Returns the pooled TCGdex SDK client of a language, created on first use. """
+    from tcgdexsdk import TCGdex
+
+    # the blocking urllib calls of the SDK use the default socket timeout, without it a hung call
+    # keeps its worker thread forever after call_tcgdex gave up on it
+    if socket.getdefaulttimeout() is None:
+        socket.setdefaulttimeout(TCGDEX_TIMEOUT)
+    sdk = TCGdex(lang)
+    # can be pointed at a mirror or at the local stand-in server of the benchmarks
+    if os.getenv("TCGDEX_ENDPOINT"):
+        sdk.setEndpoint(os.getenv("TCGDEX_ENDPOINT"))
+    return sdk
+
+
+@functools.cache
+def get_tcgdex_upstream() -> "governor.Governor":
+    """
+    Returns the governor of the TCGdex calls, created on first use: every TCGdex call goes through the same rate limit,
+    retries and circuit breaker whatever its language, see governor.from_env for the TCGDEX_RATE_LIMIT,
+    TCGDEX_RETRIES, TCGDEX_BREAKER_* variables.
+    """
+    import governor
+
+    return governor.from_env("TCGdex", "TCGDEX", rate=600, burst=32,
+                             retries=hydration.RETRIES, backoff=hydration.RETRY_BACKOFF)
+
+
+async def call_tcgdex(endpoint: str, function, *args):
+    """
+    Calls a blocking SDK function in a worker thread through the TCGdex governor, `endpoint` names it in the metrics.
+    Each attempt fails with a TimeoutError, retried by the governor, after TCGDEX_TIMEOUT seconds.
+    """
+    return await get_tcgdex_upstream().call(lambda: asyncio.wait_for(asyncio.to_thread(function, *args), TCGDEX_TIMEOUT),
+                                            endpoint=endpoint)
+
+async def fetch_card(card_id: str, lang: str) -> "Card":
+    """ Fetches a single card in a worker thread, the SDK performs blocking HTTP calls. """
+    return await call_tcgdex("cards/:id", get_sdk(lang).card.getSync, card_id)
+
+async def fetch_set(set_id: str, lang: str) -> "Set":
+    """ Fetches a single set in a worker thread. """
+    return await call_tcgdex("sets/:id", get_sdk(lang).set.getSync, set_id)
+
+async def fetch_serie(serie_id: str, lang: str) -> "Serie":
+    """ Fetches a single serie in a worker thread. """
+    return await call_tcgdex("series/:id", get_sdk(lang).serie.getSync, serie_id)
+
+@functools.cache
+def get_cursor_store() -> "cursors.CursorStore":
+    """ Returns the open cursors of paginated card queries, shared with the other workers through MCP_SHARED_CACHE. """
+    import cursors
+
+    return cursors.CursorStore(store=cache.shared_store())
+
+
+def loaded(name: str):
+    """ Returns a module of an optional subsystem if a tool has imported it, None otherwise. """
+    return sys.modules.get(name)
+
+
+FETCHERS = {"card": fetch_card, "set": fetch_set, "serie": fetch_serie}
+
+
+@functools.cache
+def get_hydrator(kind: str, lang: str) -> hydration.Hydrator:
+    """
+    Returns the shared scheduler hydrating ids into full objects of a language, retries are made by the governor.
+
+    Args:
+        kind (str): The kind of object, one of FETCHERS.
+        lang (str): The TCGdex language.
+    Returns:
+        Hydrator: The scheduler.
+    """
+    return hydration.Hydrator(functools.partial(FETCHERS[kind], lang=lang), retries=0)
+
+
+# Language independent facts of the cards fetched in any language (see tools.NEUTRAL_CARD_FIELDS),
+# requests only asking for these fields are answered without fetching the card again in another language
+CARD_FACTS_MAXSIZE = int(os.getenv("TCGDEX_CARD_FACTS_MAXSIZE", "10000"))
+card_facts = cache.TTLCache(maxsize=CARD_FACTS_MAXSIZE, namespace="card_facts")
+
+# Converted cards by language and id, kept when TCGDEX_CARD_CACHE_TTL is set, by default only with
+# MCP_SHARED_CACHE so that the cards fetched by one worker are served by all the others
+CARD_CACHE_TTL = float(os.getenv("TCGDEX_CARD_CACHE_TTL", "86400" if cache.SHARED_CACHE_PATH else "0"))
+CARD_CACHE_MAXSIZE = int(os.getenv("TCGDEX_CARD_CACHE_MAXSIZE", "2000"))
+card_details = cache.TTLCache(maxsize=CARD_CACHE_MAXSIZE, namespace="cards") if CARD_CACHE_TTL > 0 else None
+
+
+async def hydrate_cards(card_ids: list[str], lang: str, fields: list[str] = None,
+                        deadline: float = None, on_progress=None) -> list[dict]:
+    """
+    Fetches cards in a language and converts them, answering from the card cache when enabled and
+    from the language independent facts already known when only those fields are requested.
+
+    Args:
+        card_ids (list[str]): The ids of the cards.
+        lang (str): The TCGdex language.
+        fields (list[str], optional): Only return these card fields. Default is None (all fields).
+        deadline (float, optional): Maximum number of seconds to spend fetching.
+        on_progress (Callable, optional): Progress reporter of the current request.
+    Returns:
+        list[dict]: The converted cards, in the order of the ids.
+    """
+    neutral = bool(fields) and set(fields).issubset(tools.NEUTRAL_CARD_FIELDS)
+    found = {}
+    for card_id in card_ids:
+        if card_details is not None and (card := card_details.get(f"{lang}:{card_id}")) is not None:
+            found[card_id] = tools.project(card, fields)
+        elif neutral and (facts := card_facts.get(card_id)) is not None:
+            found[card_id] = tools.project(facts, fields)
+    missing = [card_id for card_id in card_ids if card_id not in found]
+    if missing:
+        for card in await get_hydrator("card", lang).hydrate(missing, deadline or hydration.DEADLINE, on_progress):
+            card_facts.set(card.id, tools.Card_to_dict(card, tools.NEUTRAL_CARD_FIELDS), REFERENCE_TTL)
+            if card_details is not None:
+                details = tools.Card_to_dict(card)
+                card_details.set(f"{lang}:{card.id}", details, CARD_CACHE_TTL)
+                found[card.id] = tools.project(details, fields)
+            else:
+                found[card.id] = tools.Card_to_dict(card, fields)
+    return [found[card_id] for card_id in card_ids if card_id in found]
+
+
+def progress_callback(ctx: Context):
+    """ Returns the progress reporter of the current request, or None outside of a request. """
+    try:
+        ctx.request_context
+    except ValueError:
+        return None
+    return ctx.report_progress
+
+
+# Reference data (types, rarities, sets, ...) only changes when a new set is released,
+# it is cached with a time to live in seconds per list
+REFERENCE_TTL = float(os.getenv("TCGDEX_CACHE_TTL", "86400"))
+REFERENCE_TTL_SETS = float(os.getenv("TCGDEX_CACHE_TTL_SETS", "21600"))
+PREWARM = os.getenv("TCGDEX_PREWARM", "0") == "1"
+
+# name of each reference list -> function loading it with the SDK client of a language
+REFERENCE_LOADERS = {
+    "types": lambda sdk: sdk.type.listSync(),
+    "rarities": lambda sdk: sdk.rarity.listSync(),
+    "series": lambda sdk: [tools.SerieResume_to_dict(serie) for serie in sdk.serie.listSync()],
+    "sets": lambda sdk: [tools.SetResume_to_dict(set) for set in sdk.set.listSync()],
+    "trainerTypes": lambda sdk: sdk.trainerType.listSync(),
+    "energyTypes": lambda sdk: sdk.energyType.listSync(),
+    "stages": lambda sdk: sdk.stage.listSync(),
+    "regulationMarks": lambda sdk: sdk.regulationMark.listSync(),
+    "categories": lambda sdk: sdk.category.listSync(),
+    "illustrators": lambda sdk: sdk.illustrator.listSync(),
+    # id and name of every card, source of the name index
+    "cardNames": lambda sdk: [[card.id, card.name] for card in sdk.card.listSync()],
+}
+REFERENCE_TTLS = {name: REFERENCE_TTL for name in REFERENCE_LOADERS} | {
+    "sets": REFERENCE_TTL_SETS, "series": REFERENCE_TTL_SETS, "cardNames": REFERENCE_TTL_SETS}
+
+
+# reference data caches by language, created on first use
+reference_caches: dict[str, cache.TTLCache] = {}
+
+
+def get_reference_cache(lang: str) -> cache.TTLCache:
+    """ Returns the reference data cache of a language, persisted to its own file or to the shared store. """
+    reference = reference_caches.get(lang)
+    if reference is None:
+        reference = reference_caches[lang] = cache.TTLCache(
+            path=os.path.join(cache.CACHE_DIR, f"reference_{lang}.json") if cache.CACHE_PERSIST else None,
+            namespace=f"reference_{lang}",
+        )
+    return reference
+
+
+async def get_reference(name: str, lang: str = None) -> list:
+    """
+    Returns a reference list from the cache, loading it from TCGdex on a miss.
+
+    Args:
+        name (str): The name of the list, one of REFERENCE_LOADERS.
+        lang (str, optional): The TCGdex language. Default is None (TCGDEX_LANGUAGE).
+    Returns:
+        list: The reference list.
+    """
+    lang = lang or language
+    try:
+        return await get_reference_cache(lang).get_or_load(
+            name, lambda: call_tcgdex(name, REFERENCE_LOADERS[name], get_sdk(lang)), REFERENCE_TTLS[name])
+    except Exception as e:
+        logging.error(f"Error fetching {name} ({lang}): {e}")
+        return []
+
+
+# typo tolerant card name indexes by language, and the version of the source each one was last updated from
+name_indexes: dict[str, "name_index.NameIndex"] = {}
+name_index_sources: dict[str, tuple] = {}
+
+
+async def get_name_index(lang: str) -> "name_index.NameIndex":
+    """
+    Returns the name index of a language, built from the local catalog when it is synced, else from
+    the cached card list. Only the cards added or removed since the last update are processed when
+    the source changes (new sync or reloaded card list).
+
+    Args:
+        lang (str): The TCGdex language.
+    Returns:
+        NameIndex: The index.
+    """
+    import catalog
+    import name_index
+
+    index = name_indexes.setdefault(lang, name_index.NameIndex())
+    mirror = catalog.open_catalog(lang)
+    if mirror is not None:
+        cards = None
+        source = ("catalog", mirror.get_meta("synced_at"))
+    else:
+        # the card list is not compared, the version of its cache entry changes when it is loaded again
+        cards = await get_reference("cardNames", lang)
+        source = ("cardNames", get_reference_cache(lang).version("cardNames")) if cards else None
+    if source is not None and source != name_index_sources.get(lang):
+        if cards is None:
+            cards = await asyncio.to_thread(mirror.card_names)
+        changes = await asyncio.to_thread(index.update, cards)
+        name_index_sources[lang] = source
+        logging.info("Name index (%s) updated: %d cards added, %d removed", lang, changes["added"], changes["removed"])
+    return index
+
+
+async def prewarm_references() -> None:
+    """ Loads every reference list of the default language concurrently. """
+    await asyncio.gather(*(get_reference(name) for name in REFERENCE_LOADERS))
+    logging.info("Reference data prewarmed.")
+
+
+def collect_components() -> dict:
+    """ Returns the state of the caches and upstream governors for the metrics. """
+    plans = query_plan.compile.cache_info()
+    components = {
+        "referenceCache": {lang: {"hits": reference.hits, "misses": reference.misses}
+                           for lang, reference in reference_caches.items()},
+        "cardFacts": {"hits": card_facts.hits, "misses": card_facts.misses},
+        "nameIndex": {lang: index.stats() for lang, index in name_indexes.items()},
+        "cardCache": {"hits": card_details.hits, "misses": card_details.misses} if card_details is not None else None,
+        "queryPlans": {"hits": plans.hits, "misses": plans.misses, "size": plans.currsize},
+        "cursors": {"open": len(get_cursor_store())},
+        "tcgdex": get_tcgdex_upstream().stats(),
+    }
+    justTCG = loaded("justTCG")
+    if justTCG is not None:
+        components["justtcg"] = justTCG.upstream.stats()
+        components["justtcgCoalescing"] = {"singleFlight": justTCG.single_flight.stats(),
+                                           "batches": justTCG.lookup_batcher.stats()}
+        if justTCG.price_cache is not None:
+            components["priceCache"] = justTCG.price_cache.stats()
+    return components
+
+metrics.registry.register_collector("server", collect_components)
+
+
+async def write_metrics_file() -> None:
+    """ Writes the Prometheus metrics file every MCP_METRICS_INTERVAL seconds. """
+    while True:
+        try:
+            await asyncio.to_thread(metrics.write_prometheus, metrics.METRICS_FILE)
+        except OSError as e:
+            logging.error(f"Error writing the metrics file: {e}")
+        await asyncio.sleep(metrics.METRICS_INTERVAL)
+
+
+@asynccontextmanager
+async def process_resources() -> AsyncIterator[None]:
+    """
+    Prewarms the reference cache if enabled, starts the optional Prometheus exporters, and releases the watchlist
+    refresher, the pooled upstream connections, the card map, the image store and the shared store on shutdown.
+    """
+    prewarm = asyncio.create_task(prewarm_references()) if PREWARM else None
+    metrics_writer = asyncio.create_task(write_metrics_file()) if metrics.METRICS_FILE else None
+    metrics_server = None
+    if metrics.METRICS_PORT:
+        try:
+            metrics_server = metrics.serve_prometheus(metrics.METRICS_PORT)
+        except OSError as e:
+            # with several workers only the first one gets the port
+            logging.warning(f"Metrics not served on port {metrics.METRICS_PORT}: {e}")
+    try:
+        yield
+    finally:
+        for task in (prewarm, metrics_writer):
+            if task is not None:
+                task.cancel()
+        if metrics_server is not None:
+            metrics_server.shutdown()
+        # only the subsystems used since the start have been imported
+        if (watchlist := loaded("watchlist")) is not None:
+            await watchlist.stop()
+        if (justTCG := loaded("justTCG")) is not None:
+            await justTCG.aclose()
+        if (images := loaded("images")) is not None:
+            await images.aclose()
+            images.close_store()
+        if (card_map := loaded("card_map")) is not None:
+            card_map.close_card_map()
+        cache.close_shared_store()
+
+
+def watchlist_exists() -> bool:
+    """ Checks if a watchlist has been created in watchlist.WATCHLIST_DIR, without importing the watchlist and JustTCG. """
+    directory = os.getenv("JUSTTCG_WATCHLIST_DIR", os.path.join(cache.CACHE_DIR, "watchlist"))
+    return os.path.exists(os.path.join(directory, "watchlist.sqlite"))
+
+
+def with_watchlist_refresher(function):
+    """
+    Wraps a JustTCG tool to start the refresher of an existing watchlist on the first call. The refresher
+    is not started with the server, importing the watchlist loads JustTCG and numpy before the handshake.
+    """
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs):
+        if loaded("watchlist") is None and watchlist_exists():
+            import watchlist
+            watchlist.start_refresher()
+        return await function(*args, **kwargs)
+
+    return wrapper
+
+
+@asynccontextmanager
+async def lifespan(server: FastMCP) -> AsyncIterator[None]:
+    """ Runs the process resources for the stdio session, the HTTP transports run them once per worker in create_app. """
+    if TRANSPORT != "stdio":
+        yield
+        return
+    async with process_resources():
+        yield
 
 # initialize FastMCP server
-mcp = FastMCP("Pokemon TCG MCP Server")
+mcp = FastMCP("Pokemon TCG MCP Server", lifespan=lifespan, host=HTTP_HOST, port=HTTP_PORT, stateless_http=STATELESS_HTTP)
+# None lets FastMCP derive the output schema from the return annotation
+tool = functools.partial(mcp.tool, structured_output=False if FAST_STARTUP else None)
 
 
-@mcp.tool()
-async def get_available_types() -> list[str]:
-    """ Returns a list of all available Pokémon types. """
-    types = await sdk.type.list()
+@tool()
+async def get_available_types(language: str = None) -> list[str]:
+    """
+    Returns a list of all available Pokémon types.
+
+    Args:
+        language (str, optional): The TCGdex language (e.g. "fr", "de", "ja"). Default is None (the server language).
+    """
+    types = await get_reference("types", resolve_language(language))
     if not types:
         logging.warning("No types found.")
         return []
     else:
         return types
 
-@mcp.tool()
-async def get_available_rarities() -> list[str]:
-    """ Returns a list of all available Cards rarities. """
-    rarities = await sdk.rarity.list()
+@tool()
+async def get_available_rarities(language: str = None) -> list[str]:
+    """
+    Returns a list of all available Cards rarities.
+
+    Args:
+        language (str, optional): The TCGdex language (e.g. "fr", "de", "ja"). Default is None (the server language).
+    """
+    rarities = await get_reference("rarities", resolve_language(language))
     if not rarities:
         logging.warning("No rarities found.")
         return []
     else:
         return rarities
 
-@mcp.tool()
-async def get_available_series() -> list[dict[str, Any]]:
-    """ Returns a list of all available Cards series. """
+@tool()
+async def get_available_series(language: str = None) -> list[dict[str, Any]]:
+    """
+    Returns a list of all available Cards series.
+
+    Args:
+        language (str, optional): The TCGdex language (e.g. "fr", "de", "ja"). Default is None (the server language).
+    """
+
+    return await get_reference("series", resolve_language(language))
 
-    return [tools.SerieResume_to_dict(serie) for serie in await sdk.serie.list()]
+@tool()
+async def get_available_sets(language: str = None) -> list[dict[str, Any]]:
+    """
+    Returns a list of all available Cards sets.
 
-@mcp.tool()
-async def get_available_sets() -> list[dict[str, Any]]:
-    """ Returns a list of all available Cards sets. """
-    sets = await sdk.set.list()
+    Args:
+        language (str, optional): The TCGdex language (e.g. "fr", "de", "ja"). Default is None (the server language).
+    """
+    sets = await get_reference("sets", resolve_language(language))
     if not sets:
         logging.warning("No sets found.")
         return []
     else:
-        return [tools.SetResume_to_dict(set) for set in sets]
+        return sets
+
+@tool()
+async def get_available_trainerTypes(language: str = None) -> list[str]:
+    """
+    Returns a list of all available Trainer types.
 
-@mcp.tool()
-async def get_available_trainerTypes() -> list[str]:
-    """ Returns a list of all available Trainer types. """
-    trainer_types = await sdk.trainerType.list()
+    Args:
+        language (str, optional): The TCGdex language (e.g. "fr", "de", "ja"). Default is None (the server language).
+    """
+    trainer_types = await get_reference("trainerTypes", resolve_language(language))
     if not trainer_types:
         logging.warning("No trainer types found.")
         return []
     else:
         return trainer_types
 
-@mcp.tool()
-async def get_available_energyTypes() -> list[str]:
-    """ Returns a list of all available Energy types. """
-    energy_types = await sdk.energyType.list()
+@tool()
+async def get_available_energyTypes(language: str = None) -> list[str]:
+    """
+    Returns a list of all available Energy types.
+
+    Args:
+        language (str, optional): The TCGdex language (e.g. "fr", "de", "ja"). Default is None (the server language).
+    """
+    energy_types = await get_reference("energyTypes", resolve_language(language))
     if not energy_types:
         logging.warning("No energy types found.")
         return []
     else:
         return energy_types
 
-@mcp.tool()
-async def get_available_stages() -> list[str]:
-    """ Returns a list of all available Pokémon stages. """
-    stages = await sdk.stage.list()
+@tool()
+async def get_available_stages(language: str = None) -> list[str]:
+    """
+    Returns a list of all available Pokémon stages.
+
+    Args:
+        language (str, optional): The TCGdex language (e.g. "fr", "de", "ja"). Default is None (the server language).
+    """
+    stages = await get_reference("stages", resolve_language(language))
     if not stages:
         logging.warning("No stages found.")
         return []
     else:
         return stages
 
-@mcp.tool()
-async def get_available_regulationMarks() -> list[str]:
-    """ Returns a list of all available Regulation Marks. """
+@tool()
+async def get_available_regulationMarks(language: str = None) -> list[str]:
+    """
+    Returns a list of all available Regulation Marks.
+
+    Args:
+        language (str, optional): The TCGdex language (e.g. "fr", "de", "ja"). Default is None (the server language).
+    """
 
-    regulation_marks = await sdk.regulationMark.list()
+    regulation_marks = await get_reference("regulationMarks", resolve_language(language))
     if not regulation_marks:
         logging.warning("No regulation marks found.")
         return []
     else:
         return regulation_marks
 
-@mcp.tool()
-async def get_available_categories() -> list[str]:
-    """ Returns a list of all available Card categories. """
+@tool()
+async def get_available_categories(language: str = None) -> list[str]:
+    """
+    Returns a list of all available Card categories.
+
+    Args:
+        language (str, optional): The TCGdex language (e.g. "fr", "de", "ja"). Default is None (the server language).
+    """
     
-    categories = await sdk.category.list()
+    categories = await get_reference("categories", resolve_language(language))
     if not categories:
         logging.warning("No categories found.")
         return []
     else:
         return categories
     
-@mcp.tool()
-async def get_available_illustrators() -> list[str]:
-    """ Returns a list of all available Card illustrators. """
+@tool()
+async def get_available_illustrators(language: str = None) -> list[str]:
+    """
+    Returns a list of all available Card illustrators.
+
+    Args:
+        language (str, optional): The TCGdex language (e.g. "fr", "de", "ja"). Default is None (the server language).
+    """
     
-    illustrators = await sdk.illustrator.list()
+    illustrators = await get_reference("illustrators", resolve_language(language))
     if not illustrators:
         logging.warning("No illustrators found.")
         return []
@@ -125,62 +578,161 @@ async def get_available_illustrators() -> list[str]:
         return illustrators
     
 
-@mcp.tool()
-async def get_card_by_id(card_ids: list[str]) -> list[dict]:
+@tool()
+async def invalidate_cache(names: list[str] = None, language: str = None) -> list[str]:
+    """
+    Clears cached reference data so that the next call fetches it from TCGdex again.
+    Use it after a new set is released.
+    
+    Args:
+        names (list[str], optional): The lists to clear, among: types, rarities, series, sets, trainerTypes, energyTypes, stages, regulationMarks, categories, illustrators, cardNames (the card names of resolve_card_name). Default is None (clear everything).
+        language (str, optional): Only clear the lists of this TCGdex language. Default is None (every language).
+    Returns:
+        list[str]: The names of the cleared lists.
+    """
+    languages = [resolve_language(language)] if language else list(reference_caches)
+    cleared = set()
+    for lang in languages:
+        cleared.update(get_reference_cache(lang).invalidate(names))
+    return sorted(cleared)
+
+
+@tool()
+async def get_server_metrics(include_traces: bool = False) -> dict:
+    """
+    Returns diagnostics of this server, to find out where the time of slow tools goes.
+
+    Args:
+        include_traces (bool, optional): Include the recent sampled traces, with the time spent per phase
+            (TCGdex and JustTCG calls, conversions, serialization). Default is False.
+    Returns:
+        dict: A dictionary with:
+        - tools: calls, errors, in-flight calls, latency (ms) and payload size (bytes) percentiles per tool.
+        - upstream: outcomes, in-flight calls and latency (ms) percentiles per upstream endpoint.
+        - components: cache hit rates and the state of the upstream rate limits and circuit breakers.
+        - traces: the recent sampled traces, if requested.
+    """
+    snapshot = metrics.registry.snapshot()
+    if not include_traces:
+        snapshot.pop("traces")
+    return snapshot
+
+@mcp.resource("metrics://prometheus", mime_type="text/plain")
+def prometheus_metrics() -> str:
+    """ Metrics of the server in the Prometheus text exposition format. """
+    return metrics.registry.prometheus()
+
+@tool()
+async def get_card_by_id(card_ids: list[str], ctx: Context, deadline: float = None, fields: list[str] = None,
+                         language: str = None) -> list[dict]:
     """
     Returns a card or list of cards from their id.
     
     Args:
         card_ids (list[str]): The ID of the card to fetch.
+        deadline (float, optional): Maximum number of seconds to spend fetching, the cards fetched so far are returned once it is reached.
+        fields (list[str], optional): Only return these card fields (e.g. ["id", "name", "image"]). Default is None (all fields).
+        language (str, optional): The TCGdex language (e.g. "fr", "de", "ja"). Default is None (the server language).
     Returns:
         list[Card]: The card object(s) retrieved from the API.
     """
+    lang = resolve_language(language)
     try:
-        cards = await asyncio.gather(*(sdk.card.get(cid) for cid in card_ids), return_exceptions=True)
-        return [tools.Card_to_dict(card) for card in cards if card]
+        return await hydrate_cards(card_ids, lang, fields, deadline, progress_callback(ctx))
     except Exception as e:
         logging.error(f"Error fetching cards with IDs {card_ids}: {e}")
         return []
 
-@mcp.tool()
-async def get_set_by_id(set_ids: list[str]) -> list[dict]:
+@tool()
+async def get_set_by_id(set_ids: list[str], full: bool = False, language: str = None) -> list[dict]:
     """
     Returns a list of sets from their id.
     
     Args:
         set_ids (list[str]): The IDs of the sets to fetch.
+        full (bool, optional): If True, returns the complete sets including their release date, legalities and list of cards. Default is False.
+        language (str, optional): The TCGdex language (e.g. "fr", "de", "ja"). Default is None (the server language).
     Returns:
         list[Set]: The set objects retrieved from the API.
     """
+    lang = resolve_language(language)
     try:
-        sets = await asyncio.gather(*(sdk.set.getSync(set_id) for set_id in set_ids), return_exceptions=True)
+        sets = await get_hydrator("set", lang).hydrate(set_ids)
         logging.info(f"Fetched sets with IDs {set_ids}")
-        return [tools.SetResume_to_dict(set) for set in sets if set]
+        to_dict = tools.Set_to_dict if full else tools.SetResume_to_dict
+        return [to_dict(set) for set in sets]
     except Exception as e:
         logging.error(f"Error fetching sets with IDs {set_ids}: {e}")
         return []
     
-@mcp.tool()
-async def get_serie_by_id(serie_ids: list[str]) -> list[dict]:
+@tool()
+async def get_serie_by_id(serie_ids: list[str], language: str = None) -> list[dict]:
     """
     Returns a list of series from their id.
     Args:
         serie_ids (list[str]): The IDs of the series to fetch.
+        language (str, optional): The TCGdex language (e.g. "fr", "de", "ja"). Default is None (the server language).
     Returns:
         list[Serie]: The serie objects retrieved from the API.
     """
+    lang = resolve_language(language)
     try:
-        series = await asyncio.gather(*(sdk.serie.getSync(serie_id) for serie_id in serie_ids), return_exceptions=True)
+        series = await get_hydrator("serie", lang).hydrate(serie_ids)
         logging.info(f"Fetched series with IDs {serie_ids}")
-        return [tools.Serie_to_dict(serie) for serie in series if serie]
+        return [tools.Serie_to_dict(serie) for serie in series]
     except Exception as e:
         logging.error(f"Error fetching series with IDs {serie_ids}: {e}")
         return []   
 
-@mcp.tool()
-async def get_card_by_query(query:str) -> list[dict]:
+async def list_card_ids(plan: query_plan.QueryPlan, lang: str) -> list[str]:
+    """ Resolves the ids of the cards matching a query in a language, from the local mirror of that language when synced. """
+    import catalog
+
+    mirror = catalog.open_catalog(lang)
+    if mirror is not None:
+        return await asyncio.to_thread(mirror.query_ids, plan)
+    cards = await call_tcgdex("cards", get_sdk(lang).card.listSync, plan.to_query())
+    return [card.id for card in cards or []]
+
+
+async def next_page(state: "cursors.CursorState", deadline: float = None, on_progress=None) -> list[dict]:
+    """
+    Builds the next page of a paginated query and advances its state.
+
+    Args:
+        state (CursorState): The state of the query.
+        deadline (float, optional): Maximum number of seconds to spend fetching the card details.
+        on_progress (Callable, optional): Progress reporter of the current request.
+    Returns:
+        list[dict]: The cards of the page.
+    """
+    import catalog
+
+    if not state.ids and state.next_list_page is not None:
+        plan = dataclasses.replace(state.plan, pagination=(state.next_list_page, state.page_size))
+        state.ids = await list_card_ids(plan, state.language)
+        state.next_list_page = state.next_list_page + 1 if len(state.ids) >= state.page_size else None
+
+    page_ids, state.ids = state.ids[:state.page_size], state.ids[state.page_size:]
+    if not page_ids:
+        return []
+
+    try:
+        mirror = catalog.open_catalog(state.language)
+        if mirror is not None:
+            return [tools.project(card, state.fields) for card in await asyncio.to_thread(mirror.get_cards, page_ids)]
+        return await hydrate_cards(page_ids, state.language, state.fields, deadline, on_progress)
+    except BaseException:
+        # the page is built again by the next attempt
+        state.ids = page_ids + state.ids
+        raise
+
+
+@tool()
+async def get_card_by_query(query:str, ctx: Context, deadline: float = None, fields: list[str] = None,
+                            page_size: int = None, cursor: str = None, language: str = None) -> dict:
     """
-    Returns a list of cards based on a query.
+    Returns a page of cards based on a query, and a cursor to get the next page.
     
     The query should be defined using the TCGdex Query syntax.
     
@@ -191,9 +743,9 @@ async def get_card_by_query(query:str) -> list[dict]:
     - 'contains': to match values that contain a substring takes two parameters: the field to check and the value to compare
     - 'sort': to sort the results by a specific field takes two parameters the field to sort by and the order ('asc' or 'desc')
     - 'greaterOrEqualThan': to filter results greater than or equal to a value takes two parameters: the field to check and the value to compare
-    - 'lessOrEqualThan': to filter results less than or equal to a value takes two parameters: the field to check and the value to compare
+    - 'lesserOrEqualThan': to filter results less than or equal to a value takes two parameters: the field to check and the value to compare
     - 'greaterThan': to filter results greater than a value takes two parameters: the field to check and the value to compare
-    - 'lessThan': to filter results less than a value takes two parameters: the field to check and the value to compare
+    - 'lesserThan': to filter results less than a value takes two parameters: the field to check and the value to compare
     - 'isNull': to filter results where a field is null takes one parameter: the field to check
     - 'paginate': to limit the number of results returned takes two parameters: 'page' and 'itemsPerPage'    
     - 'notEqual': to match values that are not equal to a specific value takes two parameters: the field to check and the value to compare
@@ -201,6 +753,7 @@ async def get_card_by_query(query:str) -> list[dict]:
     - 'notNull': to filter results where a field is not null takes one parameter: the field to check
     
     Following the Query class, you can chain these methods to build your query.
+    The query is parsed, not executed: only the methods above are allowed and their arguments must be string or number literals.
     
     example:
     - To get all cards from the "Base Set" series that are of the "Fire" type and have a rarity of "Rare":
@@ -212,30 +765,238 @@ async def get_card_by_query(query:str) -> list[dict]:
     query = Query().equal("category", "Pokemon").equal("regulationMark", "D").notNull("ability")
     ```
     
+    Results are paginated: the first call returns the first `page_size` cards and a cursor. Call the tool
+    again with the same query and that cursor to get the next page, until the returned cursor is null.
+    When the query does not use 'paginate', the pagination is applied automatically.
+    
     Args:
         query (str): The query to search for cards.
+        deadline (float, optional): Maximum number of seconds to spend fetching the card details, the cards fetched so far are returned once it is reached.
+        fields (list[str], optional): Only return these card fields (e.g. ["id", "name", "image"]), the other fields are not converted. Default is None (all fields).
+        page_size (int, optional): The number of cards per page. Default is None (20, see TCGDEX_PAGE_SIZE).
+        cursor (str, optional): The cursor returned by the previous call, to get the next page.
+        language (str, optional): The TCGdex language (e.g. "fr", "de", "ja") of the query and of the cards, names and
+            types must be given in that language. Default is None (the server language), the next pages keep the language of the first one.
     Returns:
-        list[Card]: A list of card objects matching the query.
+        dict: A dictionary with:
+        - cards (list[Card]): The card objects of the page.
+        - cursor (str): The cursor of the next page, null when there are no more cards.
     """
+    import cursors
+
+    cursor_store = get_cursor_store()
+    if cursor:
+        state = cursor_store.pop(cursor)
+        if state is None:
+            raise ValueError("The cursor is unknown or has expired, run the query again without cursor.")
+        # the page has usually been prepared in the background after the previous call
+        cards = None
+        if state.prefetch:
+            try:
+                cards = await state.prefetch
+            except Exception as e:
+                logging.warning("Prefetch of the next page failed (%s), fetching it again.", e)
+        if cards is None:
+            try:
+                cards = await next_page(state, deadline)
+            except Exception:
+                # keep the cursor so that the client can retry this page
+                state.prefetch = None
+                cursor_store.put(state, cursor)
+                raise
+    else:
+        # parsed without executing anything, equivalent queries share the same cached plan
+        plan = query_plan.compile(query)
+        state = cursors.CursorState(plan, max(1, page_size or cursors.PAGE_SIZE), fields, resolve_language(language))
+        if plan.pagination:
+            # explicit pagination: resolve the requested page once and return it page by page
+            state.ids = await list_card_ids(plan, state.language)
+            state.next_list_page = None
+        cards = await next_page(state, deadline, progress_callback(ctx))
 
-    cards = await sdk.card.list(eval(query))
-    if not cards:
+    state.pages += 1
+    next_cursor = None
+    if not state.exhausted:
+        state.prefetch = asyncio.create_task(next_page(state, deadline))
+        next_cursor = cursor_store.put(state, cursor)
+    elif not cards and not cursor:
         logging.warning("No cards found for the given query.")
-        return []
-    
-    # collect the ids of the cards
-    cards_ids = [tools.CardResume_to_dict(card).get("id") for card in cards]
-    
-    # get the corresponding card objects
-    cards = await asyncio.gather(*(sdk.card.get(card_id) for card_id in cards_ids), return_exceptions=True)
 
-    return [tools.Card_to_dict(card) for card in cards if card]
+    return {"cards": cards, "cursor": next_cursor}
+
+
+@tool()
+async def resolve_card_name(name: str, limit: int = 10, language: str = None) -> list[dict]:
+    """
+    Finds the card names closest to a text, tolerating typos, missing accents and punctuation
+    (e.g. "Charizrd", "Mr Mime", "Flabebe"), and returns the ids of their cards.
+
+    Use it to autocomplete or resolve a card name before searching with it, instead of guessing spellings
+    with get_card_by_query. The names are searched in a local index, without calling TCGdex.
+
+    Args:
+        name (str): The card name, or the beginning of it.
+        limit (int, optional): The maximum number of names returned. Default is 10.
+        language (str, optional): The TCGdex language (e.g. "fr", "de", "ja") of the names. Default is None (the server language).
+    Returns:
+        list[dict]: The closest names first, each with:
+        - name: The card name as written by TCGdex.
+        - score: The similarity with the text, from 0 to 1 (1 for an exact match).
+        - cardIds: The IDs of the cards with that name.
+    """
+    index = await get_name_index(resolve_language(language))
+    return index.search(name, limit)
+
+
+async def fetch_card_images(card_ids: list[str], lang: str) -> list[dict]:
+    """
+    Stores the images of cards in the local image store.
+
+    Args:
+        card_ids (list[str]): The ids of the cards.
+        lang (str): The TCGdex language, the images show the card text in that language.
+    Returns:
+        list[dict]: Per card, its id and the stored image (see images.ImageStore.fetch) or an error.
+    """
+    import images
+
+    cards = {card["id"]: card for card in await hydrate_cards(card_ids, lang, fields=["id", "image"])}
+    urls = [cards[card_id]["image"] for card_id in card_ids if (cards.get(card_id) or {}).get("image")]
+    stored = dict(zip(urls, await images.open_store().fetch_all(urls)))
+    results = []
+    for card_id in card_ids:
+        url = (cards.get(card_id) or {}).get("image")
+        if card_id not in cards:
+            results.append({"id": card_id, "error": "card not found"})
+        elif not url:
+            results.append({"id": card_id, "error": "the card has no image"})
+        elif stored.get(url) is None:
+            results.append({"id": card_id, "url": url, "error": "download failed"})
+        else:
+            results.append({"id": card_id} | stored[url])
+    return results
+
+
+@tool()
+async def get_card_images(card_ids: list[str], language: str = None) -> list[dict]:
+    """
+    Downloads the images of cards into the local image cache and returns their local paths.
+
+    The images are downloaded concurrently and stored by content, images already in the cache are not
+    downloaded again. Use it to prefetch the images of the cards returned by a query.
+    The image quality and format follow the TCGDEX_IMAGE_QUALITY and TCGDEX_IMAGE_TYPE settings.
+
+    Args:
+        card_ids (list[str]): The IDs of the cards.
+        language (str, optional): The TCGdex language (e.g. "fr", "de", "ja") of the images. Default is None (the server language).
+    Returns:
+        list[dict]: One entry per card with:
+        - id: The card ID.
+        - url: The url of the image.
+        - path: The local path of the image file.
+        - digest: The SHA-256 of the image.
+        - bytes: The size of the image.
+        - mimeType: The MIME type of the image.
+        - cached: If the image was already in the cache.
+        - error: The reason why there is no image, if any.
+    """
+    return await fetch_card_images(card_ids, resolve_language(language))
+
+
+@tool(structured_output=False)
+async def view_card_images(card_ids: list[str], language: str = None) -> list[ImageContent | TextContent]:
+    """
+    Returns the images of cards, to look at the card art.
+
+    The images are served from the local image cache and downloaded first when needed.
+
+    Args:
+        card_ids (list[str]): The IDs of the cards.
+        language (str, optional): The TCGdex language (e.g. "fr", "de", "ja") of the images. Default is None (the server language).
+    Returns:
+        list: The image of each card, or a text explaining why a card has no image.
+    """
+    import images
+
+    contents: list[ImageContent | TextContent] = []
+    for image in await fetch_card_images(card_ids, resolve_language(language)):
+        if "error" in image:
+            contents.append(TextContent(type="text", text=f"{image['id']}: {image['error']}"))
+        else:
+            data = await asyncio.to_thread(images.read_base64, image)
+            contents.append(ImageContent(type="image", data=data, mimeType=image["mimeType"]))
+    return contents
+
+
+@tool()
+async def prefetch_set_images(set_ids: list[str], language: str = None) -> dict:
+    """
+    Downloads the images of every card of sets, and the set logos and symbols, into the local image cache.
+
+    Args:
+        set_ids (list[str]): The IDs of the sets.
+        language (str, optional): The TCGdex language (e.g. "fr", "de", "ja") of the images. Default is None (the server language).
+    Returns:
+        dict: Per set ID, the number of images, of images downloaded, of images already cached and of failed downloads,
+        and the total size in bytes of the images of the set.
+    """
+    import images
+
+    lang = resolve_language(language)
+    report = {}
+    async for _, set in get_hydrator("set", lang).stream(set_ids):
+        if set is None:
+            continue
+        set_dict = tools.Set_to_dict(set)
+        urls = [url for url in [set_dict.get("logo"), set_dict.get("symbol")] + [card.get("image") for card in set_dict.get("cards") or []] if url]
+        stored = await images.open_store().fetch_all(urls)
+        report[set.id] = {
+            "images": len(urls),
+            "downloaded": sum(1 for image in stored if image is not None and not image["cached"]),
+            "cached": sum(1 for image in stored if image is not None and image["cached"]),
+            "failed": sum(1 for image in stored if image is None),
+            "bytes": sum(image["bytes"] for image in stored if image is not None),
+        }
+    for set_id in set_ids:
+        report.setdefault(set_id, {"error": "set not found"})
+    return report
+
+
+# PTCGL / PTCGO set code -> TCGdex set ids with that code
+set_codes = cache.TTLCache(maxsize=1000, namespace="set_codes")
+
+
+async def resolve_set_code(code: str, lang: str) -> Union[str, None]:
+    """
+    Returns the TCGdex set of a decklist set code.
+
+    Args:
+        code (str): The set code of the decklist, a PTCGL / PTCGO code ("SVI", "PAL") or a TCGdex set id ("sv01").
+        lang (str): The TCGdex language.
+    Returns:
+        str: The TCGdex set id, None if no set has that code.
+    """
+    for set in await get_reference("sets", lang):
+        if set["id"].casefold() == code.casefold():
+            return set["id"]
+
+    def load(sdk: "TCGdex") -> list[str]:
+        from tcgdexsdk import Query
+        return [set.id for set in sdk.set.listSync(Query().equal("tcgOnline", code))]
+
+    try:
+        set_ids = await set_codes.get_or_load(
+            f"{lang}:{code.upper()}", lambda: call_tcgdex("sets", load, get_sdk(lang)), REFERENCE_TTL_SETS)
+    except Exception as e:
+        logging.error(f"Error resolving the set code {code} ({lang}): {e}")
+        return None
+    return set_ids[0] if set_ids else None
 
 
 if os.getenv("JUSTTCG_API_KEY"):
 
-    @mcp.tool()
-    def get_games_JustTCG() -> list[dict]:
+    @tool()
+    async def get_games_JustTCG() -> list[dict]:
         """
         
         JustTCG is an api that provides access to trading card stores for various games.
@@ -251,10 +1012,11 @@ if os.getenv("JUSTTCG_API_KEY"):
         Returns:
             list[dict]: A list of games with their details.
         """
-        return justTCG.get_list_of_games()
+        import justTCG
+        return await justTCG.get_list_of_games()
 
-    @mcp.tool()
-    def get_sets_JustTCG(game: str) -> list[dict]:
+    @tool()
+    async def get_sets_JustTCG(game: str) -> list[dict]:
         """
         JustTCG is an api that provides access to trading card stores for various games.
         Using this tool, you can access the list of sets available in JustTCG for a specific game.
@@ -272,10 +1034,11 @@ if os.getenv("JUSTTCG_API_KEY"):
         Returns:
             list[dict]: A list of sets with their details.
         """
-        return justTCG.get_list_of_sets(game)
+        import justTCG
+        return await justTCG.get_list_of_sets(game)
 
-    @mcp.tool()
-    def get_cards_by_query_JustTCG(
+    @tool()
+    async def get_cards_by_query_JustTCG(
         tcgplayerId: str = None,
         cardId: str = None,
         variantId: str = None,
@@ -367,7 +1130,8 @@ if os.getenv("JUSTTCG_API_KEY"):
             - minPriceAllTimeDate: The date of the minimum price of the variant since it was added to the database in ISO 8601 date.
             - maxPriceAllTimeDate: The date of the maximum price of the variant since it was added to the database in ISO 8601 date.
         """
-        results = justTCG.get_cards_by_query(
+        import justTCG
+        results = await justTCG.get_cards_by_query(
             tcgplayerId=tcgplayerId,
             cardId=cardId,
             variantId=variantId,
@@ -386,9 +1150,600 @@ if os.getenv("JUSTTCG_API_KEY"):
             return []
         else:
             return results
+
+    @tool()
+    async def get_set_prices_JustTCG(
+        set: str,
+        game: str = "pokemon",
+        condition: str = None,
+        max_cards: int = None
+    ) -> list[dict]:
+        """
+        JustTCG is an api that provides access to trading card stores for various games.
+        Using this tool, you can get the pricing of every card of a set in one call, instead of
+        paging through get_cards_by_query_JustTCG.
+
+        Args:
+            set (str): The set ID to get the prices of (see get_sets_JustTCG).
+            game (str, optional): The game ID of the set. Default is "pokemon".
+            condition (str, optional): valid conditions are [Sealed, Near Mint, Lightly Played, Moderately Played, Heavily Played, Damaged] or abreviations [S, NM, LP, MP, HP, D].
+            max_cards (int, optional): Stop after this number of cards. Default is None (whole set).
+
+        Returns:
+            list[dict]: The cards of the set, with the same fields as get_cards_by_query_JustTCG.
+        """
+        import justTCG
+        cards = []
+        async for card in justTCG.iter_cards_by_query(game=game, set=set, condition=condition):
+            cards.append(card)
+            if max_cards and len(cards) >= max_cards:
+                break
+
+        if not cards:
+            logging.warning(f"No cards found for set '{set}'.")
+        return cards
+
+    async def load_price_matrix(set: str, game: str, condition: str, history: str) -> "analytics.PriceMatrix":
+        """ Loads the price histories of every variant of a JustTCG set. """
+        import analytics
+        import justTCG
+        cards = [card async for card in justTCG.iter_cards_by_query(game=game, set=set, condition=condition)]
+        return analytics.build_matrix(cards, history)
+
+    def variant_summary(matrix: "analytics.PriceMatrix", index: int, **values) -> dict:
+        """ Returns the metadata of a matrix row with rounded values. """
+        import analytics
+        return matrix.variants[index] | {k: analytics.round_or_none(v) for k, v in values.items()}
+
+    @tool()
+    async def get_price_movers_JustTCG(
+        set: str,
+        game: str = "pokemon",
+        condition: str = None,
+        window_days: int = 7,
+        top_n: int = 10,
+        metric: str = "return",
+        history: str = "priceHistory30d"
+    ) -> dict:
+        """
+        JustTCG is an api that provides access to trading card stores for various games.
+        Using this tool, you can rank the variants of a whole set by price change or volatility
+        over a time window, without loading every price history.
+
+        Args:
+            set (str): The set ID to analyze (see get_sets_JustTCG).
+            game (str, optional): The game ID of the set. Default is "pokemon".
+            condition (str, optional): Only analyze this condition (e.g. NM). Default is None (all conditions).
+            window_days (int, optional): Length of the time window in days. Default is 7.
+            top_n (int, optional): Number of variants to return per ranking. Default is 10.
+            metric (str, optional): "return" to rank by price change, "volatility" to rank by the standard deviation of daily log returns. Default is "return".
+            history (str, optional): The price history to use, "priceHistory" (default period) or "priceHistory30d". Default is "priceHistory30d".
+
+        Returns:
+            dict: The number of analyzed variants and, for "return", the top "gainers" and "losers" with their
+            price change, or for "volatility", the "most_volatile" and "least_volatile" variants.
+            Each variant contains its variantId, cardId, name, condition, printing and current price.
+        """
+        import analytics
+        matrix = await load_price_matrix(set, game, condition, history)
+        if not matrix.variants:
+            logging.warning(f"No price history found for set '{set}'.")
+            return {"variants": 0}
+
+        if metric == "volatility":
+            values = analytics.volatility(matrix, window_days)
+            labels = ("most_volatile", "least_volatile")
+        else:
+            values = analytics.windowed_returns(matrix, window_days)
+            labels = ("gainers", "losers")
+
+        return {
+            "variants": len(matrix.variants),
+            "window_days": window_days,
+            labels[0]: [variant_summary(matrix, i, **{metric: values[i]}) for i in analytics.top(values, top_n)],
+            labels[1]: [variant_summary(matrix, i, **{metric: values[i]}) for i in analytics.top(values, top_n, largest=False)],
+        }
+
+    @tool()
+    async def get_set_price_index_JustTCG(
+        set: str,
+        game: str = "pokemon",
+        condition: str = None,
+        rolling_days: int = 7,
+        points: int = 30,
+        history: str = "priceHistory30d"
+    ) -> dict:
+        """
+        JustTCG is an api that provides access to trading card stores for various games.
+        Using this tool, you can follow the price level of a whole set over time.
+
+        Args:
+            set (str): The set ID to analyze (see get_sets_JustTCG).
+            game (str, optional): The game ID of the set. Default is "pokemon".
+            condition (str, optional): Only include this condition (e.g. NM). Default is None (all conditions).
+            rolling_days (int, optional): Length of the moving average window in days. Default is 7.
+            points (int, optional): Maximum number of points returned per series. Default is 30.
+            history (str, optional): The price history to use, "priceHistory" (default period) or "priceHistory30d". Default is "priceHistory30d".
+
+        Returns:
+            dict: A dictionary with:
+            - variants: the number of variants included.
+            - change: the relative change of the equal weighted index over the whole history.
+            - equal_weight: the index where every variant is rebased to 100 on its first price, as {t, v} points (t is a Unix timestamp).
+            - equal_weight_moving_average: the moving average of the equal weighted index.
+            - total: the summed price of every variant, as {t, v} points.
+        """
+        import analytics
+        matrix = await load_price_matrix(set, game, condition, history)
+        if not matrix.variants:
+            logging.warning(f"No price history found for set '{set}'.")
+            return {"variants": 0}
+
+        equal_weight, total = analytics.set_index(matrix)
+        index = analytics.PriceMatrix(matrix.timestamps, equal_weight[None, :], [])
+        moving_average, _ = analytics.rolling_stats(index, rolling_days)
+        return {
+            "variants": len(matrix.variants),
+            "change": analytics.round_or_none(equal_weight[-1] / equal_weight[0] - 1.0),
+            "equal_weight": analytics.sample(equal_weight, matrix.timestamps, points),
+            "equal_weight_moving_average": analytics.sample(moving_average[0], matrix.timestamps, points),
+            "total": analytics.sample(total, matrix.timestamps, points),
+        }
+
+    @tool()
+    async def get_price_correlation_JustTCG(
+        variant_ids: list[str],
+        history: str = "priceHistory30d"
+    ) -> dict:
+        """
+        JustTCG is an api that provides access to trading card stores for various games.
+        Using this tool, you can check how the prices of several card variants move together.
+
+        Args:
+            variant_ids (list[str]): The variant IDs to compare (from the "id" of the variants returned by the other JustTCG tools).
+            history (str, optional): The price history to use, "priceHistory" (default period) or "priceHistory30d". Default is "priceHistory30d".
+
+        Returns:
+            dict: A dictionary with:
+            - variants: the compared variants (variantId, cardId, name, condition, printing, price), variants without history are left out.
+            - correlation: the correlation matrix of the daily returns, in the same order as "variants".
+        """
+        import analytics
+        import justTCG
+        results = await justTCG.get_cards_by_bulk_query([{"variantId": variant_id} for variant_id in variant_ids])
+        # only keep the requested variant of each card
+        cards = [
+            result["card"] | {"variants": [v for v in result["card"].get("variants") or [] if v.get("id") == result["query"]["variantId"]]}
+            for result in results if "card" in result
+        ]
+        matrix = analytics.build_matrix(cards, history)
+        matrix_correlation = analytics.correlation(matrix)
+        return {
+            "variants": matrix.variants,
+            "correlation": [[analytics.round_or_none(v) for v in row] for row in matrix_correlation],
+        }
+
+    @tool()
+    async def get_cards_by_bulk_query_JustTCG(
+        queries: list[dict],
+        max_concurrency: int = None
+    ) -> list[dict]:
+        """
+        JustTCG is an api that provides access to trading card stores for various games.
+        Using this tool, you can price a large number of cards (e.g. a whole collection) in one call.
+
+        The queries are split into batches that fit the JustTCG request size limit and the
+        batches are sent concurrently.
+
+        Args:
+            queries (list[dict]): A list of card queries. Each query is a dictionary with one identifier
+                and optional filters:
+                - tcgplayerId (str, optional): The TCGPlayer ID of the card.
+                - cardId (str, optional): The ID of the card.
+                - variantId (str, optional): The variant ID of the card.
+                - printingId (str, optional): The printing of the card.
+                - condition (str, optional): The condition of the card (e.g., NM for Near Mint).
+                variantId takes precedence over tcgplayerId and tcgplayerId takes precedence over cardId.
+            max_concurrency (int, optional): The maximum number of batches sent at the same time. Default is None (JUSTTCG_BATCH_CONCURRENCY).
+
+        Returns:
+            list[dict]: One entry per query, in the same order as the queries. Each entry contains:
+            - query: the query as sent to JustTCG.
+            - card: the matching card (same fields as get_cards_by_query_JustTCG), if found.
+            - error: the reason why the query failed, if it failed.
+        """
+        import justTCG
+        entries: list[Union[dict, None]] = []
+        for query in queries:
+            try:
+                entries.append(justTCG.build_card_query(**query))
+            except TypeError:
+                entries.append(None)
+
+        valid = [entry for entry in entries if entry]
+        results = iter(await justTCG.get_cards_by_bulk_query(valid, max_concurrency=max_concurrency or justTCG.BATCH_CONCURRENCY))
+
+        return [next(results) if entry else {"query": query, "error": "invalid query"}
+                for query, entry in zip(queries, entries)]
+
+    # variant fields attached to the cards of get_priced_cards_by_query_JustTCG
+    PRICE_FIELDS = ("id", "printing", "condition", "price", "lastUpdated",
+                    "priceChange24hr", "priceChange7d", "priceChange30d")
+    # serializes the on-demand mapping of sets, concurrent searches would otherwise map the same set twice
+    card_map_lock = asyncio.Lock()
+
+    async def map_sets(set_ids: list[str] = None, full: bool = False) -> dict:
+        """
+        Maps TCGdex sets to JustTCG in the card map.
+
+        Args:
+            set_ids (list[str], optional): The sets to map, every TCGdex set when None.
+            full (bool, optional): Map the sets again even if their mapping is up to date.
+        Returns:
+            dict: Per mapped set id, the JustTCG set and the number of cards and mapped cards.
+        """
+        import card_map
+        index = card_map.open_card_map()
+        set_resumes = await get_reference("sets", "en")
+        if set_ids is not None:
+            set_resumes = [set for set in set_resumes if set["id"] in set_ids]
+        async with card_map_lock:
+            stale = ([set["id"] for set in set_resumes] if full
+                     else await asyncio.to_thread(card_map.stale_sets, index, set_resumes))
+            # JustTCG names the sets in English, the TCGdex ids are the same in every language
+            return await card_map.build(index, get_hydrator("set", "en"), stale)
+
+    def price_summary(card: dict) -> dict:
+        """ Keeps the identifiers of a JustTCG card and the price fields of its variants. """
+        return {
+            "cardId": card.get("id"),
+            "tcgplayerId": card.get("tcgplayerId"),
+            "variants": [{field: variant[field] for field in PRICE_FIELDS if field in variant}
+                         for variant in card.get("variants") or []],
+        }
+
+    async def price_cards(card_ids: list[str], condition: str = None) -> dict[str, dict]:
+        """
+        Prices TCGdex cards in one bulk JustTCG request, linking them through the card map and
+        mapping their sets first when they are not mapped yet.
+
+        Args:
+            card_ids (list[str]): The TCGdex card ids.
+            condition (str, optional): Only return the prices in this condition.
+        Returns:
+            dict: Per card id, {"prices": price_summary} or {"error": reason}.
+        """
+        import card_map
+        import justTCG
+        index = card_map.open_card_map()
+        mapping = await asyncio.to_thread(index.lookup, card_ids)
+        unmapped_sets = {card_id.rsplit("-", 1)[0] for card_id in card_ids if card_id not in mapping}
+        if unmapped_sets:
+            await map_sets(sorted(unmapped_sets))
+            mapping = await asyncio.to_thread(index.lookup, card_ids)
+
+        mapped = [card_id for card_id in card_ids if card_id in mapping]
+        queries = [justTCG.build_card_query(tcgplayerId=mapping[card_id]["tcgplayerId"],
+                                            cardId=None if mapping[card_id]["tcgplayerId"] else mapping[card_id]["cardId"],
+                                            condition=condition)
+                   for card_id in mapped]
+        results = dict(zip(mapped, await justTCG.get_cards_by_bulk_query(queries))) if queries else {}
+
+        prices = {}
+        for card_id in card_ids:
+            result = results.get(card_id)
+            if result is None:
+                prices[card_id] = {"error": "not in the card map"}
+            elif "card" not in result:
+                prices[card_id] = {"error": result.get("error", "not found")}
+            else:
+                prices[card_id] = {"prices": price_summary(result["card"])}
+        return prices
+
+    @tool()
+    async def get_priced_cards_by_query_JustTCG(
+        query: str,
+        ctx: Context,
+        condition: str = None,
+        fields: list[str] = None,
+        page_size: int = None,
+        cursor: str = None,
+        language: str = None,
+        deadline: float = None,
+    ) -> dict:
+        """
+        Searches cards with a TCGdex query and returns them with their JustTCG prices.
+
+        The query, pagination and card fields are the same as get_card_by_query. The TCGdex cards are
+        linked to JustTCG through the card map, the sets not mapped yet are mapped on first use (which
+        takes a few JustTCG requests per set), then the whole page is priced in one batched JustTCG request.
+
+        Args:
+            query (str): The TCGdex query (see get_card_by_query).
+            condition (str, optional): Only return the prices in this condition (e.g., NM for Near Mint).
+            fields (list[str], optional): Only return these card fields, "id" is always included. Default is None (all fields).
+            page_size (int, optional): The number of cards per page. Default is None (20, see TCGDEX_PAGE_SIZE).
+            cursor (str, optional): The cursor returned by the previous call, to get the next page.
+            language (str, optional): The TCGdex language of the query and of the cards (see get_card_by_query).
+            deadline (float, optional): Maximum number of seconds to spend fetching the card details.
+        Returns:
+            dict: A dictionary with:
+            - cards (list[Card]): The cards of the page, each with a "prices" entry holding the JustTCG cardId,
+              the tcgplayerId and the variants (printing, condition, price, lastUpdated, price changes),
+              null when the card is not priced.
+            - cursor (str): The cursor of the next page, null when there are no more cards.
+            - unpriced (list[dict]): The id of the cards without prices and the reason.
+        """
+        import cursors
+        import justTCG
+        if fields is not None and "id" not in fields:
+            fields = ["id", *fields]
+        page = await get_card_by_query(query, ctx, deadline, fields, min(page_size or cursors.PAGE_SIZE, justTCG.BATCH_SIZE), cursor, language)
+        cards = page["cards"]
+        prices = await price_cards([card["id"] for card in cards], condition)
+
+        unpriced = []
+        for card in cards:
+            card["prices"] = prices[card["id"]].get("prices")
+            if card["prices"] is None:
+                unpriced.append({"id": card["id"], "reason": prices[card["id"]]["error"]})
+        return {"cards": cards, "cursor": page["cursor"], "unpriced": unpriced}
+
+    DECK_CARD_FIELDS = ["id", "name", "localId", "set", "category", "rarity", "regulationMark", "legal", "image"]
+    DECK_FORMATS = ("standard", "expanded")
+
+    @tool()
+    async def price_decklist_JustTCG(decklist_text: str, condition: str = "NM", language: str = None) -> dict:
+        """
+        Resolves a decklist to TCGdex cards, checks its legality and prices it with JustTCG.
+
+        Every line is resolved from its set code and collector number, the unique sets and cards are
+        fetched concurrently and the unique cards are priced in one batched JustTCG request. Basic energies
+        are recognized by name and not looked up: they are legal in every format and left unpriced.
+
+        Example decklist (the PTCGL / PTCGO export format):
+            Pokémon: 2
+            2 Pikachu ex SVI 57
+            Trainer: 1
+            4 Ultra Ball SVI 196
+
+        Args:
+            decklist_text (str): The decklist, one "<count> <name> <set code> <number>" line per card. The set code
+                is a PTCGL / PTCGO code (e.g. "SVI", "PAL") or a TCGdex set id (e.g. "sv01").
+            condition (str, optional): The condition of the prices (e.g., NM for Near Mint). Default is NM.
+            language (str, optional): The TCGdex language of the returned cards (see get_card_by_query).
+        Returns:
+            dict: A dictionary with:
+            - cards (list[dict]): Per decklist line, the count, name, setCode and number of the line, the TCGdex id
+              and card (null when not resolved), the basicEnergy type (null for the other cards), the legal formats,
+              the unitPrice (lowest price of the card variants in the condition) and the value (count x unitPrice),
+              null when the card is not priced.
+            - totalCards (int): The number of cards of the deck.
+            - uniqueCards (int): The number of distinct resolved cards.
+            - totalValue (float): The value of the priced cards.
+            - pricedCards (int): The number of cards of the deck with a price.
+            - legality (dict): Per format (standard, expanded), whether every line is a basic energy or is resolved to a card legal in it.
+            - unpriced (list[dict]): The id of the cards without prices and the reason.
+            - unresolved (list[str]): The lines whose set or card was not found, basic energies are never unresolved.
+            - unparsed (list[str]): The lines that are not card lines.
+        """
+        import decklist
+        lang = resolve_language(language)
+        lines, unparsed = decklist.parse(decklist_text)
+
+        codes = sorted({line.set_code for line in lines if line.energy is None})
+        set_ids = dict(zip(codes, await asyncio.gather(*(resolve_set_code(code, lang) for code in codes))))
+        sets = {set.id: tools.Set_to_dict(set)
+                for set in await get_hydrator("set", lang).hydrate(sorted({id for id in set_ids.values() if id}))}
+        card_ids = [decklist.find_card(sets[set_ids[line.set_code]].get("cards") or [], line.number)
+                    if line.energy is None and set_ids[line.set_code] in sets else None
+                    for line in lines]
+
+        unique_ids = list(dict.fromkeys(id for id in card_ids if id))
+        details, prices = await asyncio.gather(hydrate_cards(unique_ids, lang, DECK_CARD_FIELDS),
+                                               price_cards(unique_ids, condition))
+        details = {card["id"]: card for card in details}
+
+        cards, unresolved = [], []
+        total_value = 0.0
+        priced = 0
+        for line, card_id in zip(lines, card_ids):
+            if card_id is None and line.energy is None:
+                unresolved.append(line.line)
+            variants = prices[card_id].get("prices", {}).get("variants") if card_id else None
+            unit_price = min((variant["price"] for variant in variants or [] if variant.get("price") is not None), default=None)
+            card = details.get(card_id)
+            cards.append({
+                "count": line.count, "name": line.name, "setCode": line.set_code, "number": line.number,
+                "section": line.section, "id": card_id, "card": card, "basicEnergy": line.energy,
+                "legal": ", ".join(DECK_FORMATS) if line.energy else (card.get("legal") if card else None),
+                "unitPrice": unit_price,
+                "value": round(line.count * unit_price, 2) if unit_price is not None else None,
+            })
+            if unit_price is not None:
+                total_value += line.count * unit_price
+                priced += line.count
+
+        resolved = [card["legal"] or "" for card in cards if card["card"] or card["basicEnergy"]]
+        return {
+            "cards": cards,
+            "totalCards": sum(line.count for line in lines),
+            "uniqueCards": len(unique_ids),
+            "totalValue": round(total_value, 2),
+            "pricedCards": priced,
+            "legality": {format: bool(resolved) and not unresolved and all(format in legal for legal in resolved)
+                         for format in DECK_FORMATS},
+            "unpriced": [{"id": card_id, "reason": prices[card_id]["error"]}
+                         for card_id in unique_ids if "error" in prices[card_id]],
+            "unresolved": unresolved,
+            "unparsed": unparsed,
+        }
+
+    @tool()
+    async def add_to_watchlist_JustTCG(entries: list[dict]) -> list[dict]:
+        """
+        Watches the prices of cards: the server refreshes them in the background and keeps their history,
+        which the get_watchlist_* tools read without calling JustTCG.
+
+        Args:
+            entries (list[dict]): The entries to watch, each with:
+                - variantId (str, optional): The variant to watch.
+                - tcgplayerId (str, optional): The card to watch, every variant (or every variant in the condition).
+                - condition (str, optional): Only watch this condition (e.g., NM for Near Mint).
+                - above (float, optional): Report when the price rises above this value.
+                - below (float, optional): Report when the price falls below this value.
+                Adding an entry already watched updates its thresholds.
+        Returns:
+            list[dict]: The watched entries, with their id.
+        """
+        import watchlist
+        added = await asyncio.to_thread(watchlist.open_watchlist().add, entries)
+        watchlist.start_refresher()
+        watchlist.wake()
+        return added
+
+    @tool()
+    async def remove_from_watchlist_JustTCG(entry_ids: list[int]) -> int:
+        """
+        Stops watching entries, the history of their prices is kept.
+
+        Args:
+            entry_ids (list[int]): The ids of the entries (see get_watchlist_JustTCG).
+        Returns:
+            int: The number of removed entries.
+        """
+        import watchlist
+        return await asyncio.to_thread(watchlist.open_watchlist().remove, entry_ids)
+
+    @tool()
+    async def get_watchlist_JustTCG() -> list[dict]:
+        """
+        Returns the watched entries.
+
+        Returns:
+            list[dict]: The entries with their id, kind (variantId or tcgplayerId), key, condition, thresholds,
+            last refresh time (refreshedAt), last error and number of variants observed.
+        """
+        import watchlist
+        return await asyncio.to_thread(watchlist.open_watchlist().entries)
+
+    @tool()
+    async def get_watchlist_changes_JustTCG(hours: float = 24, min_change_percent: float = 0, top_n: int = 50) -> list[dict]:
+        """
+        Returns the price changes of the watched variants, from the stored history (no JustTCG call).
+
+        Args:
+            hours (float, optional): The period of the change, the price `hours` ago is compared to the latest one. Default is 24.
+            min_change_percent (float, optional): Only return the variants whose price moved at least this much. Default is 0.
+            top_n (int, optional): The maximum number of variants returned. Default is 50.
+        Returns:
+            list[dict]: The variants by decreasing absolute change with variantId, cardId, name, printing, condition,
+            priceThen, timeThen, priceNow, timeNow, change and changePercent.
+        """
+        import watchlist
+        return await asyncio.to_thread(watchlist.changes, watchlist.open_watchlist(), time.time() - hours * 3600,
+                                       min_change_percent, top_n)
+
+    @tool()
+    async def get_watchlist_alerts_JustTCG(hours: float = 24) -> list[dict]:
+        """
+        Returns the watched variants whose price crossed the "above" or "below" threshold of their entry,
+        from the stored history (no JustTCG call).
+
+        Args:
+            hours (float, optional): Report the crossings of the last `hours` hours. Default is 24.
+        Returns:
+            list[dict]: One event per crossing, most recent first, with variantId, cardId, name, printing, condition,
+            crossed ("above" or "below"), threshold, previousPrice, price and time.
+        """
+        import watchlist
+        return await asyncio.to_thread(watchlist.crossings, watchlist.open_watchlist(), time.time() - hours * 3600)
+
+    @tool()
+    async def get_watchlist_history_JustTCG(variant_ids: list[str], hours: float = None) -> dict:
+        """
+        Returns the stored price history of watched variants (no JustTCG call).
+
+        Args:
+            variant_ids (list[str]): The variant IDs.
+            hours (float, optional): Only return the prices of the last `hours` hours. Default is None (everything).
+        Returns:
+            dict: Per variant ID, the [unix time, price] observations in chronological order.
+        """
+        import watchlist
+        since = time.time() - hours * 3600 if hours else 0
+        return await asyncio.to_thread(watchlist.history, watchlist.open_watchlist(), variant_ids, since)
+
+    @tool()
+    async def refresh_card_map_JustTCG(set_ids: list[str] = None, full: bool = False) -> dict:
+        """
+        Updates the card map that links the TCGdex cards to their JustTCG cards.
+
+        The sets are matched by name and the cards by collector number. Only the new sets, the sets whose
+        card count changed and the outdated mappings are updated unless `full` is set. Mapping every set
+        takes many JustTCG requests, prefer a list of sets or the `python card_map.py build` command.
+
+        Args:
+            set_ids (list[str], optional): The TCGdex sets to map (e.g. ["base1", "swsh3"]). Default is None (every set).
+            full (bool, optional): Map the sets again even if their mapping is up to date. Default is False.
+        Returns:
+            dict: A dictionary with:
+            - sets (dict): Per updated set id, the JustTCG set and the number of cards and mapped cards.
+            - index (dict): The number of sets and cards in the card map.
+        """
+        import card_map
+        report = await map_sets(set_ids, full)
+        return {"sets": report, "index": await asyncio.to_thread(card_map.open_card_map().stats)}
+
+    for registered in mcp._tool_manager.list_tools():
+        if registered.name.endswith("_JustTCG"):
+            registered.fn = with_watchlist_refresher(registered.fn)
         
+# every tool registered above records its latency, errors and sampled traces
+metrics.instrument_tools(mcp)
+
+def create_app():
+    """
+    Builds the ASGI app of the HTTP transport, called once by each worker process.
+
+    The session lifespan of FastMCP runs per session (per request when stateless),
+    so the resources of the process are started and released with the app instead.
+    """
+    app = mcp.sse_app() if TRANSPORT == "sse" else mcp.streamable_http_app()
+    session_lifespan = app.router.lifespan_context
+
+    @asynccontextmanager
+    async def app_lifespan(app) -> AsyncIterator[None]:
+        async with session_lifespan(app), process_resources():
+            yield
+            logging.info("Shutting down worker %d.", os.getpid())
+
+    app.router.lifespan_context = app_lifespan
+    return app
+
+
+def main() -> None:
+    """ Runs the server on the transport selected by MCP_TRANSPORT. """
+    if TRANSPORT == "stdio":
+        mcp.run(transport="stdio")
+        return
+    if TRANSPORT not in ("streamable-http", "sse"):
+        raise SystemExit(f"Unknown MCP_TRANSPORT '{TRANSPORT}', use stdio, streamable-http or sse.")
+    if TRANSPORT == "sse" and WORKERS > 1:
+        raise SystemExit("The sse transport keeps its sessions in the memory of a worker, use streamable-http with MCP_WORKERS > 1.")
+    if WORKERS > 1 and not cache.SHARED_CACHE_PATH:
+        logging.warning("MCP_SHARED_CACHE is not set, each worker keeps its own caches and cursors.")
+
+    import uvicorn
+
+    # several workers need an import string, each worker process imports the module and builds its own app
+    uvicorn.run("server:create_app" if WORKERS > 1 else create_app(), factory=WORKERS > 1,
+                app_dir=os.path.dirname(os.path.abspath(__file__)), host=HTTP_HOST, port=HTTP_PORT,
+                workers=WORKERS, limit_concurrency=HTTP_MAX_CONCURRENCY,
+                timeout_graceful_shutdown=GRACEFUL_TIMEOUT, log_level=mcp.settings.log_level.lower())
+
+
 if __name__ == "__main__":
-    
-    mcp.run(transport='stdio')
+    main()
     
     
\ No newline at end of file
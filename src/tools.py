@@ -1,35 +1,58 @@
-from tcgdexsdk import TCGdex
-from tcgdexsdk import Card, Set, Serie, SerieResume, SetResume, CardResume
-
-from tcgdexsdk.models.subs import CardAttack, CardAbility, Legal
+from __future__ import annotations
 
+import dataclasses
+import functools
 import os
+from typing import TYPE_CHECKING, Any, Callable, Union
+
+import metrics
+
+# the SDK is only imported when the first objects are converted
+if TYPE_CHECKING:
+    from tcgdexsdk import Card, Set, Serie, SerieResume, SetResume, CardResume
+    from tcgdexsdk.models.subs import Booster, CardAttack, CardAbility, CardItem, CardVariants, CardWeakRes, Legal
 
 image_quality = os.getenv("TCGDEX_IMAGE_QUALITY","low")
 image_type = os.getenv("TCGDEX_IMAGE_TYPE","png")
 
+# appended to every image base url, computed once
+image_suffix = "/" + image_quality + "." + image_type
+
+
+@functools.cache
+def flag_fields(model: type) -> tuple[str, ...]:
+    """ Returns the names of the boolean flags of a dataclass (Legal, CardVariants), computed once per class. """
+    return tuple(f.name for f in dataclasses.fields(model))
+
+
+def image_url(base: Union[str, None]) -> Union[str, None]:
+    """ Returns the full image url of an image base url. """
+    return base + image_suffix if base else None
 
+
+@metrics.traced("convert Serie_to_dict")
 def Serie_to_dict(serie: Serie) -> dict:
     """ Converts a Serie object to a dictionary. """
     return {
         'id': serie.id,
         'name': serie.name,
-        'logo': serie.logo + "/" + image_quality + "." + image_type if serie.logo else None,
-        'sets': [SetResume_to_dict(s, image_quality, image_type) for s in serie.sets] if serie.sets else None,
+        'logo': image_url(serie.logo),
+        'sets': [SetResume_to_dict(s) for s in serie.sets] if serie.sets else None,
     }
 
+@metrics.traced("convert Set_to_dict")
 def Set_to_dict(set: Set) -> dict:
     """ Converts a Set object to a dictionary. """
-    
+
     return {
         'id': set.id,
         'name': set.name,
-        'logo': set.logo + "/" + image_quality + "." + image_type if set.logo else None,
-        'symbol': set.symbol +"/" + image_quality + "." + image_type if set.symbol else None,
+        'logo': image_url(set.logo),
+        'symbol': image_url(set.symbol),
         'cardCount': {"total":set.cardCount.total, "official":set.cardCount.official},
         'tcgOnline': set.tcgOnline,
         'releaseDate': set.releaseDate,
-        'legalities': Legal_to_str(set.legalities),
+        'legalities': Legal_to_str(set.legal),
         'cards': [CardResume_to_dict(card) for card in set.cards] if set.cards else None,
     }
 
@@ -39,7 +62,7 @@ def CardResume_to_dict(card_resume: CardResume) -> dict:
         'id': card_resume.id,
         'localId': card_resume.localId,
         'name': card_resume.name,
-        'image': card_resume.image +"/" + image_quality + "." + image_type if card_resume.image else None,
+        'image': image_url(card_resume.image),
     }
 
 def SetResume_to_dict(set_resume: SetResume) -> dict:
@@ -47,14 +70,14 @@ def SetResume_to_dict(set_resume: SetResume) -> dict:
     return {
         'id': set_resume.id,
         'name': set_resume.name,
-        'logo': set_resume.logo + "/" + image_quality + "." + image_type if set_resume.logo else None,
-        'symbol': set_resume.symbol +"/" + image_quality + "." + image_type if set_resume.symbol else None,
+        'logo': image_url(set_resume.logo),
+        'symbol': image_url(set_resume.symbol),
         'cardCount': {"total":set_resume.cardCount.total, "official":set_resume.cardCount.official},
     }
 
 def SerieResume_to_dict(serie_resume: SerieResume) -> dict:
     """ Converts a SerieResume object to a dictionary. """
-    
+
     return {
         'id': serie_resume.id,
         'name': serie_resume.name,
@@ -78,49 +101,97 @@ def CardAbility_to_dict(ability: CardAbility) -> dict:
         'effect': ability.effect,
     }
 
+def CardItem_to_dict(item: CardItem) -> dict:
+    """ Converts an Item object to a dictionary. """
+    return {
+        'name': item.name,
+        'effect': item.effect,
+    }
+
+def CardWeakRes_to_dict(weak_res: CardWeakRes) -> dict:
+    """ Converts a weakness or resistance object to a dictionary. """
+    return {
+        'type': weak_res.type,
+        'value': weak_res.value,
+    }
+
+def Booster_to_dict(booster: Booster) -> dict:
+    """ Converts a Booster object to a dictionary. """
+    return {
+        'id': booster.id,
+        'name': booster.name,
+        'logo': booster.logo,
+        'artwork_front': booster.artwork_front,
+        'artwork_back': booster.artwork_back,
+    }
+
 def Legal_to_str(legal: Legal) -> str:
     """ Converts a Legal object to a string. """
-    potential_legal = legal.__dict__
     # filter out the False values
-    legal_list = [k for k, v in potential_legal.items() if v is not False]
+    legal_list = [name for name in flag_fields(type(legal)) if getattr(legal, name) is not False]
     return ", ".join(legal_list) if legal_list else None
 
-def Card_to_dict(card: Card) -> dict:
-    """ Converts a Card object to a dictionary. """
-    potential_variants = card.variants.__dict__
-    # filter out the False values
-    variants = [k for k, v in potential_variants.items() if v is not False]
-    
-    
-    
-    output = {
-        'illustrator': card.illustrator,
-        'rarity': card.rarity,
-        'category': card.category,
-        "variants" : variants,
-        "set": SetResume_to_dict(card.set),
-        "hp": card.hp,
-        "types":", ".join(card.types) if card.types else None,
-        "evolvesFrom": card.evolvesFrom if card.evolvesFrom else None,
-        "description": card.description if card.description else None,
-        "level": card.level if card.level else None,
-        "stage": card.stage if card.stage else None,
-        "suffix": card.suffix if card.suffix else None,
-        "item": card.item if card.item else None,
-        "abilities": [CardAbility_to_dict(ability) for ability in card.abilities] if card.abilities else None,
-        "attacks" : [CardAttack_to_dict(attack) for attack in card.attacks] if card.attacks else None,
-        "resistances":  card.resistances if card.resistances else None,
-        "retreat": card.retreat,
-        "effect": card.effect if card.effect else None,
-        "trainerType": card.trainerType if card.trainerType else None,
-        "energyType": card.energyType if card.energyType else None,
-        "regulationMark": card.regulationMark,
-        "legal": Legal_to_str(card.legal),
-        "id": card.id,
-        "localId": card.localId,
-        "name": card.name,
-        "image": card.image +"/" + image_quality + "." + image_type if card.image else None,
-        "boosters": card.boosters if card.boosters else None}
-    
-    # return only the fields that are not None
-    return {k: v for k, v in output.items() if v is not None}
\ No newline at end of file
+def Variants_to_list(variants: CardVariants) -> list[str]:
+    """ Converts a CardVariants object to the list of available variants. """
+    return [name for name in flag_fields(type(variants)) if getattr(variants, name) is not False]
+
+def _or_none(value: Any) -> Any:
+    """ Returns None for empty values. """
+    return value if value else None
+
+# output field of Card_to_dict -> function reading it from a Card, in output order
+CARD_FIELDS: dict[str, Callable[[Card], Any]] = {
+    'illustrator': lambda card: card.illustrator,
+    'rarity': lambda card: card.rarity,
+    'category': lambda card: card.category,
+    'variants': lambda card: Variants_to_list(card.variants),
+    'set': lambda card: SetResume_to_dict(card.set),
+    'hp': lambda card: card.hp,
+    'types': lambda card: ", ".join(card.types) if card.types else None,
+    'evolvesFrom': lambda card: _or_none(card.evolvesFrom),
+    'description': lambda card: _or_none(card.description),
+    'level': lambda card: _or_none(card.level),
+    'stage': lambda card: _or_none(card.stage),
+    'suffix': lambda card: _or_none(card.suffix),
+    'item': lambda card: CardItem_to_dict(card.item) if card.item else None,
+    'abilities': lambda card: [CardAbility_to_dict(ability) for ability in card.abilities] if card.abilities else None,
+    'attacks': lambda card: [CardAttack_to_dict(attack) for attack in card.attacks] if card.attacks else None,
+    'resistances': lambda card: [CardWeakRes_to_dict(resistance) for resistance in card.resistances] if card.resistances else None,
+    'retreat': lambda card: card.retreat,
+    'effect': lambda card: _or_none(card.effect),
+    'trainerType': lambda card: _or_none(card.trainerType),
+    'energyType': lambda card: _or_none(card.energyType),
+    'regulationMark': lambda card: card.regulationMark,
+    'legal': lambda card: Legal_to_str(card.legal),
+    'id': lambda card: card.id,
+    'localId': lambda card: card.localId,
+    'name': lambda card: card.name,
+    'image': lambda card: image_url(card.image),
+    'boosters': lambda card: [Booster_to_dict(booster) for booster in card.boosters] if card.boosters else None,
+}
+
+# fields of Card_to_dict that are the same in every language, the image is not one of them:
+# its url contains the language and the scans show the printed text
+NEUTRAL_CARD_FIELDS = ('variants', 'hp', 'retreat', 'regulationMark', 'legal', 'id', 'localId')
+
+@metrics.traced("convert Card_to_dict")
+def Card_to_dict(card: Card, fields: Union[list[str], None] = None) -> dict:
+    """
+    Converts a Card object to a dictionary.
+
+    Only the fields that are not None are included. When `fields` is given, only
+    those fields are converted.
+    """
+    getters = CARD_FIELDS.items() if fields is None else ((f, CARD_FIELDS[f]) for f in fields if f in CARD_FIELDS)
+    output = {}
+    for name, getter in getters:
+        value = getter(card)
+        if value is not None:
+            output[name] = value
+    return output
+
+def project(card: dict, fields: Union[list[str], None] = None) -> dict:
+    """ Keeps only the given fields of an already converted card. """
+    if fields is None:
+        return card
+    return {f: card[f] for f in fields if f in card}
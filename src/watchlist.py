@@ -0,0 +1,463 @@
+# Watched JustTCG cards refreshed in the background, their prices kept in an append-only fixed-width time-series file.
+import asyncio
+import logging
+import math
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+import time
+import uuid
+from typing import TYPE_CHECKING, Union
+
+import cache
+import justTCG
+
+# numpy is imported on first read, it is not needed to start the server
+if TYPE_CHECKING:
+    import numpy as np
+
+WATCHLIST_DIR = os.getenv("JUSTTCG_WATCHLIST_DIR", os.path.join(cache.CACHE_DIR, "watchlist"))
+# seconds between two refreshes of a watched entry
+REFRESH_INTERVAL = float(os.getenv("JUSTTCG_WATCHLIST_INTERVAL", "3600"))
+# seconds before an entry whose refresh failed is tried again
+RETRY_DELAY = float(os.getenv("JUSTTCG_WATCHLIST_RETRY_DELAY", "300"))
+# seconds between two runs of the scheduler
+TICK = float(os.getenv("JUSTTCG_WATCHLIST_TICK", "60"))
+# batch requests made per run of the scheduler, at most this many requests per TICK are spent on the watchlist
+MAX_REQUESTS = int(os.getenv("JUSTTCG_WATCHLIST_MAX_REQUESTS", "5"))
+
+# one observation: series id (uint32), unix time of the price (uint32), price (float64, NaN if none)
+RECORD = struct.Struct("<IId")
+RECORD_DTYPE = [("series", "<u4"), ("time", "<u4"), ("price", "<f8")]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    condition TEXT NOT NULL DEFAULT '',
+    above REAL,
+    below REAL,
+    added_at REAL,
+    refreshed_at REAL,
+    error TEXT,
+    retry_at REAL,
+    UNIQUE (kind, key, condition)
+);
+CREATE TABLE IF NOT EXISTS series (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    variant_id TEXT UNIQUE NOT NULL,
+    entry_id INTEGER,
+    card_id TEXT,
+    name TEXT,
+    printing TEXT,
+    condition TEXT
+);
+CREATE TABLE IF NOT EXISTS lease (
+    name TEXT PRIMARY KEY,
+    owner TEXT,
+    expires REAL
+);
+"""
+
+# identifiers an entry can watch, in order of precedence
+KINDS = ("variantId", "tcgplayerId")
+
+
+def normalize_condition(condition: Union[str, None]) -> str:
+    """ Full name of a condition ("NM" -> "Near Mint"), empty for every condition. """
+    if not condition:
+        return ""
+    return justTCG.CONDITIONS.get(condition.upper(), condition)
+
+
+class Watchlist:
+    """
+    Watched variantId / tcgplayerId (+ condition) entries and the price history of their variants.
+
+    The entries and the variants met so far (the series) are kept in SQLite. Every price
+    observation is appended to a file of fixed-width records, which is memory-mapped and read
+    as a numpy array by the queries, so they never call JustTCG. A lease in the database lets a
+    single worker of an HTTP deployment run the refreshes.
+    """
+
+    def __init__(self, directory: str = WATCHLIST_DIR):
+        """
+        Args:
+            directory (str, optional): Directory of the database and of the time-series file. Default is JUSTTCG_WATCHLIST_DIR.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.series_path = os.path.join(directory, "prices.bin")
+        # several worker processes may use the same file, they wait for each other's writes
+        self.connection = sqlite3.connect(os.path.join(directory, "watchlist.sqlite"), timeout=30, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        self.owner = uuid.uuid4().hex
+        # series id -> time of its last observation, loaded on the first write
+        self._last: Union[dict[int, int], None] = None
+
+    def close(self) -> None:
+        """ Closes the database connection. """
+        self.connection.close()
+
+    def add(self, entries: list[dict]) -> list[dict]:
+        """
+        Watches entries, an entry already watched gets the new thresholds.
+
+        Args:
+            entries (list[dict]): Each with a variantId or a tcgplayerId, and optionally a condition and
+                the "above" and "below" price thresholds of the alerts.
+        Returns:
+            list[dict]: The watched entries.
+        Raises:
+            ValueError: If an entry has no identifier.
+        """
+        rows = []
+        for entry in entries:
+            kind = next((kind for kind in KINDS if entry.get(kind)), None)
+            if kind is None:
+                raise ValueError(f"Watchlist entries need a variantId or a tcgplayerId: {entry}")
+            rows.append((kind, str(entry[kind]), normalize_condition(entry.get("condition")),
+                         entry.get("above"), entry.get("below"), time.time()))
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT INTO entries (kind, key, condition, above, below, added_at) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (kind, key, condition) DO UPDATE SET above = excluded.above, below = excluded.below",
+                rows
+            )
+        keys = {row[:3] for row in rows}
+        return [entry for entry in self.entries() if (entry["kind"], entry["key"], entry["condition"]) in keys]
+
+    def remove(self, entry_ids: list[int]) -> int:
+        """ Stops watching entries, their history is kept. Returns the number of removed entries. """
+        with self.lock, self.connection:
+            return self.connection.execute(
+                f"DELETE FROM entries WHERE id IN ({', '.join('?' * len(entry_ids))})", entry_ids
+            ).rowcount if entry_ids else 0
+
+    def entries(self) -> list[dict]:
+        """ Returns the watched entries with their thresholds, last refresh and number of variants. """
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT entries.id, kind, key, entries.condition, above, below, refreshed_at, error, COUNT(series.id) "
+                "FROM entries LEFT JOIN series ON series.entry_id = entries.id GROUP BY entries.id ORDER BY entries.id"
+            ).fetchall()
+        return [{"id": row[0], "kind": row[1], "key": row[2], "condition": row[3], "above": row[4], "below": row[5],
+                 "refreshedAt": row[6], "error": row[7], "variants": row[8]} for row in rows]
+
+    def due(self, limit: int, interval: float = REFRESH_INTERVAL) -> list[dict]:
+        """
+        Returns the entries never refreshed or refreshed more than `interval` seconds ago, least recent first.
+        An entry whose last refresh failed is only returned once its retry time has passed.
+        """
+        now = time.time()
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT id, kind, key, condition FROM entries WHERE (refreshed_at IS NULL OR refreshed_at < ?) "
+                "AND (retry_at IS NULL OR retry_at <= ?) ORDER BY refreshed_at IS NOT NULL, refreshed_at LIMIT ?",
+                (now - interval, now, limit)
+            ).fetchall()
+        return [{"id": row[0], "kind": row[1], "key": row[2], "condition": row[3]} for row in rows]
+
+    def acquire_lease(self, duration: float) -> bool:
+        """ Takes or extends the refresher lease, True if this process holds it for the next `duration` seconds. """
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR IGNORE INTO lease VALUES ('refresher', NULL, 0)")
+            return self.connection.execute(
+                "UPDATE lease SET owner = ?, expires = ? WHERE name = 'refresher' AND (owner = ? OR expires < ?)",
+                (self.owner, now + duration, self.owner, now)
+            ).rowcount == 1
+
+    def record(self, entries: list[dict], results: list[dict], retry_delay: float = RETRY_DELAY) -> int:
+        """
+        Appends the prices returned for entries to the time series.
+
+        A failed entry keeps the time of its last successful refresh, so that it is not skipped for a whole
+        refresh interval, and is tried again after `retry_delay` seconds.
+
+        Args:
+            entries (list[dict]): The refreshed entries, as returned by due.
+            results (list[dict]): The bulk query result of each entry, see justTCG.get_cards_by_bulk_query.
+            retry_delay (float, optional): Seconds before a failed entry is due again. Default is JUSTTCG_WATCHLIST_RETRY_DELAY.
+        Returns:
+            int: The number of observations appended, prices that did not change upstream are not appended again.
+        """
+        now = time.time()
+        observations = []
+        with self.lock:
+            if self._last is None:
+                self._last = self._last_times()
+            with self.connection:
+                for entry, result in zip(entries, results):
+                    card = result.get("card")
+                    if card:
+                        self.connection.execute("UPDATE entries SET refreshed_at = ?, error = NULL, retry_at = NULL "
+                                                "WHERE id = ?", (now, entry["id"]))
+                    else:
+                        self.connection.execute("UPDATE entries SET error = ?, retry_at = ? WHERE id = ?",
+                                                (result.get("error", "not found"), now + retry_delay, entry["id"]))
+                    for variant in (card or {}).get("variants") or []:
+                        if not self._matches(entry, variant):
+                            continue
+                        series_id = self._series_id(entry, card, variant)
+                        updated = variant.get("lastUpdated")
+                        timestamp = int(updated if isinstance(updated, (int, float)) else now)
+                        if self._last.get(series_id) == timestamp:
+                            continue
+                        self._last[series_id] = timestamp
+                        price = variant.get("price")
+                        observations.append(RECORD.pack(series_id, timestamp, float(price) if price is not None else math.nan))
+            if observations:
+                # whole records in one append, readers only map complete records
+                with open(self.series_path, "ab") as file:
+                    file.write(b"".join(observations))
+        return len(observations)
+
+    @staticmethod
+    def _matches(entry: dict, variant: dict) -> bool:
+        """ Checks if a variant of the returned card is watched by the entry. """
+        if entry["kind"] == "variantId":
+            return variant.get("id") == entry["key"]
+        return not entry["condition"] or normalize_condition(variant.get("condition")) == entry["condition"]
+
+    def _series_id(self, entry: dict, card: dict, variant: dict) -> int:
+        """ Returns the series of a variant, creating it on its first observation. """
+        self.connection.execute(
+            "INSERT INTO series (variant_id, entry_id, card_id, name, printing, condition) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (variant_id) DO UPDATE SET entry_id = excluded.entry_id",
+            (variant["id"], entry["id"], card.get("id"), card.get("name"), variant.get("printing"), variant.get("condition"))
+        )
+        return self.connection.execute("SELECT id FROM series WHERE variant_id = ?", (variant["id"],)).fetchone()[0]
+
+    def series(self) -> dict[int, dict]:
+        """ Returns the metadata of every series, keyed by series id. """
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT series.id, variant_id, card_id, name, printing, series.condition, entry_id, above, below "
+                "FROM series LEFT JOIN entries ON entries.id = series.entry_id"
+            ).fetchall()
+        return {row[0]: {"variantId": row[1], "cardId": row[2], "name": row[3], "printing": row[4], "condition": row[5],
+                         "entryId": row[6], "above": row[7], "below": row[8]} for row in rows}
+
+    def read(self) -> "np.ndarray":
+        """
+        Maps the time-series file in memory.
+
+        Returns:
+            np.ndarray: The observations (series, time, price) in append order, backed by the mapping.
+        """
+        import numpy as np
+
+        size = os.path.getsize(self.series_path) if os.path.exists(self.series_path) else 0
+        length = size - size % RECORD.size
+        if length == 0:
+            return np.zeros(0, dtype=RECORD_DTYPE)
+        with open(self.series_path, "rb") as file:
+            mapping = mmap.mmap(file.fileno(), length, access=mmap.ACCESS_READ)
+        # the array keeps the mapping alive, it is released with the array
+        return np.frombuffer(mapping, dtype=RECORD_DTYPE)
+
+    def _last_times(self) -> dict[int, int]:
+        """ Returns the time of the last observation of every series. """
+        records = sorted_records(self.read())
+        if not len(records):
+            return {}
+        _, ends = group_bounds(records)
+        return {int(records["series"][end]): int(records["time"][end]) for end in ends}
+
+
+def sorted_records(records: "np.ndarray") -> "np.ndarray":
+    """ Returns the observations ordered by series, then time. """
+    import numpy as np
+
+    return records[np.lexsort((records["time"], records["series"]))]
+
+
+def group_bounds(records: "np.ndarray") -> tuple["np.ndarray", "np.ndarray"]:
+    """ Returns the first and last position of every series in sorted observations. """
+    import numpy as np
+
+    _, starts = np.unique(records["series"], return_index=True)
+    ends = np.append(starts[1:], len(records)) - 1
+    return starts, ends
+
+
+def changes(watchlist: Watchlist, since: float, min_change_percent: float = 0.0, top_n: int = 50) -> list[dict]:
+    """
+    Computes the price change of every watched variant since a time.
+
+    Args:
+        watchlist (Watchlist): The watchlist.
+        since (float): Unix time of the reference price, the first observation is used for the variants observed after it.
+        min_change_percent (float, optional): Only return the variants whose price moved at least this much (in absolute value).
+        top_n (int, optional): Maximum number of variants returned.
+    Returns:
+        list[dict]: The variants by decreasing absolute change, with their price then and now.
+    """
+    import numpy as np
+
+    records = sorted_records(watchlist.read())
+    if not len(records):
+        return []
+    starts, ends = group_bounds(records)
+    series = records["series"][starts]
+    # last observation at or before `since` in each series, its first observation if there is none
+    keys = (records["series"].astype(np.int64) << 32) | records["time"]
+    before = np.searchsorted(keys, (series.astype(np.int64) << 32) | int(since), side="right") - 1
+    baseline = np.where(before >= starts, before, starts)
+    old, new = records["price"][baseline], records["price"][ends]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        percent = (new - old) / old * 100
+    keep = np.isfinite(percent) & (np.abs(percent) >= min_change_percent)
+    order = np.argsort(-np.abs(np.where(keep, percent, 0)), kind="stable")
+    metadata = watchlist.series()
+    return [metadata.get(int(series[i]), {}) | {
+        "priceThen": float(old[i]), "timeThen": int(records["time"][baseline[i]]),
+        "priceNow": float(new[i]), "timeNow": int(records["time"][ends[i]]),
+        "change": round(float(new[i] - old[i]), 2), "changePercent": round(float(percent[i]), 2),
+    } for i in order[:max(0, top_n)] if keep[i]]
+
+
+def crossings(watchlist: Watchlist, since: float) -> list[dict]:
+    """
+    Finds the watched variants whose price crossed the "above" or "below" threshold of their entry.
+
+    Args:
+        watchlist (Watchlist): The watchlist.
+        since (float): Unix time from which the crossings are reported.
+    Returns:
+        list[dict]: One event per crossing, most recent first, with the previous and new prices.
+    """
+    import numpy as np
+
+    metadata = watchlist.series()
+    records = sorted_records(watchlist.read())
+    if len(records) < 2 or not metadata:
+        return []
+    size = max(max(metadata), int(records["series"].max())) + 1
+    above, below = np.full(size, np.nan), np.full(size, np.nan)
+    for series_id, meta in metadata.items():
+        above[series_id] = meta["above"] if meta["above"] is not None else np.nan
+        below[series_id] = meta["below"] if meta["below"] is not None else np.nan
+
+    previous, current = records[:-1], records[1:]
+    same = (previous["series"] == current["series"]) & (current["time"] >= since)
+    series = current["series"]
+    up = same & (previous["price"] <= above[series]) & (current["price"] > above[series])
+    down = same & (previous["price"] >= below[series]) & (current["price"] < below[series])
+    events = []
+    for kind, mask, thresholds in (("above", up, above), ("below", down, below)):
+        for i in np.flatnonzero(mask):
+            events.append(metadata[int(series[i])] | {
+                "crossed": kind, "threshold": float(thresholds[series[i]]),
+                "previousPrice": float(previous["price"][i]), "price": float(current["price"][i]),
+                "time": int(current["time"][i]),
+            })
+    return sorted(events, key=lambda event: -event["time"])
+
+
+def history(watchlist: Watchlist, variant_ids: list[str], since: float = 0) -> dict[str, list[list]]:
+    """
+    Returns the observed prices of variants.
+
+    Args:
+        watchlist (Watchlist): The watchlist.
+        variant_ids (list[str]): The variant ids.
+        since (float, optional): Only return the observations from this unix time.
+    Returns:
+        dict: Per variant id, the [time, price] observations in chronological order.
+    """
+    import numpy as np
+
+    ids = {meta["variantId"]: series_id for series_id, meta in watchlist.series().items()}
+    records = watchlist.read()
+    result = {}
+    for variant_id in variant_ids:
+        if variant_id not in ids:
+            continue
+        points = records[(records["series"] == ids[variant_id]) & (records["time"] >= since)]
+        points = points[np.argsort(points["time"], kind="stable")]
+        result[variant_id] = [[int(t), None if math.isnan(p) else float(p)] for t, p in zip(points["time"], points["price"])]
+    return result
+
+
+async def refresh(watchlist: Watchlist, max_requests: int = MAX_REQUESTS, interval: float = REFRESH_INTERVAL) -> dict:
+    """
+    Refreshes the entries that are due, with at most `max_requests` batch requests.
+
+    Returns:
+        dict: The number of refreshed entries and of appended observations.
+    """
+    entries = await asyncio.to_thread(watchlist.due, max(1, max_requests) * justTCG.BATCH_SIZE, interval)
+    if not entries:
+        return {"entries": 0, "observations": 0}
+    queries = [justTCG.build_card_query(**{entry["kind"]: entry["key"]}, condition=entry["condition"] or None)
+               for entry in entries]
+    # the price cache may keep a variant for longer than the refresh interval, the watched prices are always fetched
+    results = await justTCG.get_cards_by_bulk_query(queries, use_cache=False)
+    observations = await asyncio.to_thread(watchlist.record, entries, results)
+    logging.info("Watchlist refreshed: %d entries, %d new prices", len(entries), observations)
+    return {"entries": len(entries), "observations": observations}
+
+
+_watchlist: Union[Watchlist, None] = None
+_refresher: Union[asyncio.Task, None] = None
+_wake: Union[asyncio.Event, None] = None
+
+
+def open_watchlist() -> Watchlist:
+    """ Returns the watchlist of WATCHLIST_DIR, opened on first use. """
+    global _watchlist
+    if _watchlist is None:
+        _watchlist = Watchlist()
+    return _watchlist
+
+
+async def run_refresher() -> None:
+    """ Refreshes the due entries every TICK seconds, or as soon as wake() is called, while holding the lease. """
+    global _wake
+    _wake = asyncio.Event()
+    while True:
+        try:
+            watchlist = open_watchlist()
+            if await asyncio.to_thread(watchlist.acquire_lease, 3 * TICK):
+                await refresh(watchlist)
+        except Exception as e:
+            logging.warning("Watchlist refresh failed: %s", e)
+        try:
+            await asyncio.wait_for(_wake.wait(), TICK)
+        except asyncio.TimeoutError:
+            pass
+        _wake.clear()
+
+
+def start_refresher() -> None:
+    """ Starts the background refresher in the running event loop, unless it runs already. """
+    global _refresher
+    if _refresher is None or _refresher.done():
+        _refresher = asyncio.create_task(run_refresher())
+
+
+def wake() -> None:
+    """ Runs the refresher now, e.g. after entries were added. """
+    if _wake is not None:
+        _wake.set()
+
+
+async def stop() -> None:
+    """ Stops the refresher and closes the watchlist. """
+    global _refresher, _watchlist
+    if _refresher is not None:
+        _refresher.cancel()
+        try:
+            await _refresher
+        except asyncio.CancelledError:
+            pass
+        _refresher = None
+    if _watchlist is not None:
+        _watchlist.close()
+        _watchlist = None
@@ -0,0 +1,8 @@
+# The server modules are flat modules of src/ that read their settings from the environment
+# when imported: put src/ on the path and keep the caches of the tests out of the user cache.
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+os.environ.setdefault("TCGDEX_CACHE_DIR", tempfile.mkdtemp(prefix="pokemon_tcg_mcp_tests_"))
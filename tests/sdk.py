@@ -0,0 +1,52 @@
+# TCGdex SDK objects built from API-shaped dictionaries, and an offline stand-in for the SDK client.
+from types import SimpleNamespace
+
+from dacite import from_dict
+from tcgdexsdk import Card, CardResume, Serie, SerieResume, Set, SetResume
+
+
+def card_data(set_id: str, number: int, **fields) -> dict:
+    """ Returns the API document of a Pokémon card with a resistance, an item and boosters. """
+    return {
+        "id": f"{set_id}-{number}", "localId": str(number), "name": f"Pikachu {number}",
+        "category": "Pokemon", "rarity": "Common", "illustrator": "Mitsuhiro Arita",
+        "hp": 60, "types": ["Lightning"], "stage": "Basic", "retreat": 1, "regulationMark": "G",
+        "image": f"https://assets.tcgdex.net/en/sv/{set_id}/{number}",
+        "variants": {"normal": True, "reverse": True, "holo": False, "firstEdition": False, "wPromo": False},
+        "legal": {"standard": True, "expanded": True},
+        "set": {"id": set_id, "name": f"Set {set_id}", "cardCount": {"total": 2, "official": 2}},
+        "attacks": [{"name": "Thunder Shock", "cost": ["Lightning"], "damage": 20}],
+        "weaknesses": [{"type": "Fighting", "value": "×2"}],
+        "resistances": [{"type": "Metal", "value": "-30"}],
+        "item": {"name": "Light Ball", "effect": "Doubles the damage of the attacks."},
+        "boosters": [{"id": "boo_pikachu", "name": "Pikachu", "logo": None, "artwork_front": None, "artwork_back": None}],
+    } | fields
+
+
+def set_data(set_id: str, numbers: list[int], **fields) -> dict:
+    """ Returns the API document of a set with the given cards. """
+    return {
+        "id": set_id, "name": f"Set {set_id}", "tcgOnline": set_id.upper(), "releaseDate": "2023-03-31",
+        "cardCount": {"total": len(numbers), "official": len(numbers)},
+        "serie": {"id": "sv", "name": "Scarlet & Violet"},
+        "legal": {"standard": True, "expanded": True},
+        "cards": [{"id": f"{set_id}-{number}", "localId": str(number), "name": f"Pikachu {number}"} for number in numbers],
+    } | fields
+
+
+class FakeSDK:
+    """ Answers the SDK calls of the catalog sync from in-memory documents. """
+
+    def __init__(self, cards: list[dict], sets: list[dict]):
+        self.cards = {card["id"]: card for card in cards}
+        self.sets = {set["id"]: set for set in sets}
+        serie = {"id": "sv", "name": "Scarlet & Violet",
+                 "sets": [{key: set[key] for key in ("id", "name", "cardCount")} for set in sets]}
+        self.serie = SimpleNamespace(listSync=lambda: [from_dict(SerieResume, serie)],
+                                     getSync=lambda id: from_dict(Serie, serie))
+        self.set = SimpleNamespace(listSync=lambda: [from_dict(SetResume, {key: set[key] for key in ("id", "name", "cardCount")})
+                                                     for set in self.sets.values()],
+                                   getSync=lambda id: from_dict(Set, self.sets[id]))
+        self.card = SimpleNamespace(listSync=lambda: [from_dict(CardResume, {key: card[key] for key in ("id", "localId", "name")})
+                                                      for card in self.cards.values()],
+                                    getSync=lambda id: from_dict(Card, self.cards[id]))
@@ -0,0 +1,87 @@
+import unittest
+
+import numpy as np
+
+import analytics
+
+DAY = analytics.DAY
+START = 1_700_000_000 // DAY * DAY
+
+
+def make_card(card_id: str, histories: dict[str, list[tuple[int, float]]]) -> dict:
+    """ Returns a JustTCG card whose variants have a price history, given as (day, price) points. """
+    return {"id": card_id, "name": card_id, "set": "base-set", "variants": [
+        {"id": variant_id, "condition": "Near Mint", "printing": "Normal", "price": points[-1][1] if points else None,
+         "priceHistory": [{"t": START + day * DAY + 3600, "p": price} for day, price in points]}
+        for variant_id, points in histories.items()]}
+
+
+class BuildMatrixTest(unittest.TestCase):
+
+    def test_histories_are_aligned_and_forward_filled(self):
+        matrix = analytics.build_matrix([
+            make_card("a", {"a-nm": [(0, 1.0), (2, 3.0)], "a-lp": []}),
+            make_card("b", {"b-nm": [(1, 10.0), (3, 20.0)]}),
+        ])
+        self.assertEqual([variant["variantId"] for variant in matrix.variants], ["a-nm", "b-nm"])
+        self.assertEqual(matrix.timestamps.tolist(), [START + day * DAY for day in range(4)])
+        np.testing.assert_array_equal(matrix.prices, [[1.0, 1.0, 3.0, 3.0], [np.nan, 10.0, 10.0, 20.0]])
+
+    def test_last_price_of_a_day_wins(self):
+        card = make_card("a", {"a-nm": [(0, 1.0)]})
+        card["variants"][0]["priceHistory"] += [{"t": START + 7200, "p": 2.0}, {"t": START + 60, "p": 5.0}, {"t": None, "p": 9.0}]
+        np.testing.assert_array_equal(analytics.build_matrix([card]).prices, [[2.0]])
+
+    def test_no_history_gives_an_empty_matrix(self):
+        matrix = analytics.build_matrix([make_card("a", {"a-nm": []}), {"id": "b"}])
+        self.assertEqual((matrix.prices.shape, matrix.variants), ((0, 0), []))
+
+
+class IndicatorsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.matrix = analytics.build_matrix([
+            make_card("a", {"a-nm": [(day, 10.0 + day) for day in range(10)]}),
+            make_card("b", {"b-nm": [(day, 20.0 - day) for day in range(10)]}),
+            make_card("c", {"c-nm": [(8, 5.0), (9, 5.0)]}),
+        ])
+
+    def test_windowed_returns(self):
+        returns = analytics.windowed_returns(self.matrix, 7)
+        np.testing.assert_allclose(returns, [19 / 12 - 1, 11 / 18 - 1, np.nan])
+        self.assertEqual(analytics.top(returns, 1).tolist(), [0])
+        self.assertEqual(analytics.top(returns, 5, largest=False).tolist(), [1, 0])
+
+    def test_rolling_stats_match_a_naive_computation(self):
+        mean, std = analytics.rolling_stats(self.matrix, 3)
+        for row in range(3):
+            for day in range(10):
+                window = self.matrix.prices[row, max(0, day - 2):day + 1]
+                window = window[~np.isnan(window)]
+                expected = (window.mean(), window.std()) if len(window) else (np.nan, np.nan)
+                np.testing.assert_allclose([mean[row, day], std[row, day]], expected, atol=1e-9)
+
+    def test_volatility(self):
+        volatility = analytics.volatility(self.matrix, 9)
+        expected = np.std(np.diff(np.log(self.matrix.prices[0])))
+        self.assertAlmostEqual(volatility[0], expected)
+        self.assertEqual(volatility[2], 0.0)
+
+    def test_set_index_and_correlation(self):
+        equal_weight, total = analytics.set_index(self.matrix)
+        self.assertEqual(equal_weight[0], 100.0)
+        self.assertAlmostEqual(equal_weight[9], (190.0 + 55.0 + 100.0) / 3)
+        self.assertEqual(total[9], 19.0 + 11.0 + 5.0)
+        correlation = analytics.correlation(self.matrix)
+        returns = np.diff(self.matrix.prices[:2], axis=1) / self.matrix.prices[:2, :-1]
+        np.testing.assert_allclose(correlation[:2, :2], np.corrcoef(returns))
+        # a price that never changes correlates with nothing
+        self.assertTrue(np.isnan(correlation[2]).all())
+
+    def test_sample_keeps_the_last_point(self):
+        points = analytics.sample(np.array([1.0, np.nan, 3.0, 4.0]), np.array([1, 2, 3, 4]), 2)
+        self.assertEqual(points, [{"t": 1, "v": 1.0}, {"t": 4, "v": 4.0}])
+
+
+if __name__ == "__main__":
+    unittest.main()
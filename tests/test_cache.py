@@ -0,0 +1,124 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from dacite import from_dict
+from tcgdexsdk import Card
+
+import cache
+import tools
+
+from tests.sdk import card_data
+
+
+class TTLCacheTest(unittest.IsolatedAsyncioTestCase):
+
+    def test_entries_expire(self):
+        ttl_cache = cache.TTLCache()
+        ttl_cache.set("fresh", [1], ttl=60)
+        ttl_cache.set("expired", [2], ttl=-1)
+        self.assertEqual(ttl_cache.get("fresh"), [1])
+        self.assertEqual(ttl_cache.get("expired", "missing"), "missing")
+        self.assertEqual((ttl_cache.hits, ttl_cache.misses), (1, 1))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        ttl_cache = cache.TTLCache(maxsize=2)
+        ttl_cache.set("a", 1, ttl=60)
+        ttl_cache.set("b", 2, ttl=60)
+        ttl_cache.get("a")
+        ttl_cache.set("c", 3, ttl=60)
+        self.assertEqual([ttl_cache.get(key) for key in "abc"], [1, None, 3])
+
+    def test_entries_are_persisted(self):
+        path = os.path.join(tempfile.mkdtemp(), "reference.json")
+        ttl_cache = cache.TTLCache(path=path)
+        ttl_cache.set("types", ["Fire", "Water"], ttl=60)
+        ttl_cache.set("stale", ["Grass"], ttl=-1)
+        reloaded = cache.TTLCache(path=path)
+        self.assertEqual(reloaded.get("types"), ["Fire", "Water"])
+        self.assertIsNone(reloaded.get("stale"))
+        self.assertEqual(reloaded.invalidate(["types"]), ["types"])
+        self.assertIsNone(cache.TTLCache(path=path).get("types"))
+
+    def test_version_changes_when_a_key_is_stored_again(self):
+        path = os.path.join(tempfile.mkdtemp(), "reference.json")
+        ttl_cache = cache.TTLCache(path=path)
+        self.assertIsNone(ttl_cache.version("cardNames"))
+        ttl_cache.set("cardNames", [["base1-4", "Charizard"]], ttl=60)
+        version = ttl_cache.version("cardNames")
+        ttl_cache.get("cardNames")
+        self.assertEqual(ttl_cache.version("cardNames"), version)
+        self.assertEqual(cache.TTLCache(path=path).version("cardNames"), version)
+
+        ttl_cache.set("cardNames", [["base1-4", "Charizard"]], ttl=120)
+        self.assertNotEqual(ttl_cache.version("cardNames"), version)
+        ttl_cache.invalidate(["cardNames"])
+        self.assertIsNone(ttl_cache.version("cardNames"))
+
+    async def test_concurrent_misses_share_one_load(self):
+        ttl_cache = cache.TTLCache()
+        calls = 0
+
+        async def loader() -> list:
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return ["Fire"]
+
+        values = await asyncio.gather(*(ttl_cache.get_or_load("types", loader, ttl=60) for _ in range(5)))
+        self.assertEqual(values, [["Fire"]] * 5)
+        self.assertEqual(calls, 1)
+
+    async def test_empty_results_are_not_cached(self):
+        ttl_cache = cache.TTLCache()
+        results = iter([[], ["Fire"]])
+
+        async def loader() -> list:
+            return next(results)
+
+        self.assertEqual(await ttl_cache.get_or_load("types", loader, ttl=60), [])
+        self.assertEqual(await ttl_cache.get_or_load("types", loader, ttl=60), ["Fire"])
+
+
+class SharedStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        # MCP_SHARED_CACHE pointing at a fresh file, opened by the first cache created
+        path = os.path.join(tempfile.mkdtemp(), "shared.sqlite")
+        for name, value in (("SHARED_CACHE_PATH", path), ("_shared_store", None)):
+            patcher = mock.patch.object(cache, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(cache.close_shared_store)
+
+    def test_converted_cards_are_shared_between_workers(self):
+        card = tools.Card_to_dict(from_dict(Card, card_data("sv01", 1)))
+        cache.TTLCache(namespace="cards").set("en:sv01-1", card, ttl=60)
+
+        # another worker misses in memory and reads the entry from the store
+        shared = cache.TTLCache(namespace="cards").get("en:sv01-1")
+        self.assertEqual(shared, card)
+        self.assertEqual(shared["resistances"], [{"type": "Metal", "value": "-30"}])
+        self.assertEqual(shared["item"]["name"], "Light Ball")
+        self.assertEqual(shared["boosters"][0]["id"], "boo_pikachu")
+
+    def test_version_follows_the_store(self):
+        worker_a, worker_b = cache.TTLCache(namespace="reference_en"), cache.TTLCache(namespace="reference_en")
+        worker_a.set("cardNames", [["base1-4", "Charizard"]], ttl=60)
+        worker_b.get("cardNames")
+        self.assertEqual(worker_b.version("cardNames"), worker_a.version("cardNames"))
+
+    def test_namespaces_and_expiry(self):
+        store = cache.shared_store()
+        store.set("cards", "a", [1], expiry=0)
+        store.set("sets", "a", [2], expiry=2e9)
+        self.assertIsNone(store.get("cards", "a"))
+        self.assertEqual(store.get("sets", "a")[1], [2])
+        self.assertEqual(store.purge(), 1)
+        self.assertEqual(store.delete("sets"), ["a"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import card_map
+
+
+class NormalizeTest(unittest.TestCase):
+
+    def test_numbers(self):
+        self.assertEqual(card_map.normalize_number("004/102"), "4")
+        self.assertEqual(card_map.normalize_number(4), "4")
+        self.assertEqual(card_map.normalize_number("000"), "000")
+        self.assertEqual(card_map.normalize_number("TG05"), "tg05")
+        self.assertEqual(card_map.normalize_number(None), "")
+
+    def test_names(self):
+        self.assertEqual(card_map.normalize_name("SV03: Obsidian Flames"), "obsidianflames")
+        self.assertEqual(card_map.normalize_name("Flabébé"), "flabebe")
+        self.assertEqual(card_map.normalize_name(None), "")
+
+
+class MatchTest(unittest.TestCase):
+
+    def test_sets_match_by_name(self):
+        sets = [{"id": "sv03-obsidian-flames", "name": "SV03: Obsidian Flames"},
+                {"id": "base-set", "name": "Base Set"}, {"id": "base-set-2", "name": "Base Set 2"}]
+        self.assertEqual(card_map.match_set("Obsidian Flames", sets)["id"], "sv03-obsidian-flames")
+        self.assertEqual(card_map.match_set("Base Set", sets)["id"], "base-set")
+        # "Base" is part of two names
+        self.assertIsNone(card_map.match_set("Base", sets))
+        self.assertIsNone(card_map.match_set("", sets))
+
+    def test_cards_match_by_number_then_name(self):
+        tcgdex = [
+            {"id": "base1-4", "localId": "4", "name": "Charizard"},
+            {"id": "base1-58", "localId": "58", "name": "Pikachu"},
+            {"id": "base1-97", "localId": "97", "name": "Fire Energy"},
+            {"id": "base1-98", "localId": "98", "name": "Mewtwo"},
+        ]
+        justtcg = [
+            {"id": "charizard-4", "number": "004/102", "name": "Charizard", "tcgplayerId": 42382},
+            {"id": "pikachu-58-red", "number": "58/102", "name": "Pikachu (Red Cheeks)", "tcgplayerId": 1},
+            {"id": "raichu-58", "number": "58/102", "name": "Raichu", "tcgplayerId": 2},
+            {"id": "fire-energy", "number": None, "name": "Fire Energy", "tcgplayerId": None},
+        ]
+        self.assertEqual(card_map.match_cards(tcgdex, justtcg), [
+            ("base1-4", "4", "Charizard", "charizard-4", "42382", "number"),
+            ("base1-58", "58", "Pikachu", "pikachu-58-red", "1", "number+name"),
+            ("base1-97", "97", "Fire Energy", "fire-energy", None, "name"),
+            ("base1-98", "98", "Mewtwo", None, None, None),
+        ])
+
+
+class CardMapTest(unittest.TestCase):
+
+    def setUp(self):
+        self.card_map = card_map.CardMap(os.path.join(tempfile.mkdtemp(), "card_map.sqlite"))
+        self.addCleanup(self.card_map.close)
+
+    def test_store_and_lookup(self):
+        self.card_map.store_set("base1", "Base", 102, "base-set", [
+            ("base1-4", "4", "Charizard", "charizard-4", "42382", "number"),
+            ("base1-98", "98", "Mewtwo", None, None, None),
+        ])
+        self.assertEqual(self.card_map.lookup(["base1-4", "base1-98", "base2-1"]),
+                         {"base1-4": {"cardId": "charizard-4", "tcgplayerId": "42382", "matchedBy": "number"}})
+        self.assertEqual(self.card_map.stats(), {"sets": 1, "cards": 1})
+
+        # mapping a set again replaces its cards
+        self.card_map.store_set("base1", "Base", 102, "base-set", [])
+        self.assertEqual(self.card_map.lookup(["base1-4"]), {})
+
+    def test_stale_sets(self):
+        self.card_map.store_set("base1", "Base", 102, "base-set", [])
+        self.card_map.store_set("base2", "Jungle", 64, "jungle", [])
+        resumes = [{"id": "base1", "cardCount": {"total": 102}}, {"id": "base2", "cardCount": {"total": 65}},
+                   {"id": "base3", "cardCount": {"total": 62}}]
+        self.assertEqual(card_map.stale_sets(self.card_map, resumes), ["base2", "base3"])
+        with mock.patch.object(time, "time", return_value=time.time() + card_map.CARD_MAP_TTL + 1):
+            self.assertEqual(card_map.stale_sets(self.card_map, resumes), ["base1", "base2", "base3"])
+
+
+if __name__ == "__main__":
+    unittest.main()
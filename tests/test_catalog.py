@@ -0,0 +1,118 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+import catalog
+import query_plan
+
+from tests.sdk import FakeSDK, card_data, set_data
+
+
+class CatalogSyncTest(unittest.TestCase):
+
+    def setUp(self):
+        self.catalog = catalog.Catalog(os.path.join(tempfile.mkdtemp(), "catalog_en.sqlite"))
+        self.addCleanup(self.catalog.close)
+
+    def test_sync_stores_cards_with_nested_fields(self):
+        sdk = FakeSDK([card_data("sv01", 1), card_data("sv01", 2, resistances=None, item=None, boosters=None)],
+                      [set_data("sv01", [1, 2])])
+        report = asyncio.run(catalog.sync(sdk, self.catalog))
+
+        self.assertEqual(report["cards"], 2)
+        self.assertTrue(self.catalog.is_ready)
+        self.assertIn("sv01", self.catalog.manifest())
+        card = self.catalog.get_cards(["sv01-1"])[0]
+        self.assertEqual(card["resistances"], [{"type": "Metal", "value": "-30"}])
+        self.assertEqual(card["item"], {"name": "Light Ball", "effect": "Doubles the damage of the attacks."})
+        self.assertEqual(card["boosters"][0]["id"], "boo_pikachu")
+        self.assertNotIn("resistances", self.catalog.get_cards(["sv01-2"])[0])
+
+    def test_incremental_sync_only_fetches_what_changed(self):
+        sdk = FakeSDK([card_data("sv01", 1)], [set_data("sv01", [1])])
+        asyncio.run(catalog.sync(sdk, self.catalog))
+
+        sdk = FakeSDK([card_data("sv01", 1), card_data("sv02", 1)], [set_data("sv01", [1]), set_data("sv02", [1])])
+        report = asyncio.run(catalog.sync(sdk, self.catalog, incremental=True))
+        self.assertEqual(report["new"], ["sv02"])
+        self.assertEqual(report["cards"], 1)
+        self.assertEqual(self.catalog.card_ids(), {"sv01-1", "sv02-1"})
+
+    def test_changed_sets_are_detected(self):
+        sdk = FakeSDK([card_data("sv01", 1), card_data("sv02", 1), card_data("sv03", 1)],
+                      [set_data("sv01", [1]), set_data("sv02", [1]), set_data("sv03", [1])])
+        asyncio.run(catalog.sync(sdk, self.catalog))
+        # a card lost locally, e.g. by an interrupted sync
+        with self.catalog.connection:
+            self.catalog.connection.execute("DELETE FROM cards WHERE id = 'sv03-1'")
+
+        sdk = FakeSDK([card_data("sv01", 1), card_data("sv02", 1), card_data("sv02", 2), card_data("sv03", 1)],
+                      [set_data("sv02", [1, 2]), set_data("sv03", [1]), set_data("sv04", [])])
+        report = catalog.changed_sets(self.catalog, sdk.set.listSync())
+        self.assertEqual(report, {"new": ["sv04"], "changed": ["sv02"], "incomplete": ["sv03"], "removed": ["sv01"]})
+
+        report = asyncio.run(catalog.sync(sdk, self.catalog, incremental=True))
+        self.assertEqual(report["cards"], 2)
+        self.assertEqual(self.catalog.card_ids("sv02") | self.catalog.card_ids("sv03"), {"sv02-1", "sv02-2", "sv03-1"})
+        self.assertEqual(catalog.changed_sets(self.catalog, sdk.set.listSync())["changed"], [])
+        # the cards of the removed set are no longer served and the set is not reported again
+        self.assertEqual(self.catalog.card_ids("sv01"), set())
+        self.assertNotIn("sv01", self.catalog.manifest())
+        self.assertEqual(catalog.changed_sets(self.catalog, sdk.set.listSync())["removed"], [])
+
+    def test_full_sync_removes_unlisted_sets(self):
+        sdk = FakeSDK([card_data("sv01", 1), card_data("sv02", 1)], [set_data("sv01", [1]), set_data("sv02", [1])])
+        asyncio.run(catalog.sync(sdk, self.catalog))
+
+        sdk = FakeSDK([card_data("sv02", 1)], [set_data("sv02", [1])])
+        report = asyncio.run(catalog.sync(sdk, self.catalog))
+        self.assertEqual(report["removed"], ["sv01"])
+        self.assertEqual(self.catalog.card_ids(), {"sv02-1"})
+        self.assertEqual(list(self.catalog.manifest()), ["sv02"])
+
+
+
+class CatalogQueryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.catalog = catalog.Catalog(os.path.join(tempfile.mkdtemp(), "catalog_en.sqlite"))
+        self.addCleanup(self.catalog.close)
+        set = {"id": "sv01", "name": "Scarlet & Violet"}
+        self.catalog.store_cards([
+            {"id": "sv01-1", "localId": "1", "name": "Pikachu", "set": set, "types": "Lightning", "hp": 60, "rarity": "Common"},
+            {"id": "sv01-2", "localId": "2", "name": "Raichu", "set": set, "types": "Lightning, Metal", "hp": 120, "rarity": "Rare",
+             "retreat": 2},
+            {"id": "sv01-3", "localId": "3", "name": "Porygon_Z", "set": set, "types": "Colorless", "hp": 140},
+            {"id": "sv01-4", "localId": "4", "name": "100% Energy", "set": set, "category": "Energy"},
+        ])
+
+    def ids(self, query: str) -> list[str]:
+        return self.catalog.query_ids(query_plan.parse(query))
+
+    def test_contains_matches_wildcards_literally(self):
+        self.assertEqual(self.ids('Query().contains("name", "_")'), ["sv01-3"])
+        self.assertEqual(self.ids('Query().contains("name", "%")'), ["sv01-4"])
+        self.assertEqual(self.ids('Query().contains("name", "chu")'), ["sv01-1", "sv01-2"])
+        self.assertEqual(self.ids('Query().notContains("name", "_")'), ["sv01-1", "sv01-2", "sv01-4"])
+
+    def test_list_fields_match_single_values(self):
+        self.assertEqual(self.ids('Query().equal("types", "metal")'), ["sv01-2"])
+        self.assertEqual(self.ids('Query().equal("types", "_")'), [])
+        self.assertEqual(self.ids('Query().notEqual("types", "Lightning").notNull("types")'), ["sv01-3"])
+
+    def test_comparisons_sort_and_pagination(self):
+        self.assertEqual(self.ids('Query().equal("name", "pikachu")'), ["sv01-1"])
+        self.assertEqual(self.ids('Query().greaterOrEqualThan("hp", 100).sort("hp", "desc")'), ["sv01-3", "sv01-2"])
+        self.assertEqual(self.ids('Query().isNull("rarity")'), ["sv01-3", "sv01-4"])
+        self.assertEqual(self.ids('Query().equal("set.id", "sv01").sort("localId", "asc").paginate(2, 3)'), ["sv01-4"])
+
+    def test_non_indexed_fields_are_read_from_the_document(self):
+        self.assertEqual(self.ids('Query().equal("retreat", 2)'), ["sv01-2"])
+        self.assertEqual(self.ids('Query().equal("retreat", "2")'), ["sv01-2"])
+        self.assertEqual(self.ids('Query().notEqual("retreat", 2)'), [])
+        self.assertEqual(self.catalog.query(query_plan.parse('Query().equal("id", "sv01-2")'))[0]["name"], "Raichu")
+
+
+if __name__ == "__main__":
+    unittest.main()
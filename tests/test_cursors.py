@@ -0,0 +1,74 @@
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import cache
+import cursors
+import query_plan
+
+
+def make_state(pages: int = 0, ids: list[str] = None) -> cursors.CursorState:
+    plan = query_plan.parse('Query().equal("types", "Fire")')
+    return cursors.CursorState(plan, page_size=2, ids=list(ids or []), pages=pages)
+
+
+class CursorStoreTest(unittest.IsolatedAsyncioTestCase):
+
+    def test_cursors_expire(self):
+        store = cursors.CursorStore(ttl=60)
+        token = store.put(make_state())
+        with mock.patch.object(time, "monotonic", return_value=time.monotonic() + 61):
+            self.assertIsNone(store.pop(token))
+        self.assertEqual(len(store), 0)
+
+    def test_a_cursor_is_used_once(self):
+        store = cursors.CursorStore()
+        state = make_state()
+        token = store.put(state)
+        self.assertIs(store.pop(token), state)
+        self.assertIsNone(store.pop(token))
+        self.assertEqual(store.put(state, token), token)
+
+    async def test_oldest_cursors_are_dropped_with_their_prefetch(self):
+        store = cursors.CursorStore(maxsize=2)
+        first = make_state()
+        first.prefetch = asyncio.create_task(asyncio.sleep(10))
+        first_token = store.put(first)
+        store.put(make_state())
+        store.put(make_state())
+        await asyncio.sleep(0)
+        self.assertIsNone(store.pop(first_token))
+        self.assertTrue(first.prefetch.cancelled())
+
+    def test_most_advanced_copy_wins_with_a_shared_store(self):
+        shared = cache.SharedStore(os.path.join(tempfile.mkdtemp(), "shared.sqlite"))
+        self.addCleanup(shared.close)
+        worker_a, worker_b = cursors.CursorStore(store=shared), cursors.CursorStore(store=shared)
+
+        token = worker_a.put(make_state(pages=1, ids=["a", "b", "c"]))
+        # the next page is requested from another worker, which stores its progress
+        state = worker_b.pop(token)
+        self.assertEqual((state.pages, state.ids), (1, ["a", "b", "c"]))
+        state.pages, state.ids = 2, ["c"]
+        worker_b.put(state, token)
+
+        # the first worker still holds its older copy, the shared one is more recent
+        state = worker_a.pop(token)
+        self.assertEqual((state.pages, state.ids), (2, ["c"]))
+        self.assertEqual(state.plan, make_state().plan)
+
+    def test_local_copy_wins_when_it_is_the_most_recent(self):
+        shared = cache.SharedStore(os.path.join(tempfile.mkdtemp(), "shared.sqlite"))
+        self.addCleanup(shared.close)
+        store = cursors.CursorStore(store=shared)
+        state = make_state(pages=3)
+        token = store.put(state)
+        self.assertIs(store.pop(token), state)
+        self.assertIsNone(shared.get("cursors", token))
+
+
+if __name__ == "__main__":
+    unittest.main()
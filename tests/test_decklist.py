@@ -0,0 +1,100 @@
+import unittest
+
+import decklist
+
+# a Pokémon TCG Live export, basic energies use the SVE code of the Scarlet & Violet energies
+PTCGL_EXPORT = """Pokémon: 19
+3 Charmander PAF 7
+1 Charmander MEW 4
+1 Charmander OBF 26
+1 Charmeleon PAF 8
+3 Charizard ex OBF 125
+2 Pidgey MEW 16
+2 Pidgeot ex OBF 164
+1 Radiant Charizard CRZ 20
+1 Lumineon V BRS 40
+1 Rotom V LOR 58
+1 Manaphy BRS 41
+1 Fezandipiti ex SFA 38
+1 Duskull SFA 18
+
+Trainer: 34
+4 Arven SVI 166
+3 Iono PAL 185
+2 Boss's Orders PAL 172
+1 Professor Turo's Scenario PAR 171
+4 Rare Candy SVI 191
+4 Ultra Ball SVI 196
+4 Nest Ball SVI 181
+2 Super Rod PAL 188
+1 Lost Vacuum CRZ 135
+1 Counter Catcher PAR 160
+1 Prime Catcher TEF 157
+2 Defiance Band SVI 169
+1 Forest Seal Stone SIT 156
+1 Technical Machine: Evolution PAR 178
+3 Collapsed Stadium BRS 137
+
+Energy: 7
+5 Basic {R} Energy SVE 2
+1 Double Turbo Energy BRS 151
+1 Basic {P} Energy SVE 5
+
+Total Cards: 60
+"""
+
+
+class ParseTest(unittest.TestCase):
+
+    def test_ptcgl_export(self):
+        lines, unparsed = decklist.parse(PTCGL_EXPORT)
+        self.assertEqual(unparsed, [])
+        self.assertEqual(sum(line.count for line in lines), 60)
+        self.assertEqual({section: sum(line.count for line in lines if line.section == section)
+                          for section in ("Pokémon", "Trainer", "Energy")}, {"Pokémon": 19, "Trainer": 34, "Energy": 7})
+        self.assertIn("Technical Machine: Evolution", [line.name for line in lines])
+        first = lines[0]
+        self.assertEqual((first.count, first.name, first.set_code, first.number, first.energy), (3, "Charmander", "PAF", "7", None))
+
+        energies = [line for line in lines if line.section == "Energy"]
+        self.assertEqual([(line.name, line.set_code, line.number, line.energy) for line in energies], [
+            ("Basic {R} Energy", "SVE", "2", "Fire"),
+            ("Double Turbo Energy", "BRS", "151", None),
+            ("Basic {P} Energy", "SVE", "5", "Psychic"),
+        ])
+
+    def test_basic_energy_spellings(self):
+        lines, unparsed = decklist.parse("4 Basic {R} Energy Energy 2\n3 Basic Water Energy\n2 Fire Energy SUM 168\n"
+                                         "1 Basic {Q} Energy\n1 Unknown Card")
+        self.assertEqual([(line.set_code, line.number, line.energy) for line in lines],
+                         [("Energy", "2", "Fire"), ("", "", "Water"), ("SUM", "168", "Fire")])
+        # cards without set code nor number must be basic energies
+        self.assertEqual(unparsed, ["1 Basic {Q} Energy", "1 Unknown Card"])
+
+    def test_ptcgo_headers_and_numbers(self):
+        lines, unparsed = decklist.parse("##Pokémon - 1\n* 2 Pikachu ex SVI 057\n## Trainer\n1 Boss's Orders PAL 172\n"
+                                         "1 Lillie's Clefairy ex sv09 TG05")
+        self.assertEqual([(line.name, line.set_code, line.number) for line in lines],
+                         [("Pikachu ex", "SVI", "057"), ("Boss's Orders", "PAL", "172"), ("Lillie's Clefairy ex", "sv09", "TG05")])
+        self.assertEqual(lines[1].section, "Trainer")
+        self.assertEqual(unparsed, ["##Pokémon - 1"])
+
+    def test_basic_energy_names(self):
+        self.assertEqual(decklist.basic_energy("Basic {D} Energy"), "Darkness")
+        self.assertEqual(decklist.basic_energy("basic metal energy"), "Metal")
+        self.assertIsNone(decklist.basic_energy("Double Turbo Energy"))
+        self.assertIsNone(decklist.basic_energy("Basic {R} Energy Retrieval"))
+
+
+class FindCardTest(unittest.TestCase):
+
+    def test_numbers_are_normalized(self):
+        cards = [{"id": "sv01-57", "localId": "057"}, {"id": "sv09-TG05", "localId": "TG05"}]
+        self.assertEqual(decklist.find_card(cards, "57"), "sv01-57")
+        self.assertEqual(decklist.find_card(cards, "057/198"), "sv01-57")
+        self.assertEqual(decklist.find_card(cards, "tg05"), "sv09-TG05")
+        self.assertIsNone(decklist.find_card(cards, "58"))
+
+
+if __name__ == "__main__":
+    unittest.main()
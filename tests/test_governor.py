@@ -0,0 +1,141 @@
+import asyncio
+import email.utils
+import time
+import unittest
+from unittest import mock
+
+import httpx
+
+import governor
+
+
+def http_error(status: int, retry_after: str = None) -> httpx.HTTPStatusError:
+    """ Returns the error raised by raise_for_status for a response of the given status. """
+    request = httpx.Request("GET", "https://api.example.com/cards")
+    response = httpx.Response(status, headers={"Retry-After": retry_after} if retry_after else {}, request=request)
+    return httpx.HTTPStatusError(f"HTTP {status}", request=request, response=response)
+
+
+class RetryAfterTest(unittest.TestCase):
+
+    def test_seconds_and_dates(self):
+        self.assertEqual(governor.parse_retry_after("12"), 12.0)
+        self.assertEqual(governor.parse_retry_after("-3"), 0.0)
+        self.assertAlmostEqual(governor.parse_retry_after(email.utils.formatdate(time.time() + 60, usegmt=True)), 60, delta=2)
+        self.assertIsNone(governor.parse_retry_after("soon"))
+        self.assertIsNone(governor.parse_retry_after(None))
+
+    def test_errors_are_classified(self):
+        self.assertEqual(governor.classify(http_error(429, "7")), ("rate_limited", 429, 7.0, True))
+        self.assertEqual(governor.classify(http_error(503)), ("http", 503, None, True))
+        self.assertEqual(governor.classify(http_error(404)), ("http", 404, None, False))
+        self.assertEqual(governor.classify(httpx.ConnectError("refused"))[0], "network")
+        self.assertEqual(governor.classify(httpx.ReadTimeout("slow"))[0], "timeout")
+        self.assertEqual(governor.classify(KeyError("id")), ("error", None, None, False))
+
+
+class TokenBucketTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_burst_then_rate(self):
+        bucket = governor.TokenBucket(rate=50, burst=3)
+        start = time.monotonic()
+        for _ in range(5):
+            await bucket.acquire()
+        # 3 calls from the burst, 2 more at 50 per second
+        self.assertGreaterEqual(time.monotonic() - start, 0.035)
+
+    async def test_pause_holds_every_caller(self):
+        bucket = governor.TokenBucket(rate=0, burst=1)
+        bucket.pause(0.05)
+        start = time.monotonic()
+        await asyncio.gather(*(bucket.acquire() for _ in range(3)))
+        self.assertGreaterEqual(time.monotonic() - start, 0.045)
+        self.assertLess(time.monotonic() - start, 0.5)
+
+    async def test_waiting_caller_does_not_block_the_others(self):
+        bucket = governor.TokenBucket(rate=0, burst=1)
+        bucket.pause(10)
+        waiting = asyncio.create_task(bucket.acquire())
+        await asyncio.sleep(0.01)
+        # the pause is over for the callers arriving now, e.g. after the clock went past it
+        bucket.paused_until = 0.0
+        await asyncio.wait_for(bucket.acquire(), timeout=0.5)
+        waiting.cancel()
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def test_opens_at_threshold_and_probes_once(self):
+        breaker = governor.CircuitBreaker(threshold=2, reset_timeout=30)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "closed")
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+        self.assertFalse(breaker.allow())
+        self.assertGreater(breaker.retry_after(), 29)
+
+        with mock.patch.object(time, "monotonic", return_value=time.monotonic() + 31):
+            self.assertEqual(breaker.state, "half_open")
+            self.assertTrue(breaker.allow())
+            self.assertFalse(breaker.allow())
+            breaker.record_failure()
+            self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, "closed")
+
+
+class GovernorTest(unittest.IsolatedAsyncioTestCase):
+
+    def make_request(self, *errors: Exception):
+        """ Returns a request failing with the given errors, then answering "ok". """
+        self.attempts = 0
+
+        async def request() -> str:
+            self.attempts += 1
+            if self.attempts <= len(errors):
+                raise errors[self.attempts - 1]
+            return "ok"
+
+        return request
+
+    async def test_transient_failures_are_retried(self):
+        upstream = governor.Governor("API", rate=0, burst=1, retries=2, backoff=0)
+        self.assertEqual(await upstream.call(self.make_request(http_error(503), httpx.ConnectError("x"))), "ok")
+        self.assertEqual(self.attempts, 3)
+
+    async def test_final_errors_are_not_retried(self):
+        upstream = governor.Governor("API", rate=0, burst=1, retries=2, backoff=0)
+        with self.assertRaises(governor.UpstreamError) as raised:
+            await upstream.call(self.make_request(http_error(404)))
+        self.assertEqual((raised.exception.kind, raised.exception.status, self.attempts), ("http", 404, 1))
+        self.assertEqual(upstream.breaker.failures, 0)
+
+    async def test_non_idempotent_calls_are_only_retried_when_throttled(self):
+        upstream = governor.Governor("API", rate=0, burst=1, retries=2, backoff=0)
+        with self.assertRaises(governor.UpstreamError):
+            await upstream.call(self.make_request(http_error(503)), idempotent=False)
+        self.assertEqual(self.attempts, 1)
+        self.assertEqual(await upstream.call(self.make_request(http_error(429, "0.01")), idempotent=False), "ok")
+        self.assertEqual(self.attempts, 2)
+
+    async def test_throttling_pauses_the_bucket(self):
+        upstream = governor.Governor("API", rate=0, burst=1, retries=0, backoff=0)
+        with self.assertRaises(governor.UpstreamError) as raised:
+            await upstream.call(self.make_request(http_error(429, "30")))
+        self.assertEqual((raised.exception.kind, raised.exception.retry_after), ("rate_limited", 30.0))
+        self.assertGreater(upstream.stats()["pausedFor"], 29)
+        # throttling is not an outage
+        self.assertEqual(upstream.breaker.state, "closed")
+
+    async def test_open_circuit_fails_fast(self):
+        upstream = governor.Governor("API", rate=0, burst=1, retries=0, backoff=0, threshold=1)
+        with self.assertRaises(governor.UpstreamError):
+            await upstream.call(self.make_request(http_error(500)))
+        with self.assertRaises(governor.UpstreamError) as raised:
+            await upstream.call(self.make_request())
+        self.assertEqual(raised.exception.kind, "circuit_open")
+        self.assertEqual(self.attempts, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import asyncio
+import unittest
+import urllib.error
+
+import hydration
+
+
+class HydratorTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_concurrency_is_bounded_and_order_kept(self):
+        in_flight = peak = 0
+
+        async def fetch(id: str) -> str:
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.001 * (int(id) % 3))
+            in_flight -= 1
+            return f"object {id}"
+
+        ids = [str(i) for i in range(40)]
+        objects = await hydration.Hydrator(fetch, max_concurrency=4).hydrate(ids)
+        self.assertEqual(objects, [f"object {id}" for id in ids])
+        self.assertLessEqual(peak, 4)
+
+    async def test_transient_failures_are_retried(self):
+        attempts = {}
+
+        async def fetch(id: str) -> str:
+            attempts[id] = attempts.get(id, 0) + 1
+            if id == "flaky" and attempts[id] < 3:
+                raise urllib.error.HTTPError("url", 503, "unavailable", None, None)
+            if id == "missing":
+                raise urllib.error.HTTPError("url", 404, "not found", None, None)
+            return id
+
+        objects = await hydration.Hydrator(fetch, retries=2, backoff=0).hydrate(["flaky", "missing", "ok"])
+        self.assertEqual(objects, ["flaky", "ok"])
+        self.assertEqual(attempts, {"flaky": 3, "missing": 1, "ok": 1})
+
+    def test_transient_errors_follow_the_governor(self):
+        self.assertTrue(hydration.is_transient(urllib.error.HTTPError("url", 429, "too many requests", None, None)))
+        self.assertTrue(hydration.is_transient(TimeoutError()))
+        self.assertTrue(hydration.is_transient(urllib.error.URLError("connection refused")))
+        self.assertFalse(hydration.is_transient(ValueError("not json")))
+
+    async def test_deadline_returns_partial_results(self):
+        async def fetch(id: str) -> str:
+            await asyncio.sleep(0 if id == "fast" else 10)
+            return id
+
+        objects = await hydration.Hydrator(fetch).hydrate(["slow", "fast"], deadline=0.05)
+        self.assertEqual(objects, ["fast"])
+
+    async def test_progress_is_reported(self):
+        async def fetch(id: str) -> str:
+            return id
+
+        progress = []
+
+        async def on_progress(done: int, total: int) -> None:
+            progress.append((done, total))
+
+        await hydration.Hydrator(fetch).hydrate(["a", "b", "c"], on_progress=on_progress)
+        self.assertEqual(progress, [(1, 3), (2, 3), (3, 3)])
+
+
+if __name__ == "__main__":
+    unittest.main()
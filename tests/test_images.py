@@ -0,0 +1,92 @@
+import asyncio
+import base64
+import hashlib
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import httpx
+
+import images
+
+ASSETS = "https://assets.tcgdex.net/en/base/base1"
+
+
+class ImageStoreTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.store = images.ImageStore(tempfile.mkdtemp(), max_bytes=1024)
+        self.addCleanup(self.store.close)
+        self.requests: list[str] = []
+        # the image of a url is its card number repeated, "missing" urls answer 404
+        self.content = lambda url: url.split("/")[-2].encode() * 100
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            self.requests.append(str(request.url))
+            await asyncio.sleep(0.01)
+            if "missing" in str(request.url):
+                return httpx.Response(404)
+            return httpx.Response(200, content=self.content(str(request.url)), headers={"content-type": "image/png"})
+
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        patcher = mock.patch.object(images, "get_client", lambda: client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def asyncTearDown(self):
+        await images.get_client().aclose()
+
+    async def test_images_are_downloaded_once(self):
+        url = f"{ASSETS}/4/high.png"
+        first, second = await asyncio.gather(self.store.fetch(url), self.store.fetch(url))
+        self.assertEqual(self.requests, [url])
+        self.assertEqual(first, second)
+        self.assertFalse(first["cached"])
+        self.assertEqual(first["digest"], hashlib.sha256(self.content(url)).hexdigest())
+        self.assertEqual(first["mimeType"], "image/png")
+
+        again = await self.store.fetch(url)
+        self.assertTrue(again["cached"])
+        self.assertEqual(images.read_base64(again), base64.b64encode(self.content(url)).decode())
+        self.assertEqual(self.store.stats()["hits"], 1)
+
+    async def test_identical_images_are_stored_once(self):
+        self.content = lambda url: b"same art" * 10
+        first = await self.store.fetch(f"{ASSETS}/4/high.png")
+        second = await self.store.fetch("https://assets.tcgdex.net/fr/base/base1/4/high.png")
+        self.assertEqual(first["path"], second["path"])
+        self.assertEqual(self.store.stats()["images"], 1)
+
+    async def test_least_recently_used_images_are_evicted(self):
+        urls = [f"{ASSETS}/{number}/high.png" for number in ("old", "new", "big")]
+        await self.store.fetch(urls[0])
+        await self.store.fetch(urls[1])
+        # 300 + 300 + 450 bytes, over the 1024 bytes cap once the third one is added
+        self.content = lambda url: url.split("/")[-2].encode() * 150
+        await self.store.fetch(urls[2])
+
+        self.assertIsNone(self.store.lookup(urls[0]))
+        self.assertIsNotNone(self.store.lookup(urls[1]))
+        self.assertIsNotNone(self.store.lookup(urls[2]))
+        self.assertEqual(self.store.stats()["evictions"], 1)
+        self.assertFalse(os.path.exists(self.store.path(hashlib.sha256(b"old" * 100).hexdigest())))
+
+    async def test_failed_downloads_are_none(self):
+        stored = await self.store.fetch_all([f"{ASSETS}/4/high.png", f"{ASSETS}/missing/high.png"])
+        self.assertIsNotNone(stored[0])
+        self.assertIsNone(stored[1])
+        # the partial download is removed
+        self.assertFalse([name for name in os.listdir(self.store.directory) if name.endswith(".part")])
+
+
+class MimeTypeTest(unittest.TestCase):
+
+    def test_content_type_then_extension(self):
+        self.assertEqual(images.mime_type("a.png", "image/webp; charset=binary"), "image/webp")
+        self.assertEqual(images.mime_type("a.JPG", "application/octet-stream"), "image/jpeg")
+        self.assertEqual(images.mime_type("a"), "application/octet-stream")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,299 @@
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import governor
+import justTCG
+
+
+def make_card(tcgplayer_id: str, last_updated: float = None) -> dict:
+    """ Returns a JustTCG card with one Near Mint variant. """
+    return {
+        "id": f"pokemon-card-{tcgplayer_id}",
+        "tcgplayerId": tcgplayer_id,
+        "variants": [{"id": f"pokemon-card-{tcgplayer_id}-near-mint", "condition": "Near Mint", "price": 1.5,
+                      "lastUpdated": time.time() if last_updated is None else last_updated}],
+    }
+
+
+class FakeAPI:
+    """ Stands in for justTCG.api_request, POST /cards answers the known tcgplayerIds. """
+
+    def __init__(self, known: set[str], fail: bool = False):
+        self.known = known
+        self.fail = fail
+        self.posts: list[list[dict]] = []
+
+    async def __call__(self, endpoint, method="GET", params=None, json_data=None) -> dict:
+        if self.fail:
+            raise governor.UpstreamError("JustTCG", "http", "server error", status=500)
+        self.posts.append(json_data)
+        return {"data": [make_card(query["tcgplayerId"]) for query in json_data if query["tcgplayerId"] in self.known]}
+
+
+class JustTCGTestCase(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        # a fresh price cache per test
+        patcher = mock.patch.object(justTCG, "price_cache", justTCG.PriceCache(path=None))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def use_api(self, api: FakeAPI) -> FakeAPI:
+        patcher = mock.patch.object(justTCG, "api_request", api)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return api
+
+
+class PriceCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = justTCG.PriceCache(max_staleness=3600, min_ttl=60, path=None)
+
+    def age(self, seconds: float):
+        """ Moves the clock forward. """
+        return mock.patch.object(time, "time", return_value=time.time() + seconds)
+
+    def test_fresh_for_min_ttl_whatever_lastUpdated(self):
+        query = justTCG.build_card_query(tcgplayerId="1")
+        self.cache.store(query, make_card("1", last_updated=0))
+        self.assertIsNotNone(self.cache.lookup(query))
+        with self.age(120):
+            self.assertIsNone(self.cache.lookup(query))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_fresh_while_lastUpdated_is_within_max_staleness(self):
+        query = justTCG.build_card_query(tcgplayerId="1")
+        self.cache.store(query, make_card("1", last_updated=time.time() - 1800))
+        with self.age(120):
+            self.assertIsNotNone(self.cache.lookup(query))
+        with self.age(1900):
+            self.assertIsNone(self.cache.lookup(query))
+
+    def test_query_is_stale_when_any_variant_is(self):
+        card = make_card("1")
+        card["variants"].append({"id": "pokemon-card-1-lightly-played", "condition": "Lightly Played",
+                                 "price": 1.0, "lastUpdated": None})
+        query = justTCG.build_card_query(tcgplayerId="1")
+        self.cache.store(query, card)
+        with self.age(120):
+            self.assertIsNone(self.cache.lookup(query))
+            self.assertIsNotNone(self.cache.lookup(justTCG.build_card_query(variantId="pokemon-card-1-near-mint")))
+
+    def test_condition_spellings_share_an_entry(self):
+        self.cache.store(justTCG.build_card_query(tcgplayerId="1", condition="NM"), make_card("1"))
+        card = self.cache.lookup(justTCG.build_card_query(tcgplayerId="1", condition="Near Mint"))
+        self.assertEqual(card["variants"][0]["id"], "pokemon-card-1-near-mint")
+        self.assertIsNone(self.cache.lookup(justTCG.build_card_query(tcgplayerId="1", condition="LP")))
+        self.assertIsNone(justTCG.PriceCache.query_key({"condition": "NM"}))
+
+    def test_least_recently_used_variants_are_evicted(self):
+        cache = justTCG.PriceCache(memory_budget=1, path=None)
+        for id in ("1", "2"):
+            cache.store(justTCG.build_card_query(tcgplayerId=id), make_card(id))
+        self.assertIsNone(cache.lookup(justTCG.build_card_query(tcgplayerId="1")))
+        self.assertIsNotNone(cache.lookup(justTCG.build_card_query(tcgplayerId="2")))
+
+    def test_disk_tier_is_shared(self):
+        path = os.path.join(tempfile.mkdtemp(), "prices.sqlite")
+        query = justTCG.build_card_query(tcgplayerId="1")
+        justTCG.PriceCache(path=path).store(query, make_card("1"))
+        self.assertEqual(justTCG.PriceCache(path=path).lookup(query)["tcgplayerId"], "1")
+
+
+class BatchQueryTest(JustTCGTestCase):
+
+    async def test_results_line_up_with_the_queries(self):
+        self.use_api(FakeAPI(known={"1", "3"}))
+        queries = [justTCG.build_card_query(tcgplayerId=id) for id in ("1", "2", "3")]
+        cards = await justTCG.get_cards_by_batch_query(queries)
+        self.assertEqual(len(cards), 3)
+        self.assertEqual(cards[0]["tcgplayerId"], "1")
+        self.assertIsNone(cards[1])
+        self.assertEqual(cards[2]["tcgplayerId"], "3")
+
+    async def test_failed_request_returns_no_cards(self):
+        self.use_api(FakeAPI(known={"1"}, fail=True))
+        self.assertEqual(await justTCG.get_cards_by_batch_query([justTCG.build_card_query(tcgplayerId="1")]), [])
+
+
+
+class BulkQueryTest(JustTCGTestCase):
+
+    async def test_queries_are_split_into_batches(self):
+        api = self.use_api(FakeAPI(known={str(id) for id in range(45)}))
+        queries = [justTCG.build_card_query(tcgplayerId=str(id)) for id in range(45)]
+        results = await justTCG.get_cards_by_bulk_query(queries, batch_size=20, max_concurrency=2)
+        self.assertEqual(sorted(len(post) for post in api.posts), [5, 20, 20])
+        self.assertEqual([result["card"]["tcgplayerId"] for result in results], [str(id) for id in range(45)])
+        self.assertEqual([result["query"] for result in results], queries)
+
+    async def test_misses_and_failed_batches_are_marked(self):
+        self.use_api(FakeAPI(known={"1"}))
+        results = await justTCG.get_cards_by_bulk_query([justTCG.build_card_query(tcgplayerId=id) for id in ("1", "2")])
+        self.assertIn("card", results[0])
+        self.assertEqual(results[1]["error"], "no matching card")
+
+        self.use_api(FakeAPI(known={"3"}, fail=True))
+        results = await justTCG.get_cards_by_bulk_query([justTCG.build_card_query(tcgplayerId="3")])
+        self.assertEqual(results[0]["error"], "batch request failed")
+        self.assertEqual(results[0]["details"]["kind"], "http")
+
+    async def test_cached_cards_are_not_requested_again(self):
+        api = self.use_api(FakeAPI(known={"1", "2"}))
+        await justTCG.get_cards_by_bulk_query([justTCG.build_card_query(tcgplayerId="1")])
+        results = await justTCG.get_cards_by_bulk_query([justTCG.build_card_query(tcgplayerId=id) for id in ("1", "2")])
+        self.assertEqual(api.posts, [[{"tcgplayerId": "1"}], [{"tcgplayerId": "2"}]])
+        self.assertTrue(all("card" in result for result in results))
+
+    async def test_cache_can_be_bypassed(self):
+        api = self.use_api(FakeAPI(known={"1"}))
+        query = justTCG.build_card_query(tcgplayerId="1")
+        justTCG.price_cache.store(query, make_card("1") | {"name": "cached"})
+        results = await justTCG.get_cards_by_bulk_query([query], use_cache=False)
+        self.assertEqual(api.posts, [[query]])
+        self.assertNotIn("name", results[0]["card"])
+        self.assertNotIn("name", justTCG.price_cache.lookup(query))
+
+
+class SingleFlightTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_identical_calls_in_flight_share_one_call(self):
+        single_flight = justTCG.SingleFlight()
+        calls = []
+
+        async def call(value):
+            calls.append(value)
+            await asyncio.sleep(0.01)
+            return value
+
+        results = await asyncio.gather(*(single_flight.run(key, lambda key=key: call(key)) for key in "aab"))
+        self.assertEqual(results, ["a", "a", "b"])
+        self.assertEqual(calls, ["a", "b"])
+        # a finished call is not shared with the next ones
+        await single_flight.run("a", lambda: call("a"))
+        self.assertEqual(single_flight.stats(), {"calls": 4, "shared": 1})
+
+    async def test_errors_reach_every_caller_and_cancellation_does_not_spread(self):
+        single_flight = justTCG.SingleFlight()
+        release = asyncio.Event()
+
+        async def call():
+            await release.wait()
+            raise ValueError("bad")
+
+        first = asyncio.ensure_future(single_flight.run("a", call))
+        second = asyncio.ensure_future(single_flight.run("a", call))
+        await asyncio.sleep(0)
+        first.cancel()
+        release.set()
+        with self.assertRaises(ValueError):
+            await second
+        self.assertTrue(first.cancelled())
+
+
+class LookupBatcherTest(JustTCGTestCase):
+
+    async def test_concurrent_lookups_are_sent_together(self):
+        api = self.use_api(FakeAPI(known={"1", "2"}))
+        batcher = justTCG.LookupBatcher(window=0.01)
+        queries = [justTCG.build_card_query(tcgplayerId=id) for id in ("1", "2", "1", "3")]
+        cards = await asyncio.gather(*(batcher.lookup(query) for query in queries))
+
+        self.assertEqual([card and card["tcgplayerId"] for card in cards], ["1", "2", "1", None])
+        self.assertEqual(api.posts, [[{"tcgplayerId": "1"}, {"tcgplayerId": "2"}, {"tcgplayerId": "3"}]])
+        self.assertEqual(batcher.stats(), {"lookups": 4, "shared": 1, "requests": 1})
+        # the answers are cached
+        self.assertIsNotNone(justTCG.price_cache.lookup(queries[0]))
+
+    async def test_full_batches_are_sent_without_waiting(self):
+        api = self.use_api(FakeAPI(known={"1", "2", "3"}))
+        batcher = justTCG.LookupBatcher(window=10, max_batch=2)
+        lookups = [asyncio.ensure_future(batcher.lookup(justTCG.build_card_query(tcgplayerId=id))) for id in "12"]
+        await asyncio.wait_for(asyncio.gather(*lookups), timeout=1)
+        self.assertEqual(len(api.posts), 1)
+
+    async def test_lone_lookups_do_not_wait_for_the_window(self):
+        api = self.use_api(FakeAPI(known={"1"}))
+        batcher = justTCG.LookupBatcher(window=10)
+        card = await asyncio.wait_for(batcher.lookup(justTCG.build_card_query(tcgplayerId="1")), timeout=1)
+        self.assertEqual(card["tcgplayerId"], "1")
+        self.assertEqual(len(api.posts), 1)
+
+    async def test_lookups_made_under_load_are_merged(self):
+        release = asyncio.Event()
+        posts = []
+
+        async def api_request(endpoint, method="GET", params=None, json_data=None) -> dict:
+            posts.append(json_data)
+            if len(posts) == 1:
+                await release.wait()
+            return {"data": [make_card(query["tcgplayerId"]) for query in json_data]}
+
+        self.use_api(api_request)
+        batcher = justTCG.LookupBatcher(window=0.05)
+        first = asyncio.ensure_future(batcher.lookup(justTCG.build_card_query(tcgplayerId="1")))
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        # the first request is in flight, the next lookups wait for each other
+        later = [asyncio.ensure_future(batcher.lookup(justTCG.build_card_query(tcgplayerId=id))) for id in "23"]
+        await asyncio.sleep(0.01)
+        self.assertEqual(posts, [[{"tcgplayerId": "1"}]])
+        release.set()
+        await asyncio.wait_for(asyncio.gather(first, *later), timeout=1)
+        self.assertEqual(posts[1:], [[{"tcgplayerId": "2"}, {"tcgplayerId": "3"}]])
+
+    async def test_failed_batch_fails_every_lookup(self):
+        self.use_api(FakeAPI(known={"1"}, fail=True))
+        batcher = justTCG.LookupBatcher(window=0)
+        results = await asyncio.gather(*(batcher.lookup(justTCG.build_card_query(tcgplayerId=id)) for id in "12"),
+                                       return_exceptions=True)
+        self.assertTrue(all(isinstance(result, governor.UpstreamError) for result in results))
+
+        # the failure is not remembered
+        self.use_api(FakeAPI(known={"1"}))
+        self.assertEqual((await batcher.lookup(justTCG.build_card_query(tcgplayerId="1")))["tcgplayerId"], "1")
+
+
+class SearchIteratorTest(JustTCGTestCase):
+
+    async def test_every_page_is_read_once(self):
+        offsets = []
+
+        async def api_request(endpoint, method="GET", params=None, json_data=None) -> dict:
+            offsets.append(params["offset"])
+            numbers = range(params["offset"], min(params["offset"] + params["limit"], 45))
+            return {"data": [make_card(str(number)) for number in numbers]}
+
+        with mock.patch.object(justTCG, "api_request", api_request):
+            cards = [card async for card in justTCG.iter_cards_by_query(set="base-set", limit=10, read_ahead=2)]
+        self.assertEqual([card["tcgplayerId"] for card in cards], [str(number) for number in range(45)])
+        # the pages after the last short page may already have been requested ahead
+        self.assertEqual(sorted(offsets)[:5], [0, 10, 20, 30, 40])
+        self.assertEqual(len(offsets), len(set(offsets)))
+
+    async def test_pages_are_requested_ahead(self):
+        requested = []
+        release = asyncio.Event()
+
+        async def api_request(endpoint, method="GET", params=None, json_data=None) -> dict:
+            requested.append(params["offset"])
+            await release.wait()
+            return {"data": [make_card(str(params["offset"] + i)) for i in range(params["limit"])]}
+
+        with mock.patch.object(justTCG, "api_request", api_request):
+            cards = justTCG.iter_cards_by_query(set="base-set", limit=5, read_ahead=2)
+            first = asyncio.ensure_future(anext(cards))
+            await asyncio.sleep(0.01)
+            self.assertEqual(requested, [0, 5, 10])
+            release.set()
+            await first
+            await cards.aclose()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import asyncio
+import unittest
+from unittest import mock
+
+import metrics
+
+
+class HistogramTest(unittest.TestCase):
+
+    def test_quantiles_stay_within_the_recorded_values(self):
+        histogram = metrics.Histogram((1.0, 2.0, 4.0, float("inf")))
+        self.assertIsNone(histogram.quantile(0.5))
+        for value in (0.5, 1.5, 1.5, 3.0):
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [1, 2, 1, 0])
+        # values are spread evenly inside their bucket: rank 2 of 4 is halfway through (1, 2]
+        self.assertEqual(histogram.quantile(0.5), 1.5)
+        self.assertEqual(histogram.quantile(0.25), 1.0)
+        self.assertEqual(histogram.quantile(1), 3.0)
+        self.assertEqual(histogram.summary(1000, 0)["mean"], 1625)
+
+    def test_values_above_the_last_bound(self):
+        histogram = metrics.Histogram((1.0, float("inf")))
+        histogram.observe(50.0)
+        self.assertEqual(histogram.counts, [0, 1])
+        self.assertEqual(histogram.quantile(0.99), 50.0)
+
+
+class MetricsTestCase(unittest.TestCase):
+    """ Records into a fresh registry and traces every call. """
+
+    def setUp(self):
+        self.registry = metrics.Registry()
+        for name, value in (("registry", self.registry), ("TRACE_SAMPLE_RATE", 1.0)):
+            patcher = mock.patch.object(metrics, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class RegistryTest(MetricsTestCase):
+
+    def test_snapshot_groups_tool_and_upstream_metrics(self):
+        self.registry.inc("tool_calls", ("search",), 2)
+        self.registry.inc("tool_errors", ("search", "ValueError"))
+        self.registry.observe("tool_latency_seconds", ("search",), 0.02)
+        with self.assertRaises(KeyError):
+            with metrics.upstream_call("TCGdex", "cards"):
+                raise KeyError("id")
+        self.registry.register_collector("cache", lambda: {"hits": 3})
+        self.registry.register_collector("broken", lambda: 1 / 0)
+
+        snapshot = self.registry.snapshot()
+        self.assertEqual(snapshot["tools"]["search"]["calls"], 2)
+        self.assertEqual(snapshot["tools"]["search"]["errors"], {"ValueError": 1})
+        self.assertEqual(snapshot["tools"]["search"]["latencyMs"]["count"], 1)
+        self.assertEqual(snapshot["upstream"]["TCGdex cards"]["outcomes"], {"KeyError": 1})
+        self.assertEqual(snapshot["upstream"]["TCGdex cards"]["inFlight"], 0)
+        self.assertEqual(snapshot["components"]["cache"], {"hits": 3})
+        self.assertIn("error", snapshot["components"]["broken"])
+
+    def test_prometheus_text(self):
+        self.registry.inc("tool_calls", ('say "hi"',))
+        self.registry.observe("tool_latency_seconds", ("search",), 0.02)
+        self.registry.register_collector("cache", lambda: {"entries": {"cards": 5}, "enabled": True})
+
+        lines = self.registry.prometheus().splitlines()
+        self.assertIn('pokemon_tcg_mcp_tool_calls_total{tool="say \\"hi\\""} 1', lines)
+        self.assertIn('pokemon_tcg_mcp_tool_latency_seconds_bucket{tool="search",le="0.025"} 1', lines)
+        self.assertIn('pokemon_tcg_mcp_tool_latency_seconds_bucket{tool="search",le="+Inf"} 1', lines)
+        self.assertIn('pokemon_tcg_mcp_tool_latency_seconds_count{tool="search"} 1', lines)
+        self.assertIn('pokemon_tcg_mcp_component{component="cache",metric="entries.cards"} 5', lines)
+        # booleans are not samples
+        self.assertFalse([line for line in lines if "enabled" in line])
+
+
+class InstrumentTest(MetricsTestCase):
+
+    def test_traced_calls_record_their_phases(self):
+        @metrics.traced("convert")
+        def convert(value):
+            return {"value": value}
+
+        async def tool(value):
+            with metrics.span("fetch"):
+                pass
+            return [convert(value), convert(value)]
+
+        self.assertEqual(asyncio.run(metrics.instrument(tool, "tool")(1)), [{"value": 1}, {"value": 1}])
+        trace = self.registry.traces[-1]
+        self.assertEqual(trace["tool"], "tool")
+        self.assertEqual(trace["phases"]["convert"]["calls"], 2)
+        self.assertEqual(set(trace["phases"]), {"fetch", "convert", "serialize"})
+        self.assertEqual(trace["payloadBytes"], len('[{"value": 1}, {"value": 1}]'))
+        self.assertEqual(self.registry.snapshot()["tools"]["tool"]["calls"], 1)
+
+    def test_errors_are_counted_and_untraced_calls_skip_spans(self):
+        async def tool():
+            raise ValueError("bad")
+
+        with mock.patch.object(metrics, "TRACE_SAMPLE_RATE", 0):
+            with self.assertRaises(ValueError):
+                asyncio.run(metrics.instrument(tool)())
+        self.assertEqual(self.registry.counters[("tool_errors", ("tool", "ValueError"))], 1)
+        self.assertEqual(len(self.registry.traces), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
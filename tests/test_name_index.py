@@ -0,0 +1,53 @@
+import unittest
+
+import name_index
+
+CARDS = [
+    ("base1-4", "Charizard"), ("base2-4", "Charizard"), ("base1-58", "Pikachu"),
+    ("base1-31", "Mr. Mime"), ("xy12-68", "Flabébé"), ("sv03-125", "Charizard ex"),
+]
+
+
+class NormalizeTest(unittest.TestCase):
+
+    def test_accents_case_and_punctuation(self):
+        self.assertEqual(name_index.normalize("Mr. Mime"), "mr mime")
+        self.assertEqual(name_index.normalize("Flabébé"), "flabebe")
+        self.assertEqual(name_index.normalize("Farfetch'd_GX"), "farfetch d gx")
+        self.assertEqual(name_index.trigrams("ab"), {"$ab", "ab$"})
+
+
+class NameIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = name_index.NameIndex()
+        self.index.update(CARDS)
+
+    def test_names_are_indexed_once_with_their_cards(self):
+        self.assertEqual(self.index.stats()["names"], 5)
+        self.assertEqual(len(self.index), 6)
+        best = self.index.search("charizard")[0]
+        self.assertEqual((best["name"], best["score"], best["cardIds"]), ("Charizard", 1.0, ["base1-4", "base2-4"]))
+
+    def test_typos_accents_and_prefixes(self):
+        self.assertEqual(self.index.search("Charizrd")[0]["name"], "Charizard")
+        self.assertEqual(self.index.search("mr mime")[0]["name"], "Mr. Mime")
+        self.assertEqual(self.index.search("flabebe")[0]["name"], "Flabébé")
+        # names starting with the text rank above the others, the shortest first
+        self.assertEqual([match["name"] for match in self.index.search("chari", limit=2)], ["Charizard", "Charizard ex"])
+        self.assertEqual(self.index.search("zzzz"), [])
+        self.assertEqual(self.index.search("!!"), [])
+
+    def test_update_only_processes_the_changes(self):
+        changes = self.index.update(CARDS[1:] + [("sv04-1", "Pikachu")])
+        self.assertEqual(changes, {"added": 1, "removed": 1})
+        self.assertEqual(self.index.search("pikachu")[0]["cardIds"], ["base1-58", "sv04-1"])
+        self.assertEqual(self.index.search("charizard")[0]["cardIds"], ["base2-4"])
+
+        # a name without cards left is not returned
+        self.index.update([card for card in CARDS if card[1] != "Pikachu"])
+        self.assertNotIn("Pikachu", [match["name"] for match in self.index.search("pikachu")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+
+import query_plan
+from query_plan import Filter, QueryPlan, QuerySyntaxError
+
+
+class ParseTest(unittest.TestCase):
+
+    def test_method_chain_is_normalized(self):
+        plan = query_plan.parse('Query().equal("types", "Fire").contains(key="name", value="char")'
+                                '.greaterThan("hp", -10).sort("hp", "DESC").paginate(2, 25)')
+        self.assertEqual(plan.filters, (Filter("hp", "gt", -10), Filter("name", "contains", "char"),
+                                        Filter("types", "eq", "Fire")))
+        self.assertEqual(plan.sort, ("hp", "desc"))
+        self.assertEqual(plan.pagination, (2, 25))
+
+    def test_equivalent_queries_share_a_plan(self):
+        first = query_plan.compile('Query().equal("types", "Fire").notNull("ability")')
+        second = query_plan.compile('query = Query().notNull("ability").equal("types", "Fire")')
+        self.assertIs(first, second)
+        self.assertEqual(QueryPlan.from_dict(first.to_dict()), first)
+
+    def test_only_query_method_chains_are_accepted(self):
+        rejected = [
+            '__import__("os").system("echo unsafe")',
+            'Query().equal("name", open("/etc/passwd").read())',
+            'Query().equal("name", __import__("os").getcwd())',
+            'Query().equal("name", "a").__class__',
+            'Query().__class__.__bases__[0].__subclasses__()',
+            'Query().equal(*["name", "a"])',
+            'Query().equal(**{"key": "name", "value": "a"})',
+            'Query().equal("name", f"{1}")',
+            'Query().equal("name", ["a"])',
+            'Query().equal("name", True)',
+            'Query(1)',
+            'Query().equal("name", "a"); import os',
+            'Query().equal("name", lambda: 1)',
+            'Other().equal("name", "a")',
+            'Query().delete("name")',
+            'Query().equal("name")',
+            'Query().equal("name", "a", "b")',
+            'Query().equal("name", other="a")',
+            'Query().paginate("first", 10)',
+            'Query().equal("name",',
+        ]
+        for text in rejected:
+            with self.subTest(text=text), self.assertRaises(QuerySyntaxError):
+                query_plan.parse(text)
+
+    def test_plan_converts_back_to_an_sdk_query(self):
+        query = query_plan.parse('Query().equal("types", "Fire").isNull("ability").paginate(1, 10)').to_query()
+        self.assertIn({"key": "types", "value": "eq:Fire"}, query.params)
+        self.assertIn({"key": "ability", "value": "null:"}, query.params)
+
+
+class PredicateTest(unittest.TestCase):
+
+    def matches(self, text: str, card: dict) -> bool:
+        return query_plan.parse(text).predicate()(card)
+
+    def test_filters_are_evaluated_on_card_dictionaries(self):
+        card = {"name": "Charizard", "types": "Fire, Dragon", "hp": 120, "set": {"id": "base1"}}
+        self.assertTrue(self.matches('Query().equal("types", "dragon").equal("set.id", "base1")', card))
+        self.assertTrue(self.matches('Query().contains("name", "IZA").gte("hp", "100")', card))
+        self.assertFalse(self.matches('Query().notContains("name", "char")', card))
+        self.assertFalse(self.matches('Query().notEqual("types", "Fire")', card))
+        self.assertTrue(self.matches('Query().isNull("ability").notNull("hp")', card))
+        self.assertFalse(self.matches('Query().lt("hp", 120)', card))
+
+
+if __name__ == "__main__":
+    unittest.main()
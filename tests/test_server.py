@@ -0,0 +1,204 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from dacite import from_dict
+from tcgdexsdk import Set
+
+import governor
+import server
+import watchlist
+
+from tests.sdk import FakeSDK, set_data
+
+QUERY = 'Query().equal("types", "Fire")'
+
+
+class SetAndSerieFetchTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.sdk = FakeSDK([], [set_data(f"sv{number:02}", [1, 2]) for number in range(1, 9)])
+        self.in_flight = self.most_in_flight = 0
+        lock = threading.Lock()
+
+        def get_set(id):
+            # a blocking call, as the SDK makes
+            with lock:
+                self.in_flight += 1
+                self.most_in_flight = max(self.most_in_flight, self.in_flight)
+            time.sleep(0.05)
+            with lock:
+                self.in_flight -= 1
+            return from_dict(Set, self.sdk.sets[id])
+
+        self.sdk.set.getSync = get_set
+        patcher = mock.patch.object(server, "get_sdk", lambda lang: self.sdk)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # the hydrators are bound to the fetchers of their language on first use
+        server.get_hydrator.cache_clear()
+        self.addCleanup(server.get_hydrator.cache_clear)
+
+    async def test_sets_are_fetched_concurrently_in_order(self):
+        set_ids = [f"sv{number:02}" for number in range(8, 0, -1)]
+        sets = await server.get_set_by_id(set_ids)
+        self.assertEqual([set["id"] for set in sets], set_ids)
+        self.assertGreater(self.most_in_flight, 1)
+        self.assertNotIn("cards", sets[0])
+
+    async def test_full_sets_keep_their_cards(self):
+        sets = await server.get_set_by_id(["sv01"], full=True)
+        self.assertEqual([card["id"] for card in sets[0]["cards"]], ["sv01-1", "sv01-2"])
+        self.assertEqual(sets[0]["releaseDate"], "2023-03-31")
+
+    async def test_unknown_ids_are_left_out(self):
+        self.assertEqual([set["id"] for set in await server.get_set_by_id(["sv01", "unknown"])], ["sv01"])
+        series = await server.get_serie_by_id(["sv"])
+        self.assertEqual([set["id"] for set in series[0]["sets"]], [f"sv{number:02}" for number in range(1, 9)])
+
+
+class CardQueryPaginationTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.failures = 0
+
+        async def list_card_ids(plan, lang):
+            page = plan.pagination[0]
+            return [f"base1-{number}" for number in range((page - 1) * 4 + 1, page * 4 + 1)] if page <= 2 else []
+
+        async def hydrate_cards(card_ids, lang, fields=None, deadline=None, on_progress=None):
+            if self.failures:
+                self.failures -= 1
+                raise governor.UpstreamError("TCGdex", "timeout", "no answer")
+            return [{"id": card_id} for card_id in card_ids]
+
+        for name, fake in (("list_card_ids", list_card_ids), ("hydrate_cards", hydrate_cards)):
+            patcher = mock.patch.object(server, name, fake)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def get_page(self, cursor: str = None) -> dict:
+        return await server.get_card_by_query(QUERY, server.Context(), page_size=4, cursor=cursor)
+
+    async def test_pages_follow_each_other(self):
+        first = await self.get_page()
+        second = await self.get_page(first["cursor"])
+        self.assertEqual([card["id"] for card in first["cards"] + second["cards"]],
+                         [f"base1-{number}" for number in range(1, 9)])
+
+    async def test_failed_prefetch_is_fetched_again(self):
+        first = await self.get_page()
+        # the background prefetch of the second page fails
+        self.failures = 1
+        second = await self.get_page(first["cursor"])
+        self.assertEqual([card["id"] for card in second["cards"]], [f"base1-{number}" for number in range(5, 9)])
+
+    async def test_cursor_survives_a_failed_page(self):
+        first = await self.get_page()
+        # the prefetch and the new attempt fail
+        self.failures = 2
+        with self.assertRaises(governor.UpstreamError):
+            await self.get_page(first["cursor"])
+        second = await self.get_page(first["cursor"])
+        self.assertEqual([card["id"] for card in second["cards"]], [f"base1-{number}" for number in range(5, 9)])
+
+
+class TCGdexTimeoutTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_hung_calls_time_out(self):
+        upstream = governor.Governor("TCGdex", rate=0, burst=1, retries=1, backoff=0)
+        for name, value in (("get_tcgdex_upstream", lambda: upstream), ("TCGDEX_TIMEOUT", 0.05)):
+            patcher = mock.patch.object(server, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        released = threading.Event()
+        self.addCleanup(released.set)
+        attempts = []
+
+        def hang(card_id):
+            # a blocking SDK call on an upstream that never answers
+            attempts.append(card_id)
+            released.wait(5)
+
+        with self.assertRaises(governor.UpstreamError) as raised:
+            await server.call_tcgdex("cards/:id", hang, "base1-4")
+        self.assertEqual(raised.exception.kind, "timeout")
+        self.assertEqual(attempts, ["base1-4", "base1-4"])
+        self.assertEqual(upstream.breaker.failures, 2)
+
+
+class LanguageTest(unittest.TestCase):
+
+    def test_requested_languages(self):
+        self.assertEqual(server.resolve_language(None), server.language)
+        self.assertEqual(server.resolve_language(""), server.language)
+        self.assertEqual(server.resolve_language("FR"), "fr")
+        with self.assertRaisesRegex(ValueError, "Unsupported language 'xx'"):
+            server.resolve_language("xx")
+
+    def test_one_pooled_client_per_language(self):
+        self.addCleanup(server.get_sdk.cache_clear)
+        self.assertIs(server.get_sdk("fr"), server.get_sdk("fr"))
+        self.assertIsNot(server.get_sdk("fr"), server.get_sdk("de"))
+        self.assertEqual(server.get_sdk("de").language, "de")
+
+
+class NameIndexSourceTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        # a language of its own, the reference cache and the name index are per language
+        self.lang = "name-index-test"
+        self.names = [("base1-4", "Charizard"), ("base1-58", "Pikachu")]
+        sdk = SimpleNamespace(card=SimpleNamespace(listSync=lambda: [SimpleNamespace(id=id, name=name) for id, name in self.names]))
+        patcher = mock.patch.object(server, "get_sdk", lambda lang: sdk)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for registry in (server.reference_caches, server.name_indexes, server.name_index_sources):
+            self.addCleanup(registry.pop, self.lang, None)
+
+    async def test_index_is_updated_when_the_card_list_is_reloaded(self):
+        index = await server.get_name_index(self.lang)
+        self.assertEqual(len(index), 2)
+
+        with mock.patch.object(index, "update", side_effect=AssertionError("updated again")):
+            await server.get_name_index(self.lang)
+
+        self.names.append(("sv04-1", "Pikachu"))
+        server.get_reference_cache(self.lang).invalidate(["cardNames"])
+        await server.get_name_index(self.lang)
+        self.assertEqual(index.search("pikachu")[0]["cardIds"], ["base1-58", "sv04-1"])
+
+
+class WatchlistRefresherTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.start_refresher = mock.Mock()
+        for patcher in (mock.patch.dict(os.environ, {"JUSTTCG_WATCHLIST_DIR": self.directory}),
+                        mock.patch.object(server, "loaded", lambda name: None),
+                        mock.patch.object(watchlist, "start_refresher", self.start_refresher)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        async def get_games_JustTCG() -> list[dict]:
+            return [{"id": "pokemon"}]
+
+        self.tool = server.with_watchlist_refresher(get_games_JustTCG)
+
+    async def test_refresher_starts_with_the_first_call(self):
+        self.assertEqual(await self.tool(), [{"id": "pokemon"}])
+        self.start_refresher.assert_not_called()
+
+        # once a watchlist exists
+        open(os.path.join(self.directory, "watchlist.sqlite"), "wb").close()
+        self.assertTrue(server.watchlist_exists())
+        await self.tool()
+        self.start_refresher.assert_called_once_with()
+
+
+if __name__ == "__main__":
+    unittest.main()
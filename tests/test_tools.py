@@ -0,0 +1,53 @@
+import json
+import unittest
+
+from dacite import from_dict
+from tcgdexsdk import Card, Set
+
+import tools
+
+from tests.sdk import card_data, set_data
+
+
+class CardToDictTest(unittest.TestCase):
+
+    def setUp(self):
+        self.card = from_dict(Card, card_data("sv01", 25))
+
+    def test_every_field_is_json_serializable(self):
+        card = tools.Card_to_dict(self.card)
+        self.assertEqual(json.loads(json.dumps(card)), card)
+        self.assertEqual(card["types"], "Lightning")
+        self.assertEqual(card["variants"], ["normal", "reverse"])
+        self.assertEqual(card["legal"], "standard, expanded")
+        self.assertEqual(card["image"], "https://assets.tcgdex.net/en/sv/sv01/25" + tools.image_suffix)
+        self.assertEqual(card["attacks"], [{"cost": ["Lightning"], "name": "Thunder Shock", "damage": 20, "effect": None}])
+
+    def test_empty_fields_are_left_out(self):
+        card = tools.Card_to_dict(from_dict(Card, card_data("sv01", 25, description="", item=None, boosters=[])))
+        self.assertNotIn("description", card)
+        self.assertNotIn("item", card)
+        self.assertNotIn("boosters", card)
+
+    def test_fields_are_projected(self):
+        self.assertEqual(tools.Card_to_dict(self.card, ["name", "id", "unknown"]), {"name": "Pikachu 25", "id": "sv01-25"})
+        card = tools.Card_to_dict(self.card)
+        self.assertEqual(tools.project(card, ["hp", "name"]), {"hp": 60, "name": "Pikachu 25"})
+        self.assertIs(tools.project(card), card)
+        self.assertEqual(tools.Card_to_dict(self.card, list(tools.NEUTRAL_CARD_FIELDS)),
+                         tools.project(card, list(tools.NEUTRAL_CARD_FIELDS)))
+
+
+class SetToDictTest(unittest.TestCase):
+
+    def test_set_and_its_cards(self):
+        set = tools.Set_to_dict(from_dict(Set, set_data("sv01", [1, 2], legal={"standard": False, "expanded": True})))
+        self.assertEqual(set["tcgOnline"], "SV01")
+        self.assertEqual(set["legalities"], "expanded")
+        self.assertEqual(set["cardCount"], {"total": 2, "official": 2})
+        self.assertEqual([card["localId"] for card in set["cards"]], ["1", "2"])
+        self.assertIsNone(set["logo"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+import math
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import justTCG
+import watchlist
+
+from tests.test_justTCG import FakeAPI, make_card
+
+HOUR = 3600
+
+
+def result(tcgplayer_id: str, *prices: tuple[float, float]) -> dict:
+    """ Returns the bulk query result of a card with a Near Mint and a Lightly Played variant at (price, lastUpdated). """
+    conditions = ("Near Mint", "Lightly Played")
+    return {"card": {"id": f"pokemon-card-{tcgplayer_id}", "name": f"Card {tcgplayer_id}", "variants": [
+        {"id": f"pokemon-card-{tcgplayer_id}-{condition.lower().replace(' ', '-')}", "condition": condition,
+         "printing": "Normal", "price": price, "lastUpdated": updated}
+        for condition, (price, updated) in zip(conditions, prices)]}}
+
+
+class WatchlistTest(unittest.TestCase):
+
+    def setUp(self):
+        self.watchlist = watchlist.Watchlist(tempfile.mkdtemp())
+        self.addCleanup(self.watchlist.close)
+        self.now = int(time.time())
+
+    def test_observations_are_fixed_width_records(self):
+        entries = self.watchlist.add([{"tcgplayerId": "1", "condition": "NM"}, {"tcgplayerId": "2"}])
+        self.assertEqual([entry["condition"] for entry in entries], ["Near Mint", ""])
+        appended = self.watchlist.record(entries, [result("1", (2.0, self.now), (1.0, self.now)),
+                                                   result("2", (None, self.now))])
+        # the Lightly Played variant of the first card is not watched
+        self.assertEqual(appended, 2)
+        self.assertEqual(watchlist.RECORD.size, 16)
+        with open(self.watchlist.series_path, "rb") as file:
+            records = list(watchlist.RECORD.iter_unpack(file.read()))
+        self.assertEqual(records[0], (1, self.now, 2.0))
+        self.assertEqual(records[1][:2], (2, self.now))
+        self.assertTrue(math.isnan(records[1][2]))
+
+        records = self.watchlist.read()
+        self.assertEqual(records.dtype.names, ("series", "time", "price"))
+        self.assertEqual(records["price"][0], 2.0)
+
+    def test_unchanged_prices_are_not_appended_again(self):
+        entries = self.watchlist.add([{"variantId": "pokemon-card-1-near-mint"}])
+        self.assertEqual(self.watchlist.record(entries, [result("1", (2.0, self.now))]), 1)
+        self.assertEqual(self.watchlist.record(entries, [result("1", (2.0, self.now))]), 0)
+        # the last times are read back from the file by another process
+        reopened = watchlist.Watchlist(os.path.dirname(self.watchlist.series_path))
+        self.addCleanup(reopened.close)
+        self.assertEqual(reopened.record(entries, [result("1", (2.0, self.now))]), 0)
+        self.assertEqual(reopened.record(entries, [result("1", (2.5, self.now + HOUR))]), 1)
+        self.assertEqual(os.path.getsize(self.watchlist.series_path), 2 * watchlist.RECORD.size)
+
+    def test_failed_entries_are_retried_sooner(self):
+        entries = self.watchlist.add([{"tcgplayerId": "1"}])
+        self.watchlist.record(entries, [result("1", (2.0, self.now))])
+        refreshed_at = self.watchlist.entries()[0]["refreshedAt"]
+
+        self.watchlist.record(entries, [{"error": "batch request failed"}], retry_delay=HOUR)
+        entry = self.watchlist.entries()[0]
+        # the error is recorded, the entry keeps the time of its last successful refresh
+        self.assertEqual((entry["error"], entry["refreshedAt"]), ("batch request failed", refreshed_at))
+        self.assertEqual(self.watchlist.due(10, interval=-1), [])
+        with mock.patch.object(time, "time", return_value=time.time() + HOUR + 1):
+            self.assertEqual(len(self.watchlist.due(10, interval=HOUR)), 1)
+
+        self.watchlist.record(entries, [result("1", (2.5, self.now + 1))])
+        self.assertIsNone(self.watchlist.entries()[0]["error"])
+        self.assertEqual(len(self.watchlist.due(10, interval=-1)), 1)
+
+    def test_changes_crossings_and_history(self):
+        entries = self.watchlist.add([{"tcgplayerId": "1", "above": 2.5, "below": 1.5}])
+        for hours_ago, nm, lp in ((48, 2.0, 1.6), (24, 2.2, 1.4), (1, 3.0, 1.4)):
+            updated = self.now - hours_ago * HOUR
+            self.watchlist.record(entries, [result("1", (nm, updated), (lp, updated + 1))])
+
+        moves = watchlist.changes(self.watchlist, since=self.now - 30 * HOUR)
+        self.assertEqual([(move["condition"], move["priceThen"], move["priceNow"]) for move in moves],
+                         [("Near Mint", 2.0, 3.0), ("Lightly Played", 1.6, 1.4)])
+        self.assertEqual(moves[0]["changePercent"], 50.0)
+        self.assertEqual(len(watchlist.changes(self.watchlist, since=self.now - 30 * HOUR, min_change_percent=20)), 1)
+
+        events = watchlist.crossings(self.watchlist, since=self.now - 30 * HOUR)
+        self.assertEqual([(event["condition"], event["crossed"], event["price"]) for event in events],
+                         [("Near Mint", "above", 3.0), ("Lightly Played", "below", 1.4)])
+        self.assertEqual(watchlist.crossings(self.watchlist, since=self.now), [])
+
+        history = watchlist.history(self.watchlist, ["pokemon-card-1-near-mint", "unknown"], since=self.now - 30 * HOUR)
+        self.assertEqual(history, {"pokemon-card-1-near-mint": [[self.now - 24 * HOUR, 2.2], [self.now - HOUR, 3.0]]})
+
+
+class RefreshTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.watchlist = watchlist.Watchlist(tempfile.mkdtemp())
+        self.addCleanup(self.watchlist.close)
+        self.api = FakeAPI(known={"1"})
+        for name, value in (("price_cache", justTCG.PriceCache(path=None)), ("api_request", self.api)):
+            patcher = mock.patch.object(justTCG, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def test_refresh_bypasses_the_price_cache(self):
+        query = justTCG.build_card_query(tcgplayerId="1")
+        # a variant still fresh in the price cache, whose price has changed upstream since
+        cached = make_card("1")
+        cached["variants"][0] |= {"price": 1.0, "lastUpdated": time.time() - HOUR}
+        justTCG.price_cache.store(query, cached)
+
+        self.watchlist.add([{"tcgplayerId": "1"}])
+        self.assertEqual(await watchlist.refresh(self.watchlist), {"entries": 1, "observations": 1})
+        self.assertEqual(self.api.posts, [[query]])
+        self.assertEqual(self.watchlist.read()["price"].tolist(), [1.5])
+        # the fresh price is written back for the other tools
+        self.assertEqual(justTCG.price_cache.lookup(query)["variants"][0]["price"], 1.5)
+
+        # nothing is due until the next interval
+        self.assertEqual(await watchlist.refresh(self.watchlist), {"entries": 0, "observations": 0})
+
+
+if __name__ == "__main__":
+    unittest.main()